@@ -5,6 +5,9 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 import jwt
 import os
+import hashlib
+
+from cache import LRUCache
 
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,6 +15,10 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', 10080))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+# Payloads of already-verified tokens, keyed by token hash, kept until the token's exp
+verified_tokens = LRUCache(maxsize=TOKEN_CACHE_SIZE)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -30,8 +37,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def decode_token(token: str) -> dict:
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    cached = verified_tokens.get(token_hash)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        if payload.get("exp"):
+            verified_tokens.set(token_hash, payload, expires_at=float(payload["exp"]))
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -0,0 +1,127 @@
+"""Cache invalidation across worker processes.
+
+Each worker keeps its own in-process caches (cache.LRUCache). Caches that
+hold data other workers can change are registered by name in a CacheRegistry;
+invalidating through the CacheInvalidationBus drops the entry locally and
+broadcasts the invalidation to every other worker through a capped Mongo
+collection, which each worker follows with a tailable cursor. Tailable cursors
+work on standalone servers too, unlike change streams.
+
+If a worker loses its cursor it can't tell what it missed, so it clears every
+registered cache before following the collection again.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime
+from typing import Hashable
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_BUS_ENABLED = os.environ.get('CACHE_BUS_ENABLED', 'true').lower() == 'true'
+CACHE_BUS_COLLECTION = 'cache_invalidations'
+CACHE_BUS_SIZE_BYTES = 1024 * 1024
+CACHE_BUS_RETRY_SECONDS = 1.0
+
+# Identifies this process in broadcast messages so it can skip its own
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CacheRegistry:
+    def __init__(self):
+        self._caches = {}
+
+    def register(self, name: str, cache: LRUCache) -> LRUCache:
+        self._caches[name] = cache
+        return cache
+
+    def invalidate(self, name: str, key: Hashable):
+        cache = self._caches.get(name)
+        if cache is not None:
+            cache.invalidate(key)
+
+    def clear_all(self):
+        for cache in self._caches.values():
+            cache.clear()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._caches
+
+
+class CacheInvalidationBus:
+    def __init__(self, db, registry: CacheRegistry, worker_id: str = WORKER_ID, enabled: bool = CACHE_BUS_ENABLED):
+        self.db = db
+        self.registry = registry
+        self.worker_id = worker_id
+        self.enabled = enabled
+
+    @property
+    def collection(self):
+        return self.db[CACHE_BUS_COLLECTION]
+
+    async def invalidate(self, name: str, key: Hashable):
+        """Drop key from cache `name` in this worker and every other one"""
+        self.registry.invalidate(name, key)
+        if not self.enabled:
+            return
+        try:
+            await self.collection.insert_one({
+                "cache": name, "key": key, "origin": self.worker_id, "at": datetime.utcnow()
+            })
+        except Exception as e:
+            # Other workers catch up when their entry expires or they resubscribe
+            logger.error(f"Could not broadcast invalidation of {name}:{key}: {e}")
+
+    def handle(self, message: dict):
+        if message.get("origin") == self.worker_id:
+            return
+        self.registry.invalidate(message.get("cache"), message.get("key"))
+
+    async def ensure_collection(self):
+        try:
+            await self.db.create_collection(CACHE_BUS_COLLECTION, capped=True, size=CACHE_BUS_SIZE_BYTES)
+        except CollectionInvalid:
+            pass  # already exists
+
+    async def run(self):
+        """Follow the broadcast collection until cancelled"""
+        await self.ensure_collection()
+        while True:
+            try:
+                await self.follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation feed interrupted: {e}")
+            # Whatever was broadcast while we weren't listening is unknown
+            self.registry.clear_all()
+            await asyncio.sleep(CACHE_BUS_RETRY_SECONDS)
+
+    async def follow(self):
+        """Tail the collection in natural (insertion) order, handling everything after
+        the newest message that existed when we subscribed.
+
+        _ids can't be used as the position: ObjectIds from other processes and
+        hosts don't sort in insertion order."""
+        newest = await self.collection.find_one({}, sort=[("$natural", -1)])
+        # A capped collection can't be tailed while empty
+        if newest is None:
+            await self.collection.insert_one({"origin": self.worker_id, "at": datetime.utcnow()})
+            newest = await self.collection.find_one({}, sort=[("$natural", -1)])
+        caught_up = False
+        cursor = self.collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for message in cursor:
+                if caught_up:
+                    self.handle(message)
+                elif message["_id"] == newest["_id"]:
+                    caught_up = True
+            await asyncio.sleep(0)
+        if not caught_up:
+            raise RuntimeError("subscription point was overwritten before it was read")
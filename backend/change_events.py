@@ -0,0 +1,67 @@
+"""Turn change-stream events into the derived-data updates they require.
+
+The derived-data consumer in server.py reads a batch of events and asks
+plan_derived_updates() what to recompute. Work is coalesced per batch: a
+bulk import touching 500 contacts of one user refreshes that user's group
+counts once, and the summary of a contact renamed twice is propagated once.
+
+Deletes carry no document, so contact deletions are picked up from the
+sync_tombstones rows written alongside them (which include user_id).
+"""
+from typing import Iterable, Set
+
+# Collections the consumer follows
+WATCHED_COLLECTIONS = ("contacts", "interactions", "groups", "sync_tombstones")
+WATCHED_OPERATIONS = ("insert", "update", "replace")
+
+# Contact fields copied into calendar events' participant_summaries
+SUMMARY_FIELDS = {"name", "profile_picture"}
+
+
+def changed_fields(event: dict) -> Set[str]:
+    """Top-level fields an update event touched (empty for other operations)"""
+    description = event.get("updateDescription") or {}
+    fields = set(description.get("updatedFields") or {}) | set(description.get("removedFields") or [])
+    return {field.split(".", 1)[0] for field in fields}
+
+
+class DerivedPlan:
+    def __init__(self):
+        self.group_count_users: Set[str] = set()
+        self.last_contact = {}  # (user_id, contact_id) -> newest interaction date in the batch
+        self.summary_contacts = {}  # contact id -> latest contact document
+
+    def __bool__(self) -> bool:
+        return bool(self.group_count_users or self.last_contact or self.summary_contacts)
+
+
+def plan_derived_updates(events: Iterable[dict]) -> DerivedPlan:
+    plan = DerivedPlan()
+    for event in events:
+        collection = (event.get("ns") or {}).get("coll")
+        operation = event.get("operationType")
+        doc = event.get("fullDocument") or {}
+        user_id = doc.get("user_id")
+        if not user_id:
+            continue  # updateLookup finds nothing once the document is deleted again
+
+        if collection == "contacts":
+            if operation == "update":
+                fields = changed_fields(event)
+                if "groups" in fields:
+                    plan.group_count_users.add(user_id)
+                if fields & SUMMARY_FIELDS:
+                    plan.summary_contacts[str(doc["_id"])] = doc
+            elif operation == "replace" or doc.get("groups"):
+                plan.group_count_users.add(user_id)
+        elif collection == "groups" and operation == "insert":
+            plan.group_count_users.add(user_id)
+        elif collection == "interactions" and operation == "insert":
+            # Meeting interactions come from calendar events and may lie in the future
+            if doc.get("calendar_event_id") or not doc.get("contact_id") or not doc.get("date"):
+                continue
+            key = (user_id, doc["contact_id"])
+            plan.last_contact[key] = max(plan.last_contact.get(key, ""), doc["date"])
+        elif collection == "sync_tombstones" and doc.get("collection") == "contacts":
+            plan.group_count_users.add(user_id)
+    return plan
@@ -0,0 +1,108 @@
+"""Filter/sort query language for the contact list.
+
+Every filter maps onto an index with a (user_id, ...) prefix, see
+ensure_indexes() in server.py. Birthdays are matched on the derived
+`birthday_md` field (month * 100 + day) because stored birthdays come in
+several formats and usually carry a birth year.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+# API sort key -> document field
+CONTACT_SORT_FIELDS = {
+    "next_due": "next_due",
+    "name": "name",
+    "last_contact_date": "last_contact_date",
+}
+
+_ISO_BIRTHDAY = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})")
+_MONTH_DAY_DASH = re.compile(r"^(\d{1,2})-(\d{1,2})$")
+_US_BIRTHDAY = re.compile(r"^(\d{1,2})/(\d{1,2})(?:/\d{2,4})?$")
+
+
+def parse_birthday_md(birthday: Optional[str]) -> Optional[int]:
+    """month * 100 + day for YYYY-MM-DD(...), MM-DD or MM/DD[/YYYY] birthdays; None if unparseable"""
+    if not birthday:
+        return None
+    birthday = birthday.strip()
+    match = _ISO_BIRTHDAY.match(birthday)
+    if match:
+        month, day = int(match.group(2)), int(match.group(3))
+    else:
+        match = _MONTH_DAY_DASH.match(birthday) or _US_BIRTHDAY.match(birthday)
+        if not match:
+            return None
+        month, day = int(match.group(1)), int(match.group(2))
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return month * 100 + day
+
+
+def birthday_window_filter(today: date, days: int) -> dict:
+    """Condition matching birthdays from today through today + days, wrapping over New Year"""
+    days = max(0, min(days, 365))
+    start = today.month * 100 + today.day
+    end_date = today + timedelta(days=days)
+    end = end_date.month * 100 + end_date.day
+    if days >= 365:
+        return {"birthday_md": {"$ne": None}}
+    if end_date.year == today.year:
+        return {"birthday_md": {"$gte": start, "$lte": end}}
+    return {"$or": [{"birthday_md": {"$gte": start}}, {"birthday_md": {"$lte": end, "$ne": None}}]}
+
+
+def build_contact_query(user_id: str, stage: Optional[str] = None, group: Optional[str] = None,
+                        due_before: Optional[str] = None, birthday_within_days: Optional[int] = None,
+                        today: Optional[date] = None) -> dict:
+    query = {"user_id": user_id}
+    if stage:
+        query["pipeline_stage"] = stage
+    if group:
+        query["groups"] = group
+    if due_before:
+        # next_due is stored as an ISO string, so string order is date order
+        query["next_due"] = {"$lt": due_before}
+    if birthday_within_days is not None:
+        query.update(birthday_window_filter(today or datetime.utcnow().date(), birthday_within_days))
+    return query
+
+
+def parse_contact_sort(sort: Optional[str]) -> Optional[List[Tuple[str, int]]]:
+    """'name' / '-next_due' -> [(field, direction)]; None when unsorted. Raises ValueError for unknown keys."""
+    if not sort:
+        return None
+    direction = -1 if sort.startswith("-") else 1
+    key = sort.lstrip("-+")
+    if key not in CONTACT_SORT_FIELDS:
+        raise ValueError(f"Unknown sort '{key}', expected one of: {', '.join(CONTACT_SORT_FIELDS)}")
+    return [(CONTACT_SORT_FIELDS[key], direction), ("_id", direction)]
+
+
+def summarize_explain(explain: dict) -> dict:
+    """Pull the winning plan's stages and indexes out of explain() output"""
+    planner = explain.get("queryPlanner", {})
+    stats = explain.get("executionStats", {})
+    stages, indexes = [], []
+
+    def walk(plan):
+        if not isinstance(plan, dict):
+            return
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        if "indexName" in plan:
+            indexes.append(plan["indexName"])
+        for child_key in ("inputStage", "queryPlan"):
+            walk(plan.get(child_key))
+        for child in plan.get("inputStages", []):
+            walk(child)
+
+    walk(planner.get("winningPlan"))
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+    }
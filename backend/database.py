@@ -0,0 +1,90 @@
+"""MongoDB client configuration.
+
+Pool sizing, wire compression, timeouts and retry behaviour can be set from
+the environment (CLIENT_OPTION_ENV) to tune a deployment without code changes;
+unset ones are left to MONGO_URL and the driver defaults. Heavy,
+staleness-tolerant reads (morning briefing, background analytics) go through
+`analytics_database()`, which may be served by a secondary; everything else
+reads from the primary.
+"""
+import importlib.util
+import os
+import re
+from typing import List, Mapping, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+
+def env_flag(value: str) -> bool:
+    return value.strip().lower() == 'true'
+
+
+# Driver option -> (environment variable, parser). Keyword options take precedence
+# over the connection string, so only options whose variable is set are passed;
+# everything else comes from MONGO_URL or the driver defaults.
+CLIENT_OPTION_ENV = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "maxConnecting": ("MONGO_MAX_CONNECTING", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),  # 0 = no timeout
+    # Interaction logging and the other single-document writes are retried once on failover
+    "retryWrites": ("MONGO_RETRY_WRITES", env_flag),
+    "retryReads": ("MONGO_RETRY_READS", env_flag),
+}
+# Preference order; ones whose library isn't installed are skipped. Applies unless
+# MONGO_URL names its own compressors and MONGO_COMPRESSORS is unset.
+DEFAULT_MONGO_COMPRESSORS = 'zstd,snappy,zlib'
+MONGO_ANALYTICS_READ_PREFERENCE = os.environ.get('MONGO_ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+# Mongo requires at least 90s; -1 means no limit
+MONGO_ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_ANALYTICS_MAX_STALENESS_SECONDS', -1))
+
+# Compressor name -> module that must be importable for it
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def available_compressors(requested: str = DEFAULT_MONGO_COMPRESSORS) -> List[str]:
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    return [name for name in names
+            if name in COMPRESSOR_MODULES and importlib.util.find_spec(COMPRESSOR_MODULES[name]) is not None]
+
+
+def uri_option_names(mongo_url: str) -> set:
+    """Lower-cased names of the options set in a connection string"""
+    query = mongo_url.split("?", 1)[1] if "?" in mongo_url else ""
+    return {part.split("=", 1)[0].strip().lower() for part in re.split("[&;]", query) if part.strip()}
+
+
+def client_options(mongo_url: str = "", environ: Mapping[str, str] = os.environ) -> dict:
+    options = {}
+    for option, (variable, parse) in CLIENT_OPTION_ENV.items():
+        value = environ.get(variable, "").strip()
+        if value:
+            options[option] = parse(value)
+    requested = environ.get('MONGO_COMPRESSORS')
+    if requested is None and "compressors" in uri_option_names(mongo_url):
+        return options
+    compressors = available_compressors(DEFAULT_MONGO_COMPRESSORS if requested is None else requested)
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+def create_client(mongo_url: str, event_listeners: Optional[list] = None) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(mongo_url, event_listeners=event_listeners or [], **client_options(mongo_url))
+
+
+def read_preference(name: str, max_staleness: int = -1):
+    return make_read_preference(read_pref_mode_from_name(name), None, max_staleness)
+
+
+def analytics_database(db: AsyncIOMotorDatabase, name: Optional[str] = None) -> AsyncIOMotorDatabase:
+    """Same database with the analytics read preference, for reads that tolerate slightly stale data"""
+    return db.client.get_database(
+        db.name,
+        read_preference=read_preference(name or MONGO_ANALYTICS_READ_PREFERENCE, MONGO_ANALYTICS_MAX_STALENESS_SECONDS)
+    )
@@ -0,0 +1,36 @@
+"""Stable content hashes of the device-synced contact fields.
+
+The mobile client computes the same hash from its address book entry and only
+uploads contacts whose hash differs from the server's fingerprint listing.
+Values are whitespace-collapsed, emails lowercased and phone numbers reduced to
+digits and '+', then joined with \\x1f and SHA-256 hashed (first 16 hex chars).
+"""
+import hashlib
+import re
+from typing import Any
+
+# Order matters: it is part of the hash
+SYNC_HASH_FIELDS = ("name", "phone", "email", "birthday", "job", "location")
+
+_PHONE_NOISE = re.compile(r"[^\d+]")
+
+
+def normalize_sync_field(field: str, value: Any) -> str:
+    if value is None:
+        return ""
+    value = " ".join(str(value).split())
+    if field == "email":
+        return value.lower()
+    if field == "phone":
+        return _PHONE_NOISE.sub("", value)
+    return value
+
+
+def contact_sync_hash(contact: dict) -> str:
+    """Fingerprint of a contact's sync-relevant fields"""
+    payload = "\x1f".join(normalize_sync_field(field, contact.get(field)) for field in SYNC_HASH_FIELDS)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def touches_sync_fields(update: dict) -> bool:
+    return any(field in update for field in SYNC_HASH_FIELDS)
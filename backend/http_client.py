@@ -0,0 +1,102 @@
+"""Connection pools for all outbound HTTP.
+
+One httpx.AsyncClient lives for the whole application: it is opened on
+startup, closed in the shutdown hook, and shared by sign-in, push delivery and
+the LLM client, so calls reuse warm keep-alive (and, where the server speaks
+it, HTTP/2) connections instead of paying TCP+TLS setup every time. The Google
+client libraries are synchronous and bring their own transports, so they get
+a shared requests session and httplib2 connection cache instead.
+"""
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', 'true').lower() == 'true'
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('HTTP_MAX_KEEPALIVE_CONNECTIONS', 20))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY_SECONDS', 30))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('HTTP_CONNECT_TIMEOUT_SECONDS', 5))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get('HTTP_TIMEOUT_SECONDS', 30))
+
+_client: Optional[httpx.AsyncClient] = None
+_google_session = None
+_google_http = None
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client() -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED and http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("h2 is not installed, outbound HTTP falls back to HTTP/1.1")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client; created on first use if startup hasn't run (scripts, tests)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    client = get_http_client()
+    try:
+        # LLM calls go through litellm, which uses this session for async requests when set
+        import litellm
+        litellm.aclient_session = client
+    except ImportError:
+        pass
+    return client
+
+
+async def close_http_client():
+    global _client, _google_session, _google_http
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _google_session is not None:
+        _google_session.close()
+        _google_session = None
+    _google_http = None
+
+
+def get_google_session():
+    """requests session for google-auth token refreshes: GoogleRequest(session=...)"""
+    global _google_session
+    if _google_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _google_session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=HTTP_MAX_KEEPALIVE_CONNECTIONS)
+        _google_session.mount("https://", adapter)
+    return _google_session
+
+
+def get_google_http():
+    """httplib2 connection cache for googleapiclient; wrap per user with AuthorizedHttp.
+    Not thread-safe, which is fine while Google API calls run on the event loop thread."""
+    global _google_http
+    if _google_http is None:
+        import httplib2
+        _google_http = httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS)
+    return _google_http
@@ -0,0 +1,255 @@
+"""Shared gateway for all outbound LLM calls.
+
+Every AI feature (drafts, morning briefing) goes through a single LLMGateway so
+that timeouts, retries, concurrency limits and the circuit breaker are applied
+consistently, and so latency/token metrics are collected in one place.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import List, Optional
+
+from prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'openai')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-4.1')
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 20))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5))
+LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY', 4))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURE_THRESHOLD', 5))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get('LLM_BREAKER_RESET_SECONDS', 30))
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 5, 10, 20, 30, 60]
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the LLM cannot be used (circuit open or all retries failed).
+    Callers are expected to fall back to their template message."""
+
+
+# ============ Circuit Breaker ============
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected immediately for `reset_seconds`. The first call after that is
+    let through as a probe; success closes the circuit, failure re-opens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # Half-open: only a single probe call at a time
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        """Free the half-open probe slot when the probe ended without an outcome
+        (e.g. it was cancelled), so the next call can probe again."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"LLM circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+# ============ Metrics ============
+
+class LLMMetrics:
+    """In-process counters for LLM calls, latency and token usage"""
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.short_circuited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.section_tokens = {}  # prompt section name -> total tokens sent
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+
+    def observe_latency(self, seconds: float):
+        self.latency_sum += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.latency_buckets[i] += 1
+                return
+        self.latency_buckets[-1] += 1
+
+    def record_prompt_report(self, feature: str, report: dict):
+        """Accumulate per-section token usage reported by PromptBuilder"""
+        for section, tokens in report.get("sections", {}).items():
+            key = f"{feature}.{section}"
+            self.section_tokens[key] = self.section_tokens.get(key, 0) + tokens
+
+    def snapshot(self) -> dict:
+        observed = sum(self.latency_buckets)
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "short_circuited": self.short_circuited,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "section_tokens": dict(self.section_tokens),
+            "latency_avg_seconds": round(self.latency_sum / observed, 3) if observed else 0.0,
+            "latency_sum_seconds": self.latency_sum,
+            "latency_buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.latency_buckets)),
+        }
+
+
+# ============ Gateway ============
+
+class LLMGateway:
+    """Bounded, fault-tolerant access to the LLM provider.
+
+    LlmChat keeps per-session message history, so a chat object is created per
+    call; the shared pool here is the set of concurrency slots, which caps how
+    many provider requests can be in flight at once across the whole process.
+    """
+
+    def __init__(self, provider: str = LLM_PROVIDER, model: str = LLM_MODEL,
+                 timeout: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LLMMetrics()
+        self._slots = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    def _new_chat(self, session_id: str, system_message: str):
+        # Imported here so the gateway (and its tests) load without the provider SDK
+        from emergentintegrations.llm.chat import LlmChat
+        return LlmChat(
+            api_key=os.environ.get('EMERGENT_LLM_KEY', ''),
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+
+    def _new_message(self, prompt: str, images: Optional[List[str]]):
+        from emergentintegrations.llm.chat import UserMessage, ImageContent
+        if images:
+            return UserMessage(text=prompt, file_contents=[ImageContent(image_base64=img) for img in images])
+        return UserMessage(text=prompt)
+
+    def _retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        cap = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def complete(self, prompt: str, system_message: str, session_prefix: str = "llm",
+                       images: Optional[List[str]] = None, timeout: Optional[float] = None) -> str:
+        """Send a single prompt and return the response text.
+
+        `images` are raw base64 strings attached as ImageContent.
+        Raises LLMUnavailableError when the circuit is open or every attempt failed.
+        """
+        self.metrics.calls += 1
+        if not self.breaker.allow():
+            self.metrics.short_circuited += 1
+            raise LLMUnavailableError("LLM circuit is open")
+
+        # A cancelled probe records neither outcome, so it must give its slot back
+        probing = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            return await self._attempt(prompt, system_message, session_prefix, images,
+                                       timeout or self.timeout)
+        finally:
+            if probing:
+                self.breaker.release_probe()
+
+    async def _attempt(self, prompt: str, system_message: str, session_prefix: str,
+                       images: Optional[List[str]], timeout: float) -> str:
+        """Run the call with retries and report the outcome to the breaker"""
+        message = self._new_message(prompt, images)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.metrics.retries += 1
+                await asyncio.sleep(self._retry_delay(attempt))
+
+            chat = self._new_chat(f"{session_prefix}_{time.time()}_{attempt}", system_message)
+
+            started = time.monotonic()
+            try:
+                async with self.slots:
+                    response = await asyncio.wait_for(chat.send_message(message), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.metrics.timeouts += 1
+                last_error = TimeoutError(f"LLM call timed out after {timeout}s")
+                logger.warning(f"LLM call timed out (attempt {attempt + 1}/{self.max_retries + 1})")
+                continue
+            except Exception as e:
+                last_error = e
+                logger.warning(f"LLM call failed (attempt {attempt + 1}/{self.max_retries + 1}): {e}")
+                continue
+            finally:
+                self.metrics.observe_latency(time.monotonic() - started)
+
+            self.breaker.record_success()
+            self.metrics.successes += 1
+            self.metrics.prompt_tokens += count_tokens(system_message) + count_tokens(prompt)
+            self.metrics.completion_tokens += count_tokens(response)
+            return response
+
+        self.breaker.record_failure()
+        self.metrics.failures += 1
+        raise LLMUnavailableError(str(last_error))
+
+# Process-wide gateway shared by every AI feature
+llm_gateway = LLMGateway()
@@ -0,0 +1,242 @@
+"""Request latency and database call instrumentation, exposed in Prometheus format.
+
+MetricsMiddleware times every HTTP request per route template (so
+/contacts/{contact_id} is one series, not one per contact) and, through a
+context variable, collects how many MongoDB commands the request issued and
+how long they took. DbCommandListener is a pymongo command listener feeding
+both the current request's counters and process-wide per-command totals;
+Motor runs commands on executor threads but copies the caller's context, so
+the listener sees the request that issued the command.
+
+Counters live in each worker process. Every sample carries a `worker` label,
+so series from different processes never overwrite each other; a scrape
+through the shared port reaches one worker at a time, and queries sum across
+the label (e.g. `sum by (route) (rate(http_requests_total[5m]))`).
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+DB_CALL_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-on-render histogram with fixed upper bounds"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+
+class RequestStats:
+    """DB round trips of one request; updated from Motor's executor threads"""
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_db_call(self, seconds: float):
+        with self._lock:
+            self.db_calls += 1
+            self.db_seconds += seconds
+
+
+current_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request_stats", default=None
+)
+
+
+class Metrics:
+    def __init__(self, worker: Optional[str] = None):
+        self.labels: Labels = (("worker", worker),) if worker else ()
+        self.request_latency: Dict[Labels, Histogram] = {}
+        self.request_db_calls: Dict[Labels, Histogram] = {}
+        self.request_db_seconds: Dict[Labels, Histogram] = {}
+        self.requests_total: Dict[Labels, int] = {}
+        self.db_commands: Dict[str, int] = {}
+        self.db_command_failures: Dict[str, int] = {}
+        self.db_command_seconds: Dict[str, float] = {}
+        self._db_lock = threading.Lock()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        labels = (("method", method), ("route", route))
+        self.request_latency.setdefault(labels, Histogram(LATENCY_BUCKETS)).observe(seconds)
+        self.request_db_calls.setdefault(labels, Histogram(DB_CALL_BUCKETS)).observe(stats.db_calls)
+        self.request_db_seconds.setdefault(labels, Histogram(LATENCY_BUCKETS)).observe(stats.db_seconds)
+        counter = labels + (("status", str(status)),)
+        self.requests_total[counter] = self.requests_total.get(counter, 0) + 1
+
+    def observe_db_command(self, command: str, seconds: float, failed: bool = False):
+        with self._db_lock:
+            self.db_commands[command] = self.db_commands.get(command, 0) + 1
+            self.db_command_seconds[command] = self.db_command_seconds.get(command, 0.0) + seconds
+            if failed:
+                self.db_command_failures[command] = self.db_command_failures.get(command, 0) + 1
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.add_db_call(seconds)
+
+    def render(self) -> str:
+        lines = []
+        base = self.labels
+        write_histograms(lines, "http_request_duration_seconds", "Request latency by route", self.request_latency,
+                         base)
+        write_samples(lines, "http_requests_total", "Requests by route and status", self.requests_total, base=base)
+        write_histograms(lines, "http_request_db_calls", "MongoDB round trips per request", self.request_db_calls,
+                         base)
+        write_histograms(lines, "http_request_db_seconds", "Time spent in MongoDB per request",
+                         self.request_db_seconds, base)
+        write_samples(lines, "mongodb_commands_total", "MongoDB commands issued", command_labels(self.db_commands),
+                      base=base)
+        write_samples(lines, "mongodb_command_failures_total", "MongoDB commands that failed",
+                      command_labels(self.db_command_failures), base=base)
+        write_samples(lines, "mongodb_command_seconds_total", "Time spent in MongoDB commands",
+                      command_labels(self.db_command_seconds), base=base)
+        return "\n".join(lines) + "\n"
+
+
+def command_labels(values: Dict[str, float]) -> Dict[Labels, float]:
+    return {(("command", name),): value for name, value in values.items()}
+
+
+def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for name, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_samples(lines: List[str], name: str, help_text: str, values: Dict[Labels, float], kind: str = "counter",
+                  base: Labels = ()):
+    """`base` labels (e.g. the worker) are prepended to every sample"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in sorted(values.items()):
+        lines.append(f"{name}{format_labels(base + labels)} {format_value(value)}")
+
+
+def write_histogram(lines: List[str], name: str, labels: Labels, buckets: List[float], counts: List[int],
+                    total: float, count: int):
+    cumulative = 0
+    for bound, bucket_count in zip([*buckets, "+Inf"], counts):
+        cumulative += bucket_count
+        le = bound if bound == "+Inf" else format_value(float(bound))
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(float(total))}")
+    lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+
+def write_histograms(lines: List[str], name: str, help_text: str, histograms: Dict[Labels, Histogram],
+                     base: Labels = ()):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in sorted(histograms.items()):
+        write_histogram(lines, name, base + labels, histogram.buckets, histogram.counts, histogram.sum,
+                        histogram.count)
+
+
+def render_llm_metrics(snapshot: dict, breaker_state: str, worker: Optional[str] = None) -> str:
+    """LLMGateway metrics (llm_gateway.LLMMetrics.snapshot()) in Prometheus format"""
+    base: Labels = (("worker", worker),) if worker else ()
+    lines = []
+    for key in ("calls", "successes", "failures", "timeouts", "retries", "short_circuited"):
+        write_samples(lines, f"llm_{key}_total", f"LLM gateway {key.replace('_', ' ')}", {(): snapshot[key]},
+                      base=base)
+    write_samples(lines, "llm_tokens_total", "Tokens exchanged with the LLM", {
+        (("kind", "prompt"),): snapshot["prompt_tokens"],
+        (("kind", "completion"),): snapshot["completion_tokens"],
+    }, base=base)
+    write_samples(lines, "llm_prompt_section_tokens_total", "Prompt tokens by feature and section", {
+        (("section", section),): tokens for section, tokens in snapshot["section_tokens"].items()
+    }, base=base)
+    buckets = snapshot["latency_buckets"]
+    bounds = [float(bound) for bound in buckets if bound != "+Inf"]
+    counts = list(buckets.values())
+    lines.append("# HELP llm_latency_seconds LLM call latency")
+    lines.append("# TYPE llm_latency_seconds histogram")
+    observed = sum(counts)
+    write_histogram(lines, "llm_latency_seconds", base, bounds, counts, snapshot["latency_sum_seconds"], observed)
+    write_samples(lines, "llm_circuit_open", "1 while the LLM circuit breaker is open",
+                  {(): 1 if breaker_state == "open" else 0}, kind="gauge", base=base)
+    return "\n".join(lines) + "\n"
+
+
+class DbCommandListener(monitoring.CommandListener):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.observe_db_command(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.metrics.observe_db_command(event.command_name, event.duration_micros / 1e6, failed=True)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so the request's context variable reaches the endpoint"""
+
+    def __init__(self, app, metrics: Metrics, slow_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.metrics = metrics
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            self.metrics.observe_request(scope["method"], route_path, status, elapsed, stats)
+            if elapsed >= self.slow_seconds:
+                logger.warning(
+                    f"Slow request {scope['method']} {route_path}: {elapsed:.3f}s, "
+                    f"{stats.db_calls} db calls ({stats.db_seconds:.3f}s)"
+                )
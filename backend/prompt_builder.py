@@ -0,0 +1,164 @@
+"""Token-budgeted prompt assembly.
+
+Prompts are built from named sections with a priority. When the assembled
+prompt would exceed the token budget, the least important sections are trimmed
+first: list sections drop their trailing items (replaced by a "+N more" line),
+text sections are truncated, and sections that no longer fit are dropped.
+Required sections are always kept in full.
+"""
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sections left with fewer tokens than this are dropped rather than truncated
+MIN_SECTION_TOKENS = 16
+TRUNCATION_MARKER = "…"
+
+
+# ============ Token Counting ============
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """Lazily load the tiktoken encoding; None if tiktoken is unavailable"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, using approximate token counts: {e}")
+            _encoding = None
+    return _encoding
+
+def count_tokens(text: Optional[str]) -> int:
+    """Count tokens in text (approximate ~4 chars/token if tiktoken is unavailable)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens, marking the cut"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:max(max_tokens - 1, 0)]).rstrip() + TRUNCATION_MARKER
+    return text[:max((max_tokens - 1) * 4, 0)].rstrip() + TRUNCATION_MARKER
+
+
+# ============ Prompt Builder ============
+
+class PromptSection:
+    def __init__(self, name: str, header: Optional[str], text: Optional[str], items: Optional[List[str]],
+                 priority: int, required: bool, max_item_tokens: Optional[int]):
+        self.name = name
+        self.header = header
+        self.text = text
+        self.items = items
+        self.priority = priority
+        self.required = required
+        self.max_item_tokens = max_item_tokens
+
+    def render(self, items: Optional[List[str]] = None, text: Optional[str] = None) -> str:
+        lines = []
+        if self.header:
+            lines.append(self.header)
+        if self.items is not None:
+            lines.extend(items if items is not None else self.items)
+        else:
+            lines.append(text if text is not None else (self.text or ""))
+        return "\n".join(lines)
+
+
+class PromptBuilder:
+    """Collects prompt sections and assembles them within a token budget.
+
+    Lower `priority` values are more important. Sections are emitted in the
+    order they were added, regardless of priority.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.sections: List[PromptSection] = []
+
+    def add(self, name: str, text: Optional[str] = None, items: Optional[List[str]] = None,
+            header: Optional[str] = None, priority: int = 10, required: bool = False,
+            max_item_tokens: Optional[int] = None) -> "PromptBuilder":
+        """Add a section. Pass `items` for list sections that can lose trailing entries.
+        Sections without any content are ignored."""
+        if not items and not text:
+            return self
+        if items is not None and max_item_tokens:
+            items = [truncate_to_tokens(item, max_item_tokens) for item in items]
+        self.sections.append(PromptSection(name, header, text, items, priority, required, max_item_tokens))
+        return self
+
+    def _fit(self, section: PromptSection, available: int) -> Optional[str]:
+        """Render the largest version of a section that fits in `available` tokens"""
+        full = section.render()
+        if count_tokens(full) <= available:
+            return full
+        if available < MIN_SECTION_TOKENS:
+            return None
+
+        if section.items is not None:
+            # Drop trailing items until it fits, summarizing what was left out
+            kept = list(section.items)
+            while kept:
+                kept.pop()
+                omitted = len(section.items) - len(kept)
+                candidate = section.render(items=kept + [f"(+{omitted} more)"])
+                if count_tokens(candidate) <= available:
+                    return candidate if kept else None
+            return None
+
+        header_tokens = count_tokens(section.header) + 1 if section.header else 0
+        text = truncate_to_tokens(section.text or "", available - header_tokens)
+        return section.render(text=text) if text else None
+
+    def build(self) -> tuple:
+        """Assemble the prompt. Returns (prompt, report) where report lists tokens per section."""
+        rendered = {}
+        used = 0
+
+        # Required sections always go in full
+        for section in self.sections:
+            if section.required:
+                rendered[section.name] = section.render()
+                used += count_tokens(rendered[section.name]) + 1  # +1 for the joining newline
+
+        # Then fill the remaining budget by priority
+        for section in sorted(self.sections, key=lambda s: s.priority):
+            if section.required:
+                continue
+            fitted = self._fit(section, self.budget - used - 1)
+            if fitted:
+                rendered[section.name] = fitted
+                used += count_tokens(fitted) + 1
+
+        report = {"budget": self.budget, "total_tokens": 0, "sections": {}, "trimmed": [], "dropped": []}
+        parts = []
+        for section in self.sections:
+            text = rendered.get(section.name)
+            if text is None:
+                report["dropped"].append(section.name)
+                continue
+            if text != section.render():
+                report["trimmed"].append(section.name)
+            tokens = count_tokens(text)
+            report["sections"][section.name] = tokens
+            parts.append(text)
+
+        prompt = "\n".join(parts)
+        report["total_tokens"] = count_tokens(prompt)
+        return prompt, report
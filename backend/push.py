@@ -0,0 +1,186 @@
+"""Push notification senders.
+
+The reminder dispatcher hands finished, Expo-shaped messages
+({"to": token, "title", "body", "data"}) to a PushSender and gets one ticket
+back per message, in order. Tickets follow Expo's format: {"status": "ok"} or
+{"status": "error", "message": ..., "details": {"error": ...}}.
+
+Tokens the provider reports as gone (DeviceNotRegistered), either right away
+in a ticket or later in a receipt, are passed to the sender's
+`on_invalid_tokens` callback so they can be pruned.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+
+from http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+PUSH_PROVIDER = os.environ.get('PUSH_PROVIDER', 'expo')
+EXPO_PUSH_URL = os.environ.get('EXPO_PUSH_URL', 'https://exp.host/--/api/v2/push/send')
+EXPO_RECEIPTS_URL = os.environ.get('EXPO_RECEIPTS_URL', 'https://exp.host/--/api/v2/push/getReceipts')
+EXPO_ACCESS_TOKEN = os.environ.get('EXPO_ACCESS_TOKEN')
+PUSH_TIMEOUT_SECONDS = float(os.environ.get('PUSH_TIMEOUT_SECONDS', 10))
+PUSH_MAX_CONCURRENCY = int(os.environ.get('PUSH_MAX_CONCURRENCY', 6))
+# Expo only guarantees receipts some time after sending; they are kept for a day
+PUSH_RECEIPT_DELAY_SECONDS = float(os.environ.get('PUSH_RECEIPT_DELAY_SECONDS', 900))
+
+# Provider limits per request
+EXPO_MAX_MESSAGES = 100
+EXPO_MAX_RECEIPT_IDS = 1000
+# Receipts still to check are dropped beyond this (oldest first)
+MAX_PENDING_RECEIPTS = 100000
+
+InvalidTokensCallback = Callable[[List[str]], Awaitable[None]]
+
+
+def error_ticket(message: str, error: str = None) -> dict:
+    ticket = {"status": "error", "message": message}
+    if error:
+        ticket["details"] = {"error": error}
+    return ticket
+
+
+def is_unregistered(result: dict) -> bool:
+    """Whether a ticket or receipt says the token no longer exists"""
+    return result.get("status") == "error" and (result.get("details") or {}).get("error") == "DeviceNotRegistered"
+
+
+def chunked(items: list, size: int) -> List[list]:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class PushSender(ABC):
+    def __init__(self, on_invalid_tokens: Optional[InvalidTokensCallback] = None):
+        self.on_invalid_tokens = on_invalid_tokens
+
+    @abstractmethod
+    async def send(self, messages: List[dict]) -> List[dict]:
+        """Deliver messages, returning one ticket per message in the same order"""
+
+    async def check_receipts(self) -> int:
+        """Process delivery receipts that are due; returns how many were checked"""
+        return 0
+
+    async def report_invalid(self, tokens: List[str]):
+        if not tokens or self.on_invalid_tokens is None:
+            return
+        try:
+            await self.on_invalid_tokens(sorted(set(tokens)))
+        except Exception as e:
+            logger.error(f"Pruning invalid push tokens failed: {e}")
+
+
+class LogPushSender(PushSender):
+    """Logs instead of sending; for local development without devices"""
+
+    async def send(self, messages: List[dict]) -> List[dict]:
+        for message in messages:
+            logger.info(f"Push to {message.get('to')}: {message.get('title')}")
+        return [{"status": "ok"} for _ in messages]
+
+
+class ExpoPushSender(PushSender):
+    """Sends through Expo's push API.
+
+    Messages go out in requests of EXPO_MAX_MESSAGES, up to PUSH_MAX_CONCURRENCY
+    at a time over the shared client pool (http_client.py). Ticket ids are
+    remembered and their receipts fetched by check_receipts() once
+    PUSH_RECEIPT_DELAY_SECONDS passed.
+    """
+
+    def __init__(self, url: str = EXPO_PUSH_URL, receipts_url: str = EXPO_RECEIPTS_URL,
+                 access_token: str = EXPO_ACCESS_TOKEN, http_client: httpx.AsyncClient = None,
+                 on_invalid_tokens: Optional[InvalidTokensCallback] = None,
+                 receipt_delay: float = PUSH_RECEIPT_DELAY_SECONDS):
+        super().__init__(on_invalid_tokens)
+        self.url = url
+        self.receipts_url = receipts_url
+        self.access_token = access_token
+        self._http_client = http_client
+        self.receipt_delay = receipt_delay
+        self._semaphore = asyncio.Semaphore(PUSH_MAX_CONCURRENCY)
+        self._pending_receipts = deque(maxlen=MAX_PENDING_RECEIPTS)  # (check after, ticket id, token)
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        return self._http_client or get_http_client()
+
+    def _headers(self) -> dict:
+        headers = {"Accept": "application/json", "Content-Type": "application/json"}
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        return headers
+
+    async def _post(self, url: str, payload) -> dict:
+        async with self._semaphore:
+            response = await self.http_client.post(url, json=payload, headers=self._headers(),
+                                                   timeout=PUSH_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
+
+    async def _send_chunk(self, messages: List[dict]) -> List[dict]:
+        try:
+            body = await self._post(self.url, messages)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Expo push request failed: {e}")
+            return [error_ticket(str(e)) for _ in messages]
+        tickets = body.get("data") or []
+        if len(tickets) != len(messages):
+            logger.error(f"Expo returned {len(tickets)} tickets for {len(messages)} messages: {body.get('errors')}")
+            return [error_ticket("Missing ticket") for _ in messages]
+        return tickets
+
+    async def send(self, messages: List[dict]) -> List[dict]:
+        if not messages:
+            return []
+        results = await asyncio.gather(*(self._send_chunk(chunk) for chunk in chunked(messages, EXPO_MAX_MESSAGES)))
+        tickets = [ticket for chunk in results for ticket in chunk]
+
+        check_after = time.monotonic() + self.receipt_delay
+        invalid = []
+        for message, ticket in zip(messages, tickets):
+            if is_unregistered(ticket):
+                invalid.append(message["to"])
+            elif ticket.get("status") == "ok" and ticket.get("id"):
+                self._pending_receipts.append((check_after, ticket["id"], message["to"]))
+        await self.report_invalid(invalid)
+        return tickets
+
+    async def check_receipts(self) -> int:
+        now = time.monotonic()
+        due = []
+        while self._pending_receipts and self._pending_receipts[0][0] <= now:
+            due.append(self._pending_receipts.popleft())
+        if not due:
+            return 0
+
+        invalid = []
+        for chunk in chunked(due, EXPO_MAX_RECEIPT_IDS):
+            tokens = {ticket_id: token for _, ticket_id, token in chunk}
+            try:
+                body = await self._post(self.receipts_url, {"ids": list(tokens)})
+            except (httpx.HTTPError, ValueError) as e:
+                # Receipts are only used for cleanup; a missed batch is caught on the next send
+                logger.error(f"Expo receipts request failed: {e}")
+                continue
+            for ticket_id, receipt in (body.get("data") or {}).items():
+                if is_unregistered(receipt):
+                    invalid.append(tokens[ticket_id])
+                elif receipt.get("status") == "error":
+                    logger.warning(f"Push {ticket_id} failed: {receipt.get('message')}")
+        await self.report_invalid(invalid)
+        return len(due)
+
+
+def create_push_sender(on_invalid_tokens: Optional[InvalidTokensCallback] = None) -> PushSender:
+    if PUSH_PROVIDER == 'log':
+        return LogPushSender(on_invalid_tokens)
+    return ExpoPushSender(on_invalid_tokens=on_invalid_tokens)
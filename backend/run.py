@@ -0,0 +1,25 @@
+"""Serve the API with several worker processes: `python run.py`.
+
+Each worker is a separate process with its own caches; they are kept coherent
+through the cache invalidation bus (cache_bus.py), and daily background jobs
+run in only one of them (claim_daily_run in server.py). /metrics reports the
+counters of whichever worker served the scrape, labelled with its `worker` id.
+"""
+import os
+
+import uvicorn
+
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 8001))
+# Same variable gunicorn and most PaaS launchers use
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "server:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        proxy_headers=True,
+        timeout_keep_alive=int(os.environ.get('KEEPALIVE_TIMEOUT_SECONDS', 5)),
+    )
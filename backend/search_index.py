@@ -0,0 +1,105 @@
+"""In-process trigram index over contact names.
+
+Gives typo-tolerant and prefix-as-you-type matching that Mongo's text index
+can't: "jonh" still finds "John", and "an" finds "Anna" before the word is
+complete. Indexes are built per user; the caller keeps them current by
+re-adding changed contacts and removing deleted ones.
+"""
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Hashable, List, Optional, Tuple
+
+# Results scoring below this share of the query's trigrams are dropped
+MIN_SCORE = 0.3
+PREFIX_BONUS = 1.0
+EXACT_BONUS = 1.0
+
+
+def normalize(text: Optional[str]) -> str:
+    """Casefold, strip diacritics and collapse whitespace"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.split())
+
+
+def trigrams(word: str) -> set:
+    """Trigrams of a single word, padded so word starts weigh more than word ends"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Name index for one user's contacts. `version` identifies the data it was built from."""
+
+    def __init__(self, version: Hashable = None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self._names = {}  # doc id -> normalized name
+        self._tokens = {}  # doc id -> name words
+        self._postings = defaultdict(set)  # trigram -> doc ids
+
+    def add(self, doc_id: str, name: Optional[str]):
+        """Index a name, replacing whatever was indexed for doc_id before"""
+        self.remove(doc_id)
+        name = normalize(name)
+        if not name:
+            return
+        tokens = name.split()
+        self._names[doc_id] = name
+        self._tokens[doc_id] = tokens
+        for token in tokens:
+            for gram in trigrams(token):
+                self._postings[gram].add(doc_id)
+
+    def remove(self, doc_id: str):
+        tokens = self._tokens.pop(doc_id, None)
+        if tokens is None:
+            return
+        del self._names[doc_id]
+        for token in tokens:
+            for gram in trigrams(token):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._postings[gram]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def search(self, query: str, limit: int = 20, min_score: float = MIN_SCORE) -> List[Tuple[str, float]]:
+        """Ranked (doc id, score) pairs, best first.
+
+        The base score is the share of the query's trigrams found in the name.
+        Names where every query word prefixes a name word get PREFIX_BONUS, and an
+        exact match gets EXACT_BONUS on top.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        query_tokens = query.split()
+        query_grams = set()
+        for token in query_tokens:
+            query_grams |= trigrams(token)
+
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for doc_id in self._postings.get(gram, ()):
+                shared[doc_id] += 1
+
+        results = []
+        for doc_id, count in shared.items():
+            score = count / len(query_grams)
+            tokens = self._tokens[doc_id]
+            if all(any(token.startswith(q) for token in tokens) for q in query_tokens):
+                score += PREFIX_BONUS
+                if self._names[doc_id] == query:
+                    score += EXACT_BONUS
+            if score >= min_score:
+                results.append((doc_id, score))
+
+        results.sort(key=lambda result: (-result[1], self._names[result[0]]))
+        return results[:limit]
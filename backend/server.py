@@ -1,9 +1,8 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
@@ -11,27 +10,74 @@ from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 import random
+import asyncio
+import copy
+import time
+import hashlib
+import hmac
+import base64
+import binascii
+from contextlib import asynccontextmanager
 from bson import ObjectId
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from bson.errors import InvalidId
+from pymongo import UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import jwt
 import httpx
+import orjson
 
 # Google Calendar imports
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request as GoogleRequest
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+from llm_gateway import llm_gateway, LLMUnavailableError
+from prompt_builder import PromptBuilder, truncate_to_tokens
+from cache import LRUCache
+from fingerprint import SYNC_HASH_FIELDS, contact_sync_hash, touches_sync_fields
+from search_index import TrigramIndex
+from sync_seq import SyncWrite, allocation_pipeline, committed_seq, release_update
+from contact_filters import build_contact_query, parse_birthday_md, parse_contact_sort, summarize_explain
+from timing_wheel import TimingWheel
+from change_events import WATCHED_COLLECTIONS, WATCHED_OPERATIONS, DerivedPlan, plan_derived_updates
+from push import PushSender, create_push_sender
+from database import analytics_database, create_client
+from cache_bus import CacheInvalidationBus, CacheRegistry, WORKER_ID
+from metrics import DbCommandListener, Metrics, MetricsMiddleware, render_llm_metrics
+from http_client import close_http_client, get_google_http, get_google_session, get_http_client, start_http_client
+
+# Request latency and DB round trips per route, served at /metrics (per worker process)
+metrics = Metrics(worker=WORKER_ID)
+
+# MongoDB connection (pool, compression and timeouts are configured in database.py)
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = create_client(mongo_url, event_listeners=[DbCommandListener(metrics)])
 db = client[os.environ['DB_NAME']]
+# Briefing and background scans tolerate slightly stale data and may read from a secondary
+analytics_db = analytics_database(db)
+
+# Caches other worker processes can invalidate (see cache_bus.py)
+cache_registry = CacheRegistry()
+cache_bus = CacheInvalidationBus(db, cache_registry)
+
+# JSON responses are encoded with orjson
+def _orjson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class MongoJSONResponse(ORJSONResponse):
+    """ORJSON response that also encodes ObjectId (datetimes are handled by orjson natively)"""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=MongoJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -43,6 +89,11 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', 10080))
 
+# Prompt token budgets (trimmed by section priority, see prompt_builder)
+DRAFT_PROMPT_TOKEN_BUDGET = int(os.environ.get('DRAFT_PROMPT_TOKEN_BUDGET', 1500))
+DRAFT_EXAMPLE_MESSAGE_TOKENS = int(os.environ.get('DRAFT_EXAMPLE_MESSAGE_TOKENS', 200))
+BRIEFING_PROMPT_TOKEN_BUDGET = int(os.environ.get('BRIEFING_PROMPT_TOKEN_BUDGET', 1200))
+
 # Google Calendar Configuration
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', 'YOUR_GOOGLE_CLIENT_ID_HERE')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', 'YOUR_GOOGLE_CLIENT_SECRET_HERE')
@@ -67,6 +118,22 @@ def serialize_doc(doc):
         del doc['_id']
     return doc
 
+# Aggregation stages that expose `_id` as a string `id`, so list endpoints can
+# hand documents straight to the encoder without a per-document Python pass
+PUBLIC_ID_STAGES = [
+    {"$addFields": {"id": {"$toString": "$_id"}}},
+    {"$project": {"_id": 0}}
+]
+
+async def find_public(collection, query: dict, sort: Optional[list] = None, limit: int = 1000) -> list:
+    """Find documents with `_id` already renamed to `id` by the database"""
+    pipeline = [{"$match": query}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    pipeline.append({"$limit": limit})
+    pipeline.extend(PUBLIC_ID_STAGES)
+    return await collection.aggregate(pipeline).to_list(limit)
+
 # ============ Models ============
 
 # --- Pipeline Stage Configuration ---
@@ -212,6 +279,9 @@ class ContactUpdate(BaseModel):
     profile_picture: Optional[str] = None
     device_contact_id: Optional[str] = None
 
+class BulkContactUpsertRequest(BaseModel):
+    contacts: List[ContactCreate]  # matched on device_contact_id
+
 class MovePipelineRequest(BaseModel):
     pipeline_stage: str
 
@@ -314,68 +384,92 @@ class CalendarEventUpdate(BaseModel):
     recurring: Optional[str] = None
 
 # ============ Utility Functions ============
-async def calculate_target_interval_async(pipeline_stage: str, user_id: str = None, apply_randomization: bool = True) -> int:
-    """Convert pipeline stage to days based on user's custom pipeline settings with randomization support"""
-    # Default intervals for backward compatibility
-    default_intervals = {
-        "New": 0,
-        "Daily": 1,
-        "Weekly": 7,
-        "Bi-Weekly": 14,
-        "Monthly": 30,
-        "Quarterly": 90,
-        "Annually": 365
-    }
+# Strong references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
+def spawn_background_task(coro) -> asyncio.Task:
+    """Run a coroutine in the background, tracked so it can be cancelled on shutdown"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# None until the first attempt tells us whether the deployment supports transactions
+transactions_supported = None
+
+async def run_in_transaction(callback):
+    """Run `await callback(session)` inside a transaction when MongoDB supports it
+    (replica set / sharded), otherwise with session=None and no atomicity.
+    The callback may be retried on transient errors, so it must not mutate shared state."""
+    global transactions_supported
+    if transactions_supported is not False:
+        try:
+            async with await client.start_session() as session:
+                return await session.with_transaction(callback)
+        except OperationFailure as e:
+            # IllegalOperation: standalone servers reject the transaction before anything is written
+            if e.code != 20:
+                raise
+            transactions_supported = False
+            logger.info("MongoDB transactions unavailable (standalone server); writing without them")
+    return await callback(None)
+
+# Default intervals for users without (matching) custom pipeline stages
+DEFAULT_STAGE_INTERVALS = {
+    "New": 0,  # New contacts have no countdown
+    "Daily": 1,
+    "Weekly": 7,
+    "Bi-Weekly": 14,
+    "Monthly": 30,
+    "Quarterly": 90,
+    "Annually": 365
+}
+
+PIPELINE_CACHE_SIZE = int(os.environ.get('PIPELINE_CACHE_SIZE', 10000))
+
+# user_id -> {stage name: stage config}; invalidated by update_profile
+pipeline_config_cache = cache_registry.register("pipeline_config", LRUCache(maxsize=PIPELINE_CACHE_SIZE))
+
+async def get_pipeline_config(user_id: str, user: dict = None) -> dict:
+    """User's custom pipeline stages by name, served from the per-user cache.
+    The user document is only read on a cache miss (or taken from `user` if already loaded)."""
+    config = pipeline_config_cache.get(user_id)
+    if config is None:
+        if user is None:
+            try:
+                user = await db.users.find_one({"_id": ObjectId(user_id)}, {"pipeline_stages": 1})
+            except InvalidId:
+                user = None
+        stages = (user or {}).get('pipeline_stages') or []
+        config = {stage.get('name'): stage for stage in stages}
+        pipeline_config_cache.set(user_id, config)
+    return config
+
+def resolve_target_interval(pipeline_stage: str, config: dict, apply_randomization: bool = True) -> int:
+    """Interval in days for a stage from a pipeline config, with optional randomization"""
+    stage = config.get(pipeline_stage)
+    if not stage:
+        # Return default for known stages, or 30 for unknown
+        return DEFAULT_STAGE_INTERVALS.get(pipeline_stage, 30)
     
-    # If no user_id, use defaults
-    if not user_id:
-        print(f"No user_id provided, using default for {pipeline_stage}")
-        return default_intervals.get(pipeline_stage, 30)
+    base_interval = stage.get('interval_days', 30)
     
-    # Try to get user's custom pipeline stages
-    try:
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
-        if user and user.get('pipeline_stages'):
-            print(f"Found user pipeline_stages: {[s.get('name') for s in user['pipeline_stages']]}")
-            for stage in user['pipeline_stages']:
-                if stage.get('name') == pipeline_stage:
-                    base_interval = stage.get('interval_days', 30)
-                    
-                    # Apply randomization if enabled and requested
-                    if apply_randomization and stage.get('randomize', False):
-                        variation = stage.get('random_variation', 0)
-                        if variation > 0:
-                            random_offset = random.randint(-variation, variation)
-                            final_interval = max(1, base_interval + random_offset)  # Ensure at least 1 day
-                            print(f"Applied randomization to {pipeline_stage}: base={base_interval}, variation=±{variation}, offset={random_offset}, final={final_interval}")
-                            return final_interval
-                    
-                    print(f"Found custom interval for {pipeline_stage}: {base_interval} days (no randomization)")
-                    return base_interval
-            print(f"Pipeline stage {pipeline_stage} not found in user's custom stages, checking defaults")
-        else:
-            print(f"User found but no pipeline_stages, checking defaults")
-    except Exception as e:
-        print(f"Error getting user pipeline stages: {e}")
+    # Apply randomization if enabled and requested
+    if apply_randomization and stage.get('randomize', False):
+        variation = stage.get('random_variation', 0)
+        if variation > 0:
+            random_offset = random.randint(-variation, variation)
+            return max(1, base_interval + random_offset)  # Ensure at least 1 day
     
-    # Return default for known stages, or 30 for unknown
-    result = default_intervals.get(pipeline_stage, 30)
-    print(f"Using default interval for {pipeline_stage}: {result} days")
-    return result
+    return base_interval
 
-def calculate_target_interval(pipeline_stage: str) -> int:
-    """Convert pipeline stage to days. 'New' stage has no interval (returns 0)
-    Note: This is a sync version for backward compatibility. Use calculate_target_interval_async when possible."""
-    intervals = {
-        "New": 0,  # New contacts have no countdown
-        "Daily": 1,
-        "Weekly": 7,
-        "Bi-Weekly": 14,
-        "Monthly": 30,
-        "Quarterly": 90,
-        "Annually": 365
-    }
-    return intervals.get(pipeline_stage, 30)
+async def calculate_target_interval_async(pipeline_stage: str, user_id: str = None, apply_randomization: bool = True) -> int:
+    """Convert pipeline stage to days based on user's custom pipeline settings with randomization support"""
+    if not user_id:
+        return DEFAULT_STAGE_INTERVALS.get(pipeline_stage, 30)
+    
+    config = await get_pipeline_config(user_id)
+    return resolve_target_interval(pipeline_stage, config, apply_randomization)
 
 def calculate_next_due_with_random_factor(last_contact_date_str: str, target_interval_days: int) -> str:
     """Calculate next due date with optional random factor
@@ -405,9 +499,15 @@ def calculate_next_due_with_random_factor(last_contact_date_str: str, target_int
     next_due = last_contact + timedelta(days=total_days)
     return next_due.isoformat()
 
-async def generate_ai_draft(contact: dict, user_settings: dict, interaction_history: list) -> str:
+def template_draft(contact: dict) -> str:
+    return f"Hey {contact.get('name', 'there')}! It's been a while - would love to catch up soon. How have you been?"
+
+async def generate_ai_draft(contact: dict, user_settings: dict, interaction_history: list, fallback: bool = True) -> str:
     """Generate personalized message draft using AI with full context and priority-based style learning
     
+    With fallback=False generation errors are raised instead of returning the
+    template message, for callers that would rather store nothing.
+    
     Style Priority:
     1. Conversation screenshots (if available) - highest priority, AI visually analyzes them
     2. Example message text
@@ -418,49 +518,38 @@ async def generate_ai_draft(contact: dict, user_settings: dict, interaction_hist
     2. Personal details (hobbies, food, how we met)
     """
     try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
-        
         # Get style sources
         conversation_screenshots = contact.get('conversation_screenshots', [])
         example_message = contact.get('example_message')
         tone = contact.get('tone', 'Casual')
         
         # Build comprehensive context from contact card
-        context_parts = []
-        
-        # Basic info
+        basic_info = []
         if contact.get('name'):
-            context_parts.append(f"Contact Name: {contact['name']}")
+            basic_info.append(f"Contact Name: {contact['name']}")
         if contact.get('job'):
-            context_parts.append(f"Job: {contact['job']}")
+            basic_info.append(f"Job: {contact['job']}")
         if contact.get('location'):
-            context_parts.append(f"Location: {contact['location']}")
+            basic_info.append(f"Location: {contact['location']}")
         if contact.get('academic_degree'):
-            context_parts.append(f"Education: {contact['academic_degree']}")
+            basic_info.append(f"Education: {contact['academic_degree']}")
         
         # Personal details - IMPORTANT for context
+        personal_details = []
         if contact.get('hobbies'):
-            context_parts.append(f"Hobbies/Interests: {contact['hobbies']}")
+            personal_details.append(f"Hobbies/Interests: {contact['hobbies']}")
         if contact.get('favorite_food'):
-            context_parts.append(f"Favorite Food: {contact['favorite_food']}")
+            personal_details.append(f"Favorite Food: {contact['favorite_food']}")
         if contact.get('how_we_met'):
-            context_parts.append(f"How we met: {contact['how_we_met']}")
+            personal_details.append(f"How we met: {contact['how_we_met']}")
         if contact.get('birthday'):
-            context_parts.append(f"Birthday: {contact['birthday']}")
-        
-        # Notes - can contain important context
-        if contact.get('notes'):
-            context_parts.append(f"Personal Notes: {contact['notes']}")
+            personal_details.append(f"Birthday: {contact['birthday']}")
         
         # Interaction history - PRIMARY context source
-        if interaction_history:
-            history_str = "\n".join([
-                f"  - {h.get('date', 'Unknown')}: {h.get('interaction_type', 'Unknown')} - {h.get('notes', 'No notes')}"
-                for h in interaction_history[:5]
-            ])
-            context_parts.append(f"RECENT INTERACTION HISTORY (very important!):\n{history_str}")
-        
-        context = "\n".join(context_parts)
+        history_items = [
+            f"  - {h.get('date', 'Unknown')}: {h.get('interaction_type', 'Unknown')} - {h.get('notes', 'No notes')}"
+            for h in (interaction_history or [])[:5]
+        ]
         
         # Determine language
         draft_language = contact.get('language') or user_settings.get('default_draft_language', 'English')
@@ -490,7 +579,7 @@ COPY MY COMMUNICATION PATTERN EXACTLY."""
             style_instruction = f"""
 CRITICAL - MIMIC THIS EXAMPLE MESSAGE STYLE:
 Here is exactly how I write to this person:
-"{example_message}"
+"{truncate_to_tokens(example_message, DRAFT_EXAMPLE_MESSAGE_TOKENS)}"
 
 YOU MUST copy this style exactly:
 - Same greeting pattern
@@ -506,33 +595,32 @@ STYLE SETTING: {tone}
 - Professional: Polite, business-appropriate ("Hello", formal)
 - Friendly: Warm, personal, enthusiastic"""
         
-        # Build the full prompt
-        prompt = f"""Write a personalized reconnection message to {contact.get('name', 'this person')}.
-
-===== CONTACT INFORMATION (use this for context) =====
-{context}
-
-===== WRITING STYLE INSTRUCTIONS =====
-{style_instruction}
-
-===== REQUIREMENTS =====
+        # Build the full prompt - sections are trimmed by priority to fit the token budget
+        builder = PromptBuilder(DRAFT_PROMPT_TOKEN_BUDGET)
+        builder.add("intro", f"Write a personalized reconnection message to {contact.get('name', 'this person')}.\n", required=True)
+        builder.add("contact_info", items=basic_info, header="===== CONTACT INFORMATION (use this for context) =====", required=True, max_item_tokens=60)
+        builder.add("personal_details", items=personal_details, priority=2, max_item_tokens=80)
+        if contact.get('notes'):
+            # Notes - can contain important context, but are unbounded in size
+            builder.add("notes", f"Personal Notes: {contact['notes']}", priority=3)
+        if history_items:
+            builder.add("interaction_history", items=history_items, header="RECENT INTERACTION HISTORY (very important!):", priority=1, max_item_tokens=80)
+        builder.add("style", f"\n===== WRITING STYLE INSTRUCTIONS ====={style_instruction}\n", required=True)
+        builder.add("requirements", f"""===== REQUIREMENTS =====
 - Language: {draft_language}
 - Length: 2-3 sentences maximum
 - Make it personal - reference specific things from the contact info or interaction history
 - The message should feel like a natural continuation of our relationship
 - If there's recent interaction history, reference something from it
 
-IMPORTANT: Write ONLY the message. No quotes, no explanation, no "Here's a message:" - just the message itself as if I'm typing it to send."""
+IMPORTANT: Write ONLY the message. No quotes, no explanation, no "Here's a message:" - just the message itself as if I'm typing it to send.""", required=True)
         
-        # Initialize chat
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY', ''),
-            session_id=f"draft_{contact.get('_id', 'unknown')}_{datetime.utcnow().timestamp()}",
-            system_message="You are an expert at writing personal messages. You carefully analyze images and text to mimic the exact communication style shown. You write natural, authentic messages that sound like they came from the user, not an AI."
-        ).with_model("openai", "gpt-4.1")
+        prompt, prompt_report = builder.build()
+        llm_gateway.metrics.record_prompt_report("draft", prompt_report)
+        logging.debug(f"Draft prompt tokens: {prompt_report}")
         
-        # Prepare file contents if we have screenshots
-        file_contents = []
+        # Prepare screenshots if we have them
+        images = []
         if has_screenshots:
             for screenshot in conversation_screenshots[:3]:
                 # Remove the data:image/...;base64, prefix if present
@@ -542,15 +630,14 @@ IMPORTANT: Write ONLY the message. No quotes, no explanation, no "Here's a messa
                 else:
                     base64_data = screenshot
                 
-                file_contents.append(ImageContent(image_base64=base64_data))
+                images.append(base64_data)
         
-        # Send message with or without images
-        if file_contents:
-            user_message = UserMessage(text=prompt, file_contents=file_contents)
-        else:
-            user_message = UserMessage(text=prompt)
-        
-        response = await chat.send_message(user_message)
+        response = await llm_gateway.complete(
+            prompt,
+            system_message="You are an expert at writing personal messages. You carefully analyze images and text to mimic the exact communication style shown. You write natural, authentic messages that sound like they came from the user, not an AI.",
+            session_prefix=f"draft_{contact.get('_id', contact.get('id', 'unknown'))}",
+            images=images
+        )
         
         # Clean up the response
         result = response.strip()
@@ -561,15 +648,44 @@ IMPORTANT: Write ONLY the message. No quotes, no explanation, no "Here's a messa
             result = result[1:-1]
         
         return result
+    except LLMUnavailableError as e:
+        if not fallback:
+            raise
+        logging.warning(f"AI draft unavailable, using template message: {str(e)}")
+        return template_draft(contact)
     except Exception as e:
+        if not fallback:
+            raise
         logging.error(f"Error generating AI draft: {str(e)}")
         import traceback
         logging.error(traceback.format_exc())
-        return f"Hey {contact.get('name', 'there')}! It's been a while - would love to catch up soon. How have you been?"
+        return template_draft(contact)
 
 # ============ Auth Helpers ============
 from auth import create_access_token, get_current_user
 
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 300))
+
+# user_id -> user document; invalidated on every users write
+user_doc_cache = cache_registry.register("users", LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS))
+
+async def get_current_user_doc(request: Request, current_user: dict = Depends(get_current_user)) -> Optional[dict]:
+    """Current user's document, loaded at most once per request and shared by all dependencies"""
+    if not hasattr(request.state, "user_doc"):
+        user_id = current_user["user_id"]
+        user = user_doc_cache.get(user_id)
+        if user is None:
+            try:
+                user = await db.users.find_one({"_id": ObjectId(user_id)})
+            except InvalidId:
+                user = None
+            if user is not None:
+                user_doc_cache.set(user_id, user)
+        # Handlers serialize the document in place, so each request gets its own copy
+        request.state.user_doc = copy.deepcopy(user)
+    return request.state.user_doc
+
 # ============ Google OAuth Config ============
 EMERGENT_AUTH_URL = "https://auth.emergentagent.com"
 EMERGENT_SESSION_API = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
@@ -594,16 +710,15 @@ class Token(BaseModel):
 async def google_auth(auth_data: GoogleAuthRequest):
     """Sign in or sign up with Google (only auth method)"""
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                EMERGENT_SESSION_API,
-                headers={"X-Session-ID": auth_data.session_id}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to validate Google session")
-            
-            session_data = response.json()
+        response = await get_http_client().get(
+            EMERGENT_SESSION_API,
+            headers={"X-Session-ID": auth_data.session_id}
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to validate Google session")
+        
+        session_data = response.json()
         
         google_email = session_data.get("email")
         google_name = session_data.get("name", "")
@@ -612,56 +727,54 @@ async def google_auth(auth_data: GoogleAuthRequest):
         if not google_email:
             raise HTTPException(status_code=400, detail="Could not get email from Google")
         
-        # Check if user exists
-        user = await db.users.find_one({"email": google_email})
-        
-        if user:
-            user_id = str(user["_id"])
-            # Update Google picture if changed
-            await db.users.update_one(
-                {"_id": user["_id"]},
-                {"$set": {
-                    "google_picture": google_picture,
-                    "updated_at": datetime.utcnow().isoformat()
-                }}
-            )
-        else:
-            # New user - create account
-            user_dict = {
-                "email": google_email,
-                "name": google_name,
-                "google_picture": google_picture,
-                "ui_language": "en",
-                "default_draft_language": "English",
-                "default_writing_style": "Hey! How have you been? Just wanted to catch up and see what you've been up to lately.",
-                "notification_time": "09:00",
-                "notifications_enabled": True,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            
-            result = await db.users.insert_one(user_dict)
-            user_id = str(result.inserted_id)
+        now = datetime.utcnow().isoformat()
+        # One round trip for both sign-in and sign-up; the unique email index keeps
+        # concurrent first logins from creating two accounts
+        login = dict(
+            filter={"email": google_email},
+            update={
+                "$set": {"google_picture": google_picture, "updated_at": now},
+                "$setOnInsert": {
+                    "email": google_email,
+                    "name": google_name,
+                    "ui_language": "en",
+                    "default_draft_language": "English",
+                    "default_writing_style": "Hey! How have you been? Just wanted to catch up and see what you've been up to lately.",
+                    "notification_time": "09:00",
+                    "notifications_enabled": True,
+                    "created_at": now,
+                }
+            },
+            projection={"name": 1, "google_picture": 1, "ui_language": 1, "default_draft_language": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        try:
+            user = await db.users.find_one_and_update(**login)
+        except DuplicateKeyError:
+            # Lost the insert race to a concurrent first login; the user exists now
+            user = await db.users.find_one_and_update(**login)
+        user_id = str(user["_id"])
+        await cache_bus.invalidate("users", user_id)
         
         # Create token
         access_token = create_access_token(data={"user_id": user_id, "email": google_email})
         
-        # Get updated user data
-        updated_user = await db.users.find_one({"_id": ObjectId(user_id)})
-        
         return {
             "access_token": access_token,
             "token_type": "bearer",
             "user": {
                 "id": user_id,
                 "email": google_email,
-                "name": updated_user.get("name", google_name),
-                "picture": updated_user.get("google_picture", google_picture),
-                "ui_language": updated_user.get("ui_language", "en"),
-                "default_draft_language": updated_user.get("default_draft_language", "English")
+                "name": user.get("name", google_name),
+                "picture": user.get("google_picture", google_picture),
+                "ui_language": user.get("ui_language", "en"),
+                "default_draft_language": user.get("default_draft_language", "English")
             }
         }
         
+    except HTTPException:
+        raise
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
     except Exception as e:
@@ -669,19 +782,354 @@ async def google_auth(auth_data: GoogleAuthRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/auth/me")
-async def get_me(current_user: dict = Depends(get_current_user)):
-    user = await db.users.find_one({"_id": ObjectId(current_user["user_id"])})
+async def get_me(user: Optional[dict] = Depends(get_current_user_doc)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     return serialize_doc(user)
 
+# ============ Collection Versions & ETags ============
+
+# Collections whose list endpoints support conditional requests
+VERSIONED_COLLECTIONS = ("contacts", "groups", "calendar_events", "interactions")
+
+async def touch_collections(user_id: str, *collections: str):
+    """Bump the user's version counter for each collection after a write that
+    takes no sync seq (writes that do use sync_write().touch instead).
+    
+    Must run after the write itself, so a reader can never cache new data under
+    an old ETag for longer than the next request."""
+    await db.collection_versions.update_one(
+        {"_id": user_id},
+        {
+            "$inc": {name: 1 for name in collections},
+            "$setOnInsert": {"epoch": os.urandom(4).hex()}
+        },
+        upsert=True
+    )
+
+async def conditional_list_response(request: Request, user_id: str, collections: tuple, variant: str = ""):
+    """Compute the weak ETag for a list endpoint from the collection versions it depends on.
+    
+    `variant` distinguishes result sets that change without a write (e.g. "today").
+    Returns (etag, response) where response is a ready 304 if the client's
+    If-None-Match already matches, otherwise None.
+    """
+    versions = await db.collection_versions.find_one({"_id": user_id}) or {}
+    parts = [versions.get("epoch", "0")] + [f"{versions.get(name, 0)}" for name in collections]
+    if request.url.query or variant:
+        # Different filters over the same data need different ETags
+        parts.append(hashlib.sha1(f"{request.url.query}|{variant}".encode()).hexdigest()[:10])
+    etag = f'W/"{"-".join(parts)}"'
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates or etag[2:] in candidates:
+            return etag, Response(status_code=304, headers={"ETag": etag})
+    return etag, None
+
+# ============ Delta Sync ============
+
+# Collections exposed through /api/sync/changes
+SYNC_COLLECTIONS = ("contacts", "groups", "interactions", "calendar_events")
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+# Tombstones older than this are purged by a TTL index; older cursors must resync
+SYNC_TOMBSTONE_TTL_DAYS = int(os.environ.get('SYNC_TOMBSTONE_TTL_DAYS', 30))
+
+@asynccontextmanager
+async def sync_write(user_id: str):
+    """Hold the next per-user sync seq (see sync_seq.py) for the duration of one write.
+    
+    Every write to a synced collection stamps the documents it touches with
+    `write.seq`, so clients can ask for everything newer than their cursor, and
+    calls `write.touch(...)` once it landed. On exit the seq is released and the
+    touched collections' versions are bumped in the same update."""
+    counters = await db.collection_versions.find_one_and_update(
+        {"_id": user_id},
+        allocation_pipeline(datetime.utcnow(), os.urandom(4).hex()),
+        projection={"sync_seq": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    write = SyncWrite(user_id, counters["sync_seq"])
+    try:
+        yield write
+    finally:
+        try:
+            await db.collection_versions.update_one({"_id": user_id}, release_update(write.seq, write.touched))
+        except Exception as e:
+            # Readers stop waiting for the seq once it times out
+            logger.error(f"Could not release sync seq {write.seq} of user {user_id}: {e}")
+
+async def record_tombstones(collection: str, user_id: str, ids: list, seq: int):
+    now = datetime.utcnow()
+    await db.sync_tombstones.insert_many([
+        {"user_id": user_id, "collection": collection, "doc_id": str(doc_id), "sync_seq": seq, "deleted_at": now}
+        for doc_id in ids
+    ], ordered=False)
+
+async def delete_with_tombstones(collection: str, user_id: str, query: dict, seq: int) -> int:
+    """Delete matching documents and record a tombstone for each. Returns the deleted count."""
+    async def on_batch(ids: list):
+        await record_tombstones(collection, user_id, ids, seq)
+    
+    return await delete_in_batches(collection, query, on_batch=on_batch)
+
+async def reset_sync(user_id: str, *collections: str):
+    """Force every client of this user to do a full resync (used for mass deletes)
+    and bump the versions of the collections the mass write touched"""
+    async with sync_write(user_id) as write:
+        await db.collection_versions.update_one({"_id": user_id}, {"$set": {"sync_reset_seq": write.seq}})
+        write.touch(*collections)
+
+# ============ Cascade Deletes ============
+
+CASCADE_BATCH_SIZE = int(os.environ.get('CASCADE_BATCH_SIZE', 1000))
+# Cascades up to this size run inside the request; larger ones continue in the background
+CASCADE_INLINE_LIMIT = int(os.environ.get('CASCADE_INLINE_LIMIT', 200))
+
+async def delete_in_batches(collection: str, query: dict, on_batch=None) -> int:
+    """Delete matching documents CASCADE_BATCH_SIZE at a time, so a huge cascade is
+    a series of short writes rather than one long one. `on_batch(ids)` runs after
+    each batch. Returns the deleted count."""
+    deleted = 0
+    while True:
+        ids = [doc["_id"] async for doc in db[collection].find(query, {"_id": 1}).limit(CASCADE_BATCH_SIZE)]
+        if not ids:
+            return deleted
+        result = await db[collection].delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if on_batch:
+            await on_batch(ids)
+        if len(ids) < CASCADE_BATCH_SIZE:
+            return deleted
+
+async def cascade_delete_contacts(user_id: str, contact_ids: List[str], tombstones: bool = True):
+    """Remove the interactions and drafts of deleted contacts and drop them from
+    calendar participant summaries, CASCADE_BATCH_SIZE contacts at a time.
+    
+    Scoped to the given ids, so anything the user creates while a background
+    cascade runs is left alone. Interactions get tombstones unless the caller
+    resets sync instead; in that case sync is reset again once the cascade is
+    done, as clients may have resynced while it ran. Each batch takes its own
+    sync seq, so a long cascade never holds back sync readers for long."""
+    async def tombstone_batch(ids: list):
+        async with sync_write(user_id) as write:
+            await record_tombstones("interactions", user_id, ids, write.seq)
+            write.touch("interactions")
+    
+    for start in range(0, len(contact_ids), CASCADE_BATCH_SIZE):
+        chunk = contact_ids[start:start + CASCADE_BATCH_SIZE]
+        scope = {"user_id": user_id, "contact_id": {"$in": chunk}}
+        if tombstones:
+            await delete_in_batches("interactions", scope, on_batch=tombstone_batch)
+        elif await delete_in_batches("interactions", scope):
+            await touch_collections(user_id, "interactions")
+        await delete_in_batches("drafts", scope)
+        
+        summaries_query = {"user_id": user_id, "participant_summaries.id": {"$in": chunk}}
+        if await db.calendar_events.find_one(summaries_query, {"_id": 1}):
+            async with sync_write(user_id) as write:
+                await db.calendar_events.update_many(
+                    summaries_query,
+                    {"$pull": {"participant_summaries": {"id": {"$in": chunk}}}, "$set": {"sync_seq": write.seq}}
+                )
+                write.touch("calendar_events")
+    
+    if not tombstones:
+        await reset_sync(user_id, "interactions", "calendar_events")
+
+async def run_cascade(user_id: str, contact_ids: List[str], tombstones: bool = True):
+    """Cascade inline when small, otherwise hand it to a background task.
+    Anything left behind by a crash is picked up by the orphan sweeper."""
+    if not contact_ids:
+        return
+    pending = CASCADE_INLINE_LIMIT + 1
+    if len(contact_ids) <= CASCADE_INLINE_LIMIT:
+        scope = {"user_id": user_id, "contact_id": {"$in": contact_ids}}
+        pending = await db.interactions.count_documents(scope, limit=CASCADE_INLINE_LIMIT + 1)
+        if pending <= CASCADE_INLINE_LIMIT:
+            pending += await db.drafts.count_documents(scope, limit=CASCADE_INLINE_LIMIT + 1)
+    if pending <= CASCADE_INLINE_LIMIT:
+        await cascade_delete_contacts(user_id, contact_ids, tombstones)
+        return
+    
+    async def cascade_in_background():
+        try:
+            await cascade_delete_contacts(user_id, contact_ids, tombstones)
+        except Exception as e:
+            logger.error(f"Cascade delete for user {user_id} failed: {e}")
+    spawn_background_task(cascade_in_background())
+
+def encode_sync_cursor(seq: int) -> str:
+    return f"{seq}.{int(datetime.utcnow().timestamp())}"
+
+def decode_sync_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """Parse a cursor into (seq, issued_at); None if missing or malformed"""
+    try:
+        seq, issued_at = cursor.split(".")
+        return int(seq), int(issued_at)
+    except (AttributeError, ValueError):
+        return None
+
+# ============ Pipeline Recompute ============
+
+PIPELINE_RECOMPUTE_BATCH_SIZE = int(os.environ.get('PIPELINE_RECOMPUTE_BATCH_SIZE', 500))
+
+# Jobs that still have work to do. A newer job for the same user supersedes these; jobs
+# cut short by a shutdown are left "interrupted" and resumed by the next startup.
+PIPELINE_RECOMPUTE_ACTIVE = ["queued", "running", "interrupted"]
+
+def changed_pipeline_stages(old_stages: List[dict], new_stages: List[dict]) -> List[str]:
+    """Names of stages whose interval or randomization settings differ"""
+    def schedule(stage):
+        return (stage.get('interval_days'), bool(stage.get('randomize', False)), stage.get('random_variation', 0))
+    
+    old_by_name = {stage.get('name'): schedule(stage) for stage in old_stages}
+    return [
+        stage.get('name') for stage in new_stages
+        if stage.get('name') in old_by_name and old_by_name[stage.get('name')] != schedule(stage)
+    ]
+
+async def start_pipeline_recompute(user_id: str, stage_names: List[str]) -> str:
+    """Create a recompute job for the given stages and run it in the background"""
+    jobs = db.pipeline_recompute_jobs
+    now = datetime.utcnow().isoformat()
+    job = {
+        "user_id": user_id,
+        "stages": stage_names,
+        "status": "queued",
+        "total": 0,
+        "processed": 0,
+        "created_at": now,
+        "updated_at": now
+    }
+    result = await jobs.insert_one(job)
+    job_id = result.inserted_id
+    
+    # Older unfinished jobs for this user, in any worker process, are superseded and
+    # their stages carried over. Only older ids are taken, so of two concurrent edits
+    # the newer job always survives; superseded jobs stop before their next page.
+    previous = await jobs.find(
+        {"user_id": user_id, "_id": {"$lt": job_id}, "status": {"$in": PIPELINE_RECOMPUTE_ACTIVE}},
+        {"stages": 1}
+    ).to_list(None)
+    if previous:
+        await jobs.update_many(
+            {"_id": {"$in": [p["_id"] for p in previous]}, "status": {"$in": PIPELINE_RECOMPUTE_ACTIVE}},
+            {"$set": {"status": "superseded", "superseded_by": job_id, "updated_at": now}}
+        )
+        stage_names = list(dict.fromkeys(
+            [name for p in previous for name in p.get("stages", [])] + stage_names
+        ))
+        await jobs.update_one({"_id": job_id}, {"$set": {"stages": stage_names}})
+    
+    spawn_background_task(run_pipeline_recompute(job_id, user_id, stage_names))
+    return str(job_id)
+
+async def resume_pipeline_recomputes():
+    """Pick up jobs a previous shutdown interrupted, each claimed by one worker process"""
+    while True:
+        job = await db.pipeline_recompute_jobs.find_one_and_update(
+            {"status": "interrupted"},
+            {"$set": {"status": "queued", "updated_at": datetime.utcnow().isoformat()}}
+        )
+        if not job:
+            return
+        logger.info(f"Resuming pipeline recompute job {job['_id']}")
+        spawn_background_task(run_pipeline_recompute(
+            job["_id"], job["user_id"], job["stages"],
+            after_id=job.get("last_id"), processed=job.get("processed", 0)
+        ))
+
+async def run_pipeline_recompute(job_id: ObjectId, user_id: str, stage_names: List[str],
+                                 after_id: Optional[ObjectId] = None, processed: int = 0):
+    """Recompute target_interval_days and next_due for every contact in the changed stages.
+    
+    Only contacts in those stages are read (via the user_id/pipeline_stage index),
+    in _id-ordered pages, and written back with one bulk_write per page. `after_id`
+    and `processed` resume an interrupted job after its last finished page.
+    """
+    jobs = db.pipeline_recompute_jobs
+    try:
+        config = await get_pipeline_config(user_id)
+        query = {"user_id": user_id, "pipeline_stage": {"$in": stage_names}}
+        remaining = dict(query)
+        if after_id is not None:
+            remaining["_id"] = {"$gt": after_id}
+        total = processed + await db.contacts.count_documents(remaining)
+        started = await jobs.update_one({"_id": job_id, "status": "queued"}, {"$set": {
+            "status": "running", "total": total, "updated_at": datetime.utcnow().isoformat()
+        }})
+        if not started.modified_count:
+            return  # superseded before it began
+        
+        last_id = after_id
+        while True:
+            page_query = dict(query)
+            if last_id is not None:
+                page_query["_id"] = {"$gt": last_id}
+            contacts = await db.contacts.find(
+                page_query, {"pipeline_stage": 1, "last_contact_date": 1}
+            ).sort("_id", 1).to_list(PIPELINE_RECOMPUTE_BATCH_SIZE)
+            if not contacts:
+                break
+            
+            # A newer job owns this user's recompute now; it covers our stages too
+            job = await jobs.find_one({"_id": job_id}, {"status": 1})
+            if not job or job["status"] != "running":
+                return
+            
+            now = datetime.utcnow().isoformat()
+            async with sync_write(user_id) as write:
+                operations = []
+                for contact in contacts:
+                    target_interval = resolve_target_interval(contact['pipeline_stage'], config)
+                    # Skip contacts whose stage or last contact changed since the read;
+                    # whoever changed them computed next_due themselves
+                    operations.append(UpdateOne({
+                        "_id": contact["_id"],
+                        "pipeline_stage": contact["pipeline_stage"],
+                        "last_contact_date": contact.get("last_contact_date")
+                    }, {"$set": {
+                        "target_interval_days": target_interval,
+                        "next_due": calculate_next_due_with_random_factor(contact.get('last_contact_date'), target_interval),
+                        "updated_at": now,
+                        "sync_seq": write.seq
+                    }}))
+                await db.contacts.bulk_write(operations, ordered=False)
+                write.touch("contacts")
+            
+            last_id = contacts[-1]["_id"]
+            processed += len(contacts)
+            await jobs.update_one({"_id": job_id}, {"$set": {
+                "processed": processed, "last_id": last_id, "updated_at": now
+            }})
+        
+        await jobs.update_one({"_id": job_id, "status": "running"}, {"$set": {
+            "status": "completed",
+            "processed": processed,
+            "finished_at": datetime.utcnow().isoformat(),
+            "updated_at": datetime.utcnow().isoformat()
+        }})
+    except asyncio.CancelledError:
+        # Shutdown: leave the job for the next startup to resume from last_id
+        await jobs.update_one({"_id": job_id, "status": {"$in": ["queued", "running"]}}, {"$set": {
+            "status": "interrupted", "updated_at": datetime.utcnow().isoformat()
+        }})
+        raise
+    except Exception as e:
+        logging.error(f"Pipeline recompute job {job_id} failed: {e}")
+        await jobs.update_one({"_id": job_id, "status": "running"}, {"$set": {
+            "status": "failed", "error": str(e), "updated_at": datetime.utcnow().isoformat()
+        }})
+
 # ============ User Profile Routes ============
 
 @api_router.get("/profile")
-async def get_profile(current_user: dict = Depends(get_current_user)):
+async def get_profile(current_user: dict = Depends(get_current_user), user: Optional[dict] = Depends(get_current_user_doc)):
     """Get current user's profile"""
-    user = await db.users.find_one({"_id": ObjectId(current_user["user_id"])})
     if not user:
         # Return default profile if user not found in database
         # This happens for users who logged in but didn't have a profile created yet
@@ -707,15 +1155,44 @@ async def update_profile(profile_update: UserProfileUpdate, current_user: dict =
     update_data = {k: v for k, v in profile_update.dict().items() if v is not None}
     update_data['updated_at'] = datetime.utcnow().isoformat()
     
-    # Use upsert to create profile if it doesn't exist
-    await db.users.update_one(
+    # Use upsert to create profile if it doesn't exist. The document from before the
+    # write tells which pipeline intervals changed; with only $set the new state is
+    # the old one plus update_data, so no read-back is needed.
+    previous = await db.users.find_one_and_update(
         {"_id": ObjectId(current_user["user_id"])},
         {"$set": update_data},
-        upsert=True
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
     )
+    await cache_bus.invalidate("users", current_user["user_id"])
+    await cache_bus.invalidate("pipeline_config", current_user["user_id"])
+    
+    updated_user = {**(previous or {"_id": ObjectId(current_user["user_id"])}), **update_data}
+    result = serialize_doc(updated_user)
+    
+    if 'pipeline_stages' in update_data:
+        previous_stages = (previous or {}).get('pipeline_stages') or DEFAULT_PIPELINE_STAGES
+        changed = changed_pipeline_stages(previous_stages, update_data['pipeline_stages'])
+        if changed:
+            result['pipeline_recompute_job_id'] = await start_pipeline_recompute(current_user["user_id"], changed)
     
-    updated_user = await db.users.find_one({"_id": ObjectId(current_user["user_id"])})
-    return serialize_doc(updated_user)
+    return result
+
+@api_router.get("/pipeline/recompute-jobs/{job_id}")
+async def get_pipeline_recompute_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Progress of a background pipeline recompute job"""
+    try:
+        job = await db.pipeline_recompute_jobs.find_one({
+            "_id": ObjectId(job_id),
+            "user_id": current_user["user_id"]
+        })
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return serialize_doc(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.post("/contacts/move-to-new")
 async def move_contacts_to_new(stage_name: str = None, current_user: dict = Depends(get_current_user)):
@@ -724,28 +1201,28 @@ async def move_contacts_to_new(stage_name: str = None, current_user: dict = Depe
         raise HTTPException(status_code=400, detail="stage_name is required")
     
     # Move all contacts with this pipeline_stage to "New"
-    result = await db.contacts.update_many(
-        {
-            "user_id": current_user["user_id"],
-            "pipeline_stage": stage_name
-        },
-        {
-            "$set": {
-                "pipeline_stage": "New",
-                "next_due": None
+    async with sync_write(current_user["user_id"]) as write:
+        result = await db.contacts.update_many(
+            {
+                "user_id": current_user["user_id"],
+                "pipeline_stage": stage_name
+            },
+            {
+                "$set": {
+                    "pipeline_stage": "New",
+                    "next_due": None,
+                    "sync_seq": write.seq
+                }
             }
-        }
-    )
+        )
+        write.touch("contacts")
     
     return {"message": f"Moved {result.modified_count} contacts to 'New' stage", "count": result.modified_count}
 
 # ============ Contact Routes ============
 
-@api_router.post("/contacts", response_model=dict)
-async def create_contact(contact: ContactCreate, current_user: dict = Depends(get_current_user)):
-    contact_dict = contact.dict()
-    contact_dict['user_id'] = current_user["user_id"]
-    
+def apply_initial_schedule(contact_dict: dict, config: dict):
+    """Set last_contact_date, target_interval_days and next_due on a contact about to be inserted"""
     # For "New" pipeline stage, don't set last_contact_date or next_due
     # This ensures new contacts have no countdown until they're assigned to a real pipeline
     if contact_dict['pipeline_stage'] == 'New':
@@ -757,23 +1234,318 @@ async def create_contact(contact: ContactCreate, current_user: dict = Depends(ge
         if not contact_dict.get('last_contact_date'):
             contact_dict['last_contact_date'] = datetime.utcnow().isoformat()
         
-        contact_dict['target_interval_days'] = calculate_target_interval(contact_dict['pipeline_stage'])
+        contact_dict['target_interval_days'] = resolve_target_interval(contact_dict['pipeline_stage'], config)
         contact_dict['next_due'] = calculate_next_due_with_random_factor(
             contact_dict['last_contact_date'],
             contact_dict['target_interval_days']
         )
+
+@api_router.post("/contacts", response_model=dict)
+async def create_contact(contact: ContactCreate, current_user: dict = Depends(get_current_user)):
+    contact_dict = contact.dict()
+    contact_dict['user_id'] = current_user["user_id"]
+    apply_initial_schedule(contact_dict, await get_pipeline_config(current_user["user_id"]))
+    contact_dict['sync_hash'] = contact_sync_hash(contact_dict)
+    contact_dict['birthday_md'] = parse_birthday_md(contact_dict.get('birthday'))
     
-    result = await db.contacts.insert_one(contact_dict)
+    async with sync_write(current_user["user_id"]) as write:
+        contact_dict['sync_seq'] = write.seq
+        result = await db.contacts.insert_one(contact_dict)
+        write.touch("contacts")
     contact_dict['id'] = str(result.inserted_id)
     if '_id' in contact_dict:
         del contact_dict['_id']
     
     return contact_dict
 
+# Fields that drive scheduling or are app-owned; a device re-import only sets them on insert
+BULK_UPSERT_INSERT_ONLY_FIELDS = {"pipeline_stage", "last_contact_date", "groups"}
+BULK_UPSERT_MAX_CONTACTS = int(os.environ.get('BULK_UPSERT_MAX_CONTACTS', 5000))
+
+@api_router.post("/contacts/bulk-upsert")
+async def bulk_upsert_contacts(request: BulkContactUpsertRequest, current_user: dict = Depends(get_current_user)):
+    """Create or update many device contacts in one write, matched on (user_id, device_contact_id).
+    
+    Existing contacts only get the fields the client actually sent (minus the
+    insert-only scheduling fields). Returns one outcome per submitted contact:
+    created, updated, skipped (duplicate device_contact_id in the request) or error.
+    """
+    user_id = current_user["user_id"]
+    if len(request.contacts) > BULK_UPSERT_MAX_CONTACTS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_UPSERT_MAX_CONTACTS} contacts per request")
+    
+    config = await get_pipeline_config(user_id)
+    now = datetime.utcnow().isoformat()
+    
+    results = [None] * len(request.contacts)
+    last_index = {}  # device_contact_id -> index of its last occurrence
+    for index, contact in enumerate(request.contacts):
+        if not contact.device_contact_id:
+            results[index] = {"status": "error", "error": "device_contact_id is required"}
+        else:
+            last_index[contact.device_contact_id] = index
+    
+    # Current synced fields of contacts that already exist, to fingerprint partial updates
+    existing_fields = {}
+    if last_index:
+        async for doc in db.contacts.find(
+            {"user_id": user_id, "device_contact_id": {"$in": list(last_index)}},
+            {"_id": 0, "device_contact_id": 1, **{field: 1 for field in SYNC_HASH_FIELDS}}
+        ):
+            existing_fields[doc["device_contact_id"]] = doc
+    
+    async with sync_write(user_id) as write:
+        operations = []
+        op_indexes = []  # operation position -> request index
+        for index, contact in enumerate(request.contacts):
+            if results[index] is not None:
+                continue
+            device_id = contact.device_contact_id
+            if last_index[device_id] != index:
+                results[index] = {"status": "skipped", "device_contact_id": device_id,
+                                  "error": "duplicate device_contact_id in request"}
+                continue
+            
+            updates = {k: v for k, v in contact.dict(exclude_unset=True).items()
+                       if k not in BULK_UPSERT_INSERT_ONLY_FIELDS and k != "device_contact_id"}
+            updates.update({"updated_at": now, "sync_seq": write.seq})
+            if "birthday" in updates:
+                updates["birthday_md"] = parse_birthday_md(updates["birthday"])
+            
+            new_contact = contact.dict()
+            new_contact.update({"user_id": user_id, "created_at": now,
+                                "birthday_md": parse_birthday_md(contact.birthday)})
+            apply_initial_schedule(new_contact, config)
+            existing = existing_fields.get(device_id)
+            updates["sync_hash"] = contact_sync_hash({**existing, **updates} if existing else new_contact)
+            on_insert = {k: v for k, v in new_contact.items() if k not in updates}
+            
+            operations.append(UpdateOne(
+                {"user_id": user_id, "device_contact_id": device_id},
+                {"$set": updates, "$setOnInsert": on_insert},
+                upsert=True
+            ))
+            op_indexes.append(index)
+        
+        write_errors = {}
+        upserted = {}
+        if operations:
+            try:
+                result = await db.contacts.bulk_write(operations, ordered=False)
+                upserted = result.upserted_ids
+            except BulkWriteError as e:
+                details = e.details
+                upserted = {item["index"]: item["_id"] for item in details.get("upserted", [])}
+                write_errors = {item["index"]: item for item in details.get("writeErrors", [])}
+            
+            # Two concurrent imports can race to insert the same key; the loser's
+            # retry simply matches the winner's document
+            retry = [position for position, error in write_errors.items() if error.get("code") == 11000]
+            if retry:
+                try:
+                    await db.contacts.bulk_write([operations[position] for position in retry], ordered=False)
+                    for position in retry:
+                        write_errors.pop(position)
+                except BulkWriteError as e:
+                    failed = {retry[item["index"]] for item in e.details.get("writeErrors", [])}
+                    for position in retry:
+                        if position not in failed:
+                            write_errors.pop(position)
+            
+            write.touch("contacts")
+    
+    # One lookup for the ids of matched (not inserted) contacts
+    matched_ids = {}
+    matched_devices = [request.contacts[index].device_contact_id
+                       for position, index in enumerate(op_indexes) if position not in upserted]
+    if matched_devices:
+        async for doc in db.contacts.find(
+            {"user_id": user_id, "device_contact_id": {"$in": matched_devices}},
+            {"device_contact_id": 1}
+        ):
+            matched_ids[doc["device_contact_id"]] = str(doc["_id"])
+    
+    for position, index in enumerate(op_indexes):
+        device_id = request.contacts[index].device_contact_id
+        if position in write_errors:
+            results[index] = {"status": "error", "device_contact_id": device_id,
+                              "error": write_errors[position].get("errmsg", "write failed")}
+        elif position in upserted:
+            results[index] = {"status": "created", "device_contact_id": device_id, "id": str(upserted[position])}
+        else:
+            results[index] = {"status": "updated", "device_contact_id": device_id, "id": matched_ids.get(device_id)}
+    
+    # Keep calendar participant summaries in step with renamed contacts and new pictures
+    # (left to the change-stream consumer when it runs)
+    summary_changed = []
+    for position, index in enumerate(op_indexes):
+        contact = request.contacts[index]
+        sent = contact.model_fields_set
+        existing = existing_fields.get(contact.device_contact_id)
+        if results[index]["status"] == "updated" and results[index]["id"] and (
+                "profile_picture" in sent or ("name" in sent and existing and existing.get("name") != contact.name)):
+            summary_changed.append(ObjectId(results[index]["id"]))
+    if summary_changed and not derived_data_streaming:
+        changed_contacts = await db.contacts.find(
+            {"_id": {"$in": summary_changed}}, {"name": 1, "profile_picture": 1}
+        ).to_list(len(summary_changed))
+        await propagate_contact_summary(user_id, changed_contacts)
+    
+    counts = {}
+    for item in results:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return {"counts": counts, "results": results}
+
+CONTACT_LIST_MAX_LIMIT = 1000
+
 @api_router.get("/contacts", response_model=List[dict])
-async def get_contacts(current_user: dict = Depends(get_current_user)):
-    contacts = await db.contacts.find({"user_id": current_user["user_id"]}).to_list(1000)
-    return [serialize_doc(c) for c in contacts]
+async def get_contacts(
+    request: Request,
+    stage: Optional[str] = None,
+    group: Optional[str] = None,
+    due_before: Optional[str] = None,
+    overdue: bool = False,
+    birthday_within_days: Optional[int] = None,
+    sort: Optional[str] = None,
+    limit: int = CONTACT_LIST_MAX_LIMIT,
+    explain: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """List contacts, optionally filtered and sorted.
+    
+    sort is one of next_due, name, last_contact_date (prefix '-' for descending).
+    explain=true returns the query plan summary instead of the contacts.
+    """
+    if overdue:
+        # Whole minutes, so repeated polls resolve to the same query and ETag
+        now = datetime.utcnow().replace(second=0, microsecond=0).isoformat()
+        due_before = min(due_before, now) if due_before else now
+    query = build_contact_query(current_user["user_id"], stage=stage, group=group,
+                                due_before=due_before, birthday_within_days=birthday_within_days)
+    try:
+        sort_spec = parse_contact_sort(sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = max(1, min(limit, CONTACT_LIST_MAX_LIMIT))
+    
+    if explain:
+        cursor = db.contacts.find(query).limit(limit)
+        if sort_spec:
+            cursor = cursor.sort(sort_spec)
+        plan = await cursor.explain()
+        return {"query": query, "sort": sort_spec, "plan": summarize_explain(plan)}
+    
+    # The resolved query covers filters relative to now (overdue, birthday window)
+    etag, not_modified = await conditional_list_response(request, current_user["user_id"], ("contacts",),
+                                                         variant=str(query))
+    if not_modified:
+        return not_modified
+    
+    contacts = await find_public(db.contacts, query, sort=sort_spec, limit=limit)
+    return MongoJSONResponse(contacts, headers={"ETag": etag})
+
+# Matches the partial filter of the fingerprint index, so the listing is a covered query
+LINKED_DEVICE_CONTACT = {"$gt": ""}
+
+@api_router.get("/contacts/fingerprints")
+async def get_contact_fingerprints(request: Request, current_user: dict = Depends(get_current_user)):
+    """Map of device_contact_id -> sync_hash for every device-linked contact.
+    
+    Clients hash their address book entries the same way (see fingerprint.py)
+    and upload only the ones that differ."""
+    etag, not_modified = await conditional_list_response(request, current_user["user_id"], ("contacts",))
+    if not_modified:
+        return not_modified
+    
+    fingerprints = {}
+    async for doc in db.contacts.find(
+        {"user_id": current_user["user_id"], "device_contact_id": LINKED_DEVICE_CONTACT},
+        {"_id": 0, "device_contact_id": 1, "sync_hash": 1}
+    ):
+        fingerprints[doc["device_contact_id"]] = doc.get("sync_hash")
+    return MongoJSONResponse({"fields": list(SYNC_HASH_FIELDS), "fingerprints": fingerprints},
+                             headers={"ETag": etag})
+
+# ============ Contact Search ============
+
+SEARCH_INDEX_MAX_USERS = int(os.environ.get('SEARCH_INDEX_MAX_USERS', 200))
+# Full rebuilds also pick up anything a delta refresh could have missed
+SEARCH_INDEX_MAX_AGE_SECONDS = int(os.environ.get('SEARCH_INDEX_MAX_AGE_SECONDS', 3600))
+SEARCH_MAX_RESULTS = 50
+
+search_indexes = LRUCache(SEARCH_INDEX_MAX_USERS)
+
+async def get_search_index(user_id: str) -> TrigramIndex:
+    """The user's name index, brought up to date with the committed sync seq.
+    
+    A cached index is refreshed from the contacts and tombstones stamped since it
+    was built; it is rebuilt from scratch when missing, too old, or invalidated
+    by a sync reset.
+    """
+    counters = await db.collection_versions.find_one(
+        {"_id": user_id}, {"sync_seq": 1, "sync_pending": 1, "sync_reset_seq": 1}
+    ) or {}
+    current_seq = committed_seq(counters, datetime.utcnow())
+    index = search_indexes.get(user_id)
+    
+    if (index is None or index.version < counters.get("sync_reset_seq", 0)
+            or time.monotonic() - index.built_at > SEARCH_INDEX_MAX_AGE_SECONDS):
+        index = TrigramIndex(version=current_seq)
+        async for doc in db.contacts.find({"user_id": user_id}, {"name": 1}):
+            index.add(str(doc["_id"]), doc.get("name"))
+        search_indexes.set(user_id, index)
+    elif index.version < current_seq:
+        seq_range = {"$gt": index.version, "$lte": current_seq}
+        async for doc in db.contacts.find({"user_id": user_id, "sync_seq": seq_range}, {"name": 1}):
+            index.add(str(doc["_id"]), doc.get("name"))
+        async for tombstone in db.sync_tombstones.find(
+            {"user_id": user_id, "sync_seq": seq_range, "collection": "contacts"}, {"doc_id": 1}
+        ):
+            index.remove(tombstone["doc_id"])
+        index.version = current_seq
+    return index
+
+@api_router.get("/contacts/search", response_model=List[dict])
+async def search_contacts(q: str, limit: int = 20, current_user: dict = Depends(get_current_user)):
+    """Ranked contact search: typo-tolerant, as-you-type matching on names plus
+    full-text matching on job, location, notes and hobbies"""
+    user_id = current_user["user_id"]
+    q = q.strip()
+    limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+    if not q:
+        return MongoJSONResponse([])
+    
+    index = await get_search_index(user_id)
+    scores = dict(index.search(q, limit=limit))
+    
+    try:
+        text_hits = await db.contacts.find(
+            {"user_id": user_id, "$text": {"$search": q}},
+            {"_id": 1, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).to_list(limit)
+    except OperationFailure as e:
+        # Text index not built (yet); name matches still work
+        logger.warning(f"Contact text search unavailable: {e}")
+        text_hits = []
+    for hit in text_hits:
+        doc_id = str(hit["_id"])
+        # Squash text scores below 1 so a name prefix match always outranks a notes match
+        scores[doc_id] = scores.get(doc_id, 0) + hit["score"] / (1 + hit["score"])
+    
+    ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+    contacts = await find_public(db.contacts, {
+        "user_id": user_id,
+        "_id": {"$in": [ObjectId(doc_id) for doc_id, _ in ranked]}
+    }, limit=limit)
+    by_id = {contact["id"]: contact for contact in contacts}
+    
+    results = []
+    for doc_id, score in ranked:
+        contact = by_id.get(doc_id)
+        if contact:
+            contact["search_score"] = round(score, 3)
+            results.append(contact)
+    return MongoJSONResponse(results)
 
 @api_router.get("/contacts/{contact_id}", response_model=dict)
 async def get_contact(contact_id: str, current_user: dict = Depends(get_current_user)):
@@ -788,53 +1560,92 @@ async def get_contact(contact_id: str, current_user: dict = Depends(get_current_
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@api_router.get("/contacts/{contact_id}/picture")
+async def get_contact_picture(contact_id: str, current_user: dict = Depends(get_current_user)):
+    """Contact picture as an image. Referenced by versioned URLs (picture_ref), so it is cached long-term."""
+    try:
+        contact = await db.contacts.find_one(
+            {"_id": ObjectId(contact_id), "user_id": current_user["user_id"]},
+            {"profile_picture": 1}
+        )
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid contact id")
+    picture = (contact or {}).get("profile_picture")
+    if not picture:
+        raise HTTPException(status_code=404, detail="Picture not found")
+    
+    media_type = "image/jpeg"
+    if picture.startswith("data:"):
+        # data:image/png;base64,....
+        header, _, picture = picture.partition(",")
+        media_type = header[5:].split(";")[0] or media_type
+    try:
+        content = base64.b64decode(picture)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=422, detail="Stored picture is not valid base64")
+    return Response(content=content, media_type=media_type,
+                    headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
 @api_router.put("/contacts/{contact_id}", response_model=dict)
 async def update_contact(contact_id: str, contact_update: ContactUpdate, current_user: dict = Depends(get_current_user)):
     try:
         update_data = {k: v for k, v in contact_update.dict().items() if v is not None}
         update_data['updated_at'] = datetime.utcnow().isoformat()
+        if 'birthday' in update_data:
+            update_data['birthday_md'] = parse_birthday_md(update_data['birthday'])
         
-        # Recalculate next_due if pipeline_stage or last_contact_date changed
-        if 'pipeline_stage' in update_data or 'last_contact_date' in update_data:
+        reschedule = 'pipeline_stage' in update_data or 'last_contact_date' in update_data
+        if reschedule or touches_sync_fields(update_data):
             existing = await db.contacts.find_one({
                 "_id": ObjectId(contact_id),
                 "user_id": current_user["user_id"]
-            })
-            if existing:
+            }, {field: 1 for field in (*SYNC_HASH_FIELDS, "pipeline_stage", "last_contact_date")})
+            if existing and touches_sync_fields(update_data):
+                update_data['sync_hash'] = contact_sync_hash({**existing, **update_data})
+            # Recalculate next_due if pipeline_stage or last_contact_date changed
+            if existing and reschedule:
                 pipeline_stage = update_data.get('pipeline_stage', existing.get('pipeline_stage', 'Monthly'))
                 last_contact = update_data.get('last_contact_date', existing.get('last_contact_date'))
                 
-                target_interval = calculate_target_interval(pipeline_stage)
+                target_interval = await calculate_target_interval_async(pipeline_stage, current_user["user_id"])
                 update_data['target_interval_days'] = target_interval
                 update_data['next_due'] = calculate_next_due_with_random_factor(last_contact, target_interval)
         
-        result = await db.contacts.update_one(
-            {"_id": ObjectId(contact_id), "user_id": current_user["user_id"]},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Contact not found")
+        async with sync_write(current_user["user_id"]) as write:
+            update_data['sync_seq'] = write.seq
+            updated_contact = await db.contacts.find_one_and_update(
+                {"_id": ObjectId(contact_id), "user_id": current_user["user_id"]},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if updated_contact is None:
+                raise HTTPException(status_code=404, detail="Contact not found")
+            write.touch("contacts")
         
-        updated_contact = await db.contacts.find_one({"_id": ObjectId(contact_id)})
+        if 'name' in update_data or 'profile_picture' in update_data:
+            if not derived_data_streaming:
+                await propagate_contact_summary(current_user["user_id"], [updated_contact])
         return serialize_doc(updated_contact)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.delete("/contacts/{contact_id}")
 async def delete_contact(contact_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        # Also delete related interactions
-        await db.interactions.delete_many({"contact_id": contact_id})
-        # Also delete related drafts
-        await db.drafts.delete_many({"contact_id": contact_id})
+        async with sync_write(current_user["user_id"]) as write:
+            deleted_count = await delete_with_tombstones("contacts", current_user["user_id"], {
+                "_id": ObjectId(contact_id),
+                "user_id": current_user["user_id"]
+            }, write.seq)
+            if deleted_count == 0:
+                raise HTTPException(status_code=404, detail="Contact not found")
+            write.touch("contacts")
         
-        result = await db.contacts.delete_one({
-            "_id": ObjectId(contact_id),
-            "user_id": current_user["user_id"]
-        })
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Contact not found")
+        # Also delete related interactions and drafts
+        await run_cascade(current_user["user_id"], [contact_id])
         return {"message": "Contact deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -843,20 +1654,22 @@ async def delete_contact(contact_id: str, current_user: dict = Depends(get_curre
 async def delete_all_contacts(current_user: dict = Depends(get_current_user)):
     """Delete all contacts for the current user"""
     try:
-        # Get all contact IDs for this user
-        contacts = await db.contacts.find({"user_id": current_user["user_id"]}).to_list(10000)
-        contact_ids = [str(c["_id"]) for c in contacts]
-        
-        # Delete all related interactions
-        await db.interactions.delete_many({"user_id": current_user["user_id"]})
-        
-        # Delete all related drafts
-        await db.drafts.delete_many({"user_id": current_user["user_id"]})
-        
-        # Delete all contacts
-        result = await db.contacts.delete_many({"user_id": current_user["user_id"]})
-        
-        return {"message": f"Deleted {result.deleted_count} contacts", "deleted_count": result.deleted_count}
+        # The cascade is scoped to exactly these contacts, so nothing created after
+        # this request is caught by it when it runs in the background
+        contact_ids = []
+        async def collect_ids(ids: list):
+            contact_ids.extend(str(contact_id) for contact_id in ids)
+        deleted_count = await delete_in_batches("contacts", {"user_id": current_user["user_id"]}, on_batch=collect_ids)
+        # Cheaper than a tombstone per document: clients simply start over
+        await reset_sync(current_user["user_id"], "contacts")
+        if derived_data_streaming:
+            # No tombstones for the consumer to see; every group is empty now
+            await refresh_group_counts(current_user["user_id"])
+        
+        # Delete all related interactions and drafts
+        await run_cascade(current_user["user_id"], contact_ids, tombstones=False)
+        
+        return {"message": f"Deleted {deleted_count} contacts", "deleted_count": deleted_count}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -864,13 +1677,6 @@ async def delete_all_contacts(current_user: dict = Depends(get_current_user)):
 async def move_pipeline(contact_id: str, request: MovePipelineRequest, current_user: dict = Depends(get_current_user)):
     """Move contact to different pipeline stage and recalculate next_due"""
     try:
-        existing = await db.contacts.find_one({
-            "_id": ObjectId(contact_id),
-            "user_id": current_user["user_id"]
-        })
-        if not existing:
-            raise HTTPException(status_code=404, detail="Contact not found")
-        
         # Use async version to get custom interval from user's settings
         target_interval = await calculate_target_interval_async(request.pipeline_stage, current_user["user_id"])
         
@@ -886,13 +1692,19 @@ async def move_pipeline(contact_id: str, request: MovePipelineRequest, current_u
             'updated_at': datetime.utcnow().isoformat()
         }
         
-        await db.contacts.update_one(
-            {"_id": ObjectId(contact_id)},
-            {"$set": update_data}
-        )
-        
-        updated_contact = await db.contacts.find_one({"_id": ObjectId(contact_id)})
+        async with sync_write(current_user["user_id"]) as write:
+            update_data['sync_seq'] = write.seq
+            updated_contact = await db.contacts.find_one_and_update(
+                {"_id": ObjectId(contact_id), "user_id": current_user["user_id"]},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER
+            )
+            if updated_contact is None:
+                raise HTTPException(status_code=404, detail="Contact not found")
+            write.touch("contacts")
         return serialize_doc(updated_contact)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -900,23 +1712,22 @@ async def move_pipeline(contact_id: str, request: MovePipelineRequest, current_u
 async def move_to_groups(contact_id: str, request: MoveToGroupRequest, current_user: dict = Depends(get_current_user)):
     """Update contact's group assignments"""
     try:
-        existing = await db.contacts.find_one({
-            "_id": ObjectId(contact_id),
-            "user_id": current_user["user_id"]
-        })
-        if not existing:
-            raise HTTPException(status_code=404, detail="Contact not found")
-        
-        await db.contacts.update_one(
-            {"_id": ObjectId(contact_id)},
-            {"$set": {
-                "groups": request.group_ids,
-                "updated_at": datetime.utcnow().isoformat()
-            }}
-        )
-        
-        updated_contact = await db.contacts.find_one({"_id": ObjectId(contact_id)})
+        async with sync_write(current_user["user_id"]) as write:
+            updated_contact = await db.contacts.find_one_and_update(
+                {"_id": ObjectId(contact_id), "user_id": current_user["user_id"]},
+                {"$set": {
+                    "groups": request.group_ids,
+                    "updated_at": datetime.utcnow().isoformat(),
+                    "sync_seq": write.seq
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if updated_contact is None:
+                raise HTTPException(status_code=404, detail="Contact not found")
+            write.touch("contacts")
         return serialize_doc(updated_contact)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -930,7 +1741,7 @@ async def log_interaction(contact_id: str, interaction: InteractionCreate, curre
         contact = await db.contacts.find_one({
             "_id": ObjectId(contact_id),
             "user_id": current_user["user_id"]
-        })
+        }, {"_id": 1})
         if not contact:
             raise HTTPException(status_code=404, detail="Contact not found")
         
@@ -943,23 +1754,18 @@ async def log_interaction(contact_id: str, interaction: InteractionCreate, curre
             "created_at": datetime.utcnow().isoformat()
         }
         
-        result = await db.interactions.insert_one(interaction_dict)
+        async with sync_write(current_user["user_id"]) as write:
+            interaction_dict['sync_seq'] = write.seq
+            result = await db.interactions.insert_one(interaction_dict)
+            write.touch("interactions")
         interaction_dict['id'] = str(result.inserted_id)
         if '_id' in interaction_dict:
             del interaction_dict['_id']
         
-        # Update contact's last_contact_date and recalculate next_due
-        target_interval = contact.get('target_interval_days', 30)
-        next_due = calculate_next_due_with_random_factor(interaction.date, target_interval)
-        
-        await db.contacts.update_one(
-            {"_id": ObjectId(contact_id)},
-            {"$set": {
-                "last_contact_date": interaction.date,
-                "next_due": next_due,
-                "updated_at": datetime.utcnow().isoformat()
-            }}
-        )
+        # Update contact's last_contact_date and recalculate next_due (the change-stream
+        # consumer does this when running)
+        if not derived_data_streaming:
+            await apply_last_contact(current_user["user_id"], contact_id, interaction.date)
         
         return interaction_dict
     except Exception as e:
@@ -977,12 +1783,12 @@ async def get_interactions(contact_id: str, current_user: dict = Depends(get_cur
         if not contact:
             raise HTTPException(status_code=404, detail="Contact not found")
         
-        interactions = await db.interactions.find({
+        interactions = await find_public(db.interactions, {
             "contact_id": contact_id,
             "user_id": current_user["user_id"]
-        }).sort("date", -1).to_list(100)
+        }, sort=[("date", -1)], limit=100)
         
-        return [serialize_doc(i) for i in interactions]
+        return MongoJSONResponse(interactions)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -990,12 +1796,14 @@ async def get_interactions(contact_id: str, current_user: dict = Depends(get_cur
 async def delete_interaction(interaction_id: str, current_user: dict = Depends(get_current_user)):
     """Delete an interaction"""
     try:
-        result = await db.interactions.delete_one({
-            "_id": ObjectId(interaction_id),
-            "user_id": current_user["user_id"]
-        })
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Interaction not found")
+        async with sync_write(current_user["user_id"]) as write:
+            deleted_count = await delete_with_tombstones("interactions", current_user["user_id"], {
+                "_id": ObjectId(interaction_id),
+                "user_id": current_user["user_id"]
+            }, write.seq)
+            if deleted_count == 0:
+                raise HTTPException(status_code=404, detail="Interaction not found")
+            write.touch("interactions")
         return {"message": "Interaction deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1007,30 +1815,33 @@ async def create_group(group: GroupCreate, current_user: dict = Depends(get_curr
     """Create a new group"""
     group_dict = group.dict()
     group_dict['user_id'] = current_user["user_id"]
-    
-    result = await db.groups.insert_one(group_dict)
+    async with sync_write(current_user["user_id"]) as write:
+        group_dict['sync_seq'] = write.seq
+        result = await db.groups.insert_one(group_dict)
+        write.touch("groups")
     group_dict['id'] = str(result.inserted_id)
     if '_id' in group_dict:
         del group_dict['_id']
     return group_dict
 
 @api_router.get("/groups", response_model=List[dict])
-async def get_groups(current_user: dict = Depends(get_current_user)):
+async def get_groups(request: Request, current_user: dict = Depends(get_current_user)):
     """Get all groups for the current user"""
-    groups = await db.groups.find({"user_id": current_user["user_id"]}).to_list(1000)
+    # Contact counts depend on contacts too
+    etag, not_modified = await conditional_list_response(request, current_user["user_id"], ("groups", "contacts"))
+    if not_modified:
+        return not_modified
     
-    # For each group, get the count of contacts
-    result = []
-    for g in groups:
-        group_data = serialize_doc(g)
-        contact_count = await db.contacts.count_documents({
-            "user_id": current_user["user_id"],
-            "groups": group_data["id"]
-        })
-        group_data["contact_count"] = contact_count
-        result.append(group_data)
+    groups = await find_public(db.groups, {"user_id": current_user["user_id"]}, limit=1000)
     
-    return result
+    # Counts are kept on the groups by the change-stream consumer; without it (or before
+    # it caught up with a new group) count all groups in one aggregation
+    if not derived_data_streaming or any("contact_count" not in group_data for group_data in groups):
+        counts = await count_group_members(current_user["user_id"])
+        for group_data in groups:
+            group_data["contact_count"] = counts.get(group_data["id"], 0)
+    
+    return MongoJSONResponse(groups, headers={"ETag": etag})
 
 @api_router.get("/groups/{group_id}", response_model=dict)
 async def get_group(group_id: str, current_user: dict = Depends(get_current_user)):
@@ -1045,15 +1856,15 @@ async def get_group(group_id: str, current_user: dict = Depends(get_current_user
         group_data = serialize_doc(group)
         
         # Get contacts in this group
-        contacts = await db.contacts.find({
+        contacts = await find_public(db.contacts, {
             "user_id": current_user["user_id"],
             "groups": group_id
-        }).to_list(1000)
+        }, limit=1000)
         
-        group_data["contacts"] = [serialize_doc(c) for c in contacts]
+        group_data["contacts"] = contacts
         group_data["contact_count"] = len(contacts)
         
-        return group_data
+        return MongoJSONResponse(group_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -1063,42 +1874,97 @@ async def update_group(group_id: str, group_update: GroupUpdate, current_user: d
         update_data = {k: v for k, v in group_update.dict().items() if v is not None}
         update_data['updated_at'] = datetime.utcnow().isoformat()
         
-        result = await db.groups.update_one(
-            {"_id": ObjectId(group_id), "user_id": current_user["user_id"]},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Group not found")
-        
-        updated_group = await db.groups.find_one({"_id": ObjectId(group_id)})
+        async with sync_write(current_user["user_id"]) as write:
+            update_data['sync_seq'] = write.seq
+            updated_group = await db.groups.find_one_and_update(
+                {"_id": ObjectId(group_id), "user_id": current_user["user_id"]},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if updated_group is None:
+                raise HTTPException(status_code=404, detail="Group not found")
+            write.touch("groups")
         return serialize_doc(updated_group)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.delete("/groups/{group_id}")
 async def delete_group(group_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        # Remove this group from all contacts
-        await db.contacts.update_many(
-            {"user_id": current_user["user_id"], "groups": group_id},
-            {"$pull": {"groups": group_id}}
-        )
-        
-        result = await db.groups.delete_one({
-            "_id": ObjectId(group_id),
-            "user_id": current_user["user_id"]
-        })
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Group not found")
+        async with sync_write(current_user["user_id"]) as write:
+            deleted_count = await delete_with_tombstones("groups", current_user["user_id"], {
+                "_id": ObjectId(group_id),
+                "user_id": current_user["user_id"]
+            }, write.seq)
+            if deleted_count == 0:
+                raise HTTPException(status_code=404, detail="Group not found")
+            
+            # Remove this group from all contacts
+            await db.contacts.update_many(
+                {"user_id": current_user["user_id"], "groups": group_id},
+                {"$pull": {"groups": group_id}, "$set": {"sync_seq": write.seq}}
+            )
+            write.touch("groups", "contacts")
         return {"message": "Group deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ============ Draft Routes ============
 
+def get_draft_user_settings(user: Optional[dict]) -> dict:
+    """Extract the settings used for draft generation (handle case where user might not exist)"""
+    if user:
+        return {
+            "default_writing_style": user.get("default_writing_style", "Hey! How have you been?"),
+            "default_draft_language": user.get("default_draft_language", "English")
+        }
+    return {
+        "default_writing_style": "Hey! How have you been?",
+        "default_draft_language": "English"
+    }
+
+async def generate_and_store_draft(contact: dict, user_id: str, user_settings: dict, auto_generated: bool = False) -> dict:
+    """Generate an AI draft for a contact and save it as a pending draft.
+    
+    Auto-generated drafts never fall back to the template message: a canned
+    draft would sit as pending and block a real one for that contact, so
+    generation errors are raised and nothing is stored.
+    """
+    contact_id = str(contact['_id'])
+    
+    # Get interaction history
+    interactions = await db.interactions.find({
+        "contact_id": contact_id,
+        "user_id": user_id
+    }).sort("date", -1).to_list(5)
+    
+    # Generate draft
+    contact_serialized = serialize_doc(contact)
+    draft_message = await generate_ai_draft(contact_serialized, user_settings, interactions, fallback=not auto_generated)
+    
+    # Save draft
+    draft_dict = {
+        'user_id': user_id,
+        'contact_id': contact_id,
+        'contact_name': contact.get('name', 'Unknown'),
+        'draft_message': draft_message,
+        'status': 'pending',
+        'auto_generated': auto_generated,
+        'created_at': datetime.utcnow().isoformat()
+    }
+    
+    result = await db.drafts.insert_one(draft_dict)
+    draft_dict['id'] = str(result.inserted_id)
+    if '_id' in draft_dict:
+        del draft_dict['_id']
+    
+    return draft_dict
+
 @api_router.post("/drafts/generate/{contact_id}", response_model=dict)
-async def generate_draft(contact_id: str, current_user: dict = Depends(get_current_user)):
+async def generate_draft(contact_id: str, current_user: dict = Depends(get_current_user), user: Optional[dict] = Depends(get_current_user_doc)):
     """Generate AI-powered message draft for a contact"""
     try:
         contact = await db.contacts.find_one({
@@ -1108,45 +1974,9 @@ async def generate_draft(contact_id: str, current_user: dict = Depends(get_curre
         if not contact:
             raise HTTPException(status_code=404, detail="Contact not found")
         
-        # Get user settings (handle case where user might not exist)
-        user = await db.users.find_one({"_id": ObjectId(current_user["user_id"])})
-        if user:
-            user_settings = {
-                "default_writing_style": user.get("default_writing_style", "Hey! How have you been?"),
-                "default_draft_language": user.get("default_draft_language", "English")
-            }
-        else:
-            user_settings = {
-                "default_writing_style": "Hey! How have you been?",
-                "default_draft_language": "English"
-            }
-        
-        # Get interaction history
-        interactions = await db.interactions.find({
-            "contact_id": contact_id,
-            "user_id": current_user["user_id"]
-        }).sort("date", -1).to_list(5)
-        
-        # Generate draft
-        contact_serialized = serialize_doc(contact)
-        draft_message = await generate_ai_draft(contact_serialized, user_settings, interactions)
-        
-        # Save draft
-        draft_dict = {
-            'user_id': current_user["user_id"],
-            'contact_id': contact_id,
-            'contact_name': contact.get('name', 'Unknown'),
-            'draft_message': draft_message,
-            'status': 'pending',
-            'created_at': datetime.utcnow().isoformat()
-        }
-        
-        result = await db.drafts.insert_one(draft_dict)
-        draft_dict['id'] = str(result.inserted_id)
-        if '_id' in draft_dict:
-            del draft_dict['_id']
+        user_settings = get_draft_user_settings(user)
         
-        return draft_dict
+        return await generate_and_store_draft(contact, current_user["user_id"], user_settings)
     except Exception as e:
         logging.error(f"Error generating draft: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -1154,11 +1984,11 @@ async def generate_draft(contact_id: str, current_user: dict = Depends(get_curre
 @api_router.get("/drafts", response_model=List[dict])
 async def get_drafts(current_user: dict = Depends(get_current_user)):
     """Get all pending drafts"""
-    drafts = await db.drafts.find({
+    drafts = await find_public(db.drafts, {
         "user_id": current_user["user_id"],
         "status": "pending"
-    }).to_list(100)
-    return [serialize_doc(d) for d in drafts]
+    }, limit=100)
+    return MongoJSONResponse(drafts)
 
 @api_router.put("/drafts/{draft_id}/dismiss")
 async def dismiss_draft(draft_id: str, current_user: dict = Depends(get_current_user)):
@@ -1199,14 +2029,17 @@ async def mark_draft_sent(draft_id: str, current_user: dict = Depends(get_curren
             target_interval = contact.get('target_interval_days', 30)
             next_due = calculate_next_due_with_random_factor(today, target_interval)
             
-            await db.contacts.update_one(
-                {"_id": ObjectId(contact_id)},
-                {"$set": {
-                    'last_contact_date': today,
-                    'next_due': next_due,
-                    'updated_at': today
-                }}
-            )
+            async with sync_write(current_user["user_id"]) as write:
+                await db.contacts.update_one(
+                    {"_id": ObjectId(contact_id)},
+                    {"$set": {
+                        'last_contact_date': today,
+                        'next_due': next_due,
+                        'updated_at': today,
+                        'sync_seq': write.seq
+                    }}
+                )
+                write.touch("contacts")
         
         return {"message": "Draft marked as sent"}
     except Exception as e:
@@ -1241,25 +2074,42 @@ async def delete_all_drafts(current_user: dict = Depends(get_current_user)):
 async def get_morning_briefing(current_user: dict = Depends(get_current_user)):
     """Get contacts due today or overdue"""
     today = datetime.utcnow().isoformat()
-    contacts = await db.contacts.find({
+    contacts = await find_public(analytics_db.contacts, {
         "user_id": current_user["user_id"],
         "next_due": {"$lte": today}
-    }).to_list(100)
-    return [serialize_doc(c) for c in contacts]
+    }, limit=100)
+    return MongoJSONResponse(contacts)
+
+def build_template_briefing(user_name: str, overdue_contacts: list, due_today_contacts: list,
+                            birthdays_today: list, today_events: list) -> str:
+    """Plain briefing used when the AI briefing is unavailable"""
+    lines = [f"Good morning, {user_name}! Here's your day at a glance."]
+    if overdue_contacts:
+        names = ", ".join(c.get('name', 'Unknown') for c in overdue_contacts[:3])
+        lines.append(f"⏰ {len(overdue_contacts)} contacts are overdue - start with {names}.")
+    if due_today_contacts:
+        names = ", ".join(c.get('name', 'Unknown') for c in due_today_contacts[:3])
+        lines.append(f"📞 {len(due_today_contacts)} contacts are due today: {names}.")
+    if birthdays_today:
+        names = ", ".join(c.get('name', 'Unknown') for c in birthdays_today)
+        lines.append(f"🎂 Don't forget to congratulate {names}!")
+    if today_events:
+        lines.append(f"📅 You have {len(today_events)} appointments today.")
+    if len(lines) == 1:
+        lines.append("You're all caught up - a great day to reach out to someone just because.")
+    return "\n".join(lines)
 
 @api_router.post("/morning-briefing/generate")
-async def generate_ai_briefing(current_user: dict = Depends(get_current_user)):
+async def generate_ai_briefing(current_user: dict = Depends(get_current_user), user: Optional[dict] = Depends(get_current_user_doc)):
     """Generate AI-written morning briefing for all contacts due today or overdue"""
     try:
         today = datetime.utcnow()
         today_iso = today.isoformat()
         
-        # Get user profile for name
-        user = await db.users.find_one({"_id": ObjectId(current_user["user_id"])})
         user_name = user.get('name', 'there') if user else 'there'
         
         # Get all contacts for this user
-        all_contacts = await db.contacts.find({
+        all_contacts = await analytics_db.contacts.find({
             "user_id": current_user["user_id"],
             "pipeline_stage": {"$ne": "New"}  # Exclude New contacts
         }).to_list(500)
@@ -1298,80 +2148,86 @@ async def generate_ai_briefing(current_user: dict = Depends(get_current_user)):
                 except:
                     pass
         
-        # Build context for AI
-        briefing_context = f"""Today's date: {today.strftime('%A, %B %d, %Y')}
-        
-OVERDUE CONTACTS ({len(overdue_contacts)} people need attention):
-"""
-        for c in overdue_contacts[:10]:
-            briefing_context += f"- {c.get('name', 'Unknown')}: {c.get('days_overdue', 0)} days overdue, {c.get('pipeline_stage', 'Unknown')} frequency"
-            if c.get('job'): briefing_context += f", works as {c['job']}"
-            if c.get('hobbies'): briefing_context += f", enjoys {c['hobbies']}"
-            briefing_context += "\n"
-        
-        briefing_context += f"\nDUE TODAY ({len(due_today_contacts)} people to reach out to):\n"
-        for c in due_today_contacts[:10]:
-            briefing_context += f"- {c.get('name', 'Unknown')}: {c.get('pipeline_stage', 'Unknown')} contact"
-            if c.get('job'): briefing_context += f", works as {c['job']}"
-            briefing_context += "\n"
-        
-        briefing_context += f"\nCOMING UP THIS WEEK ({len(due_this_week_contacts)} people):\n"
-        for c in due_this_week_contacts[:10]:
-            briefing_context += f"- {c.get('name', 'Unknown')}: due in {c.get('days_until', '?')} days\n"
-        
-        if birthdays_today:
-            briefing_context += f"\n🎂 BIRTHDAYS TODAY:\n"
-            for c in birthdays_today:
-                briefing_context += f"- {c.get('name', 'Unknown')}'s birthday is TODAY!\n"
-        
-        if upcoming_birthdays:
-            briefing_context += f"\n🎁 UPCOMING BIRTHDAYS:\n"
-            for c in upcoming_birthdays[:5]:
-                briefing_context += f"- {c.get('name', 'Unknown')} in {c.get('days_until', '?')} days\n"
-        
         # Get today's calendar events
         today_date = today.strftime("%Y-%m-%d")
-        today_events = await db.calendar_events.find({
+        today_events = await analytics_db.calendar_events.find({
             "user_id": current_user["user_id"],
             "date": today_date
         }).sort("start_time", 1).to_list(20)
         
         # Get this week's calendar events
         week_end = (today + timedelta(days=7)).strftime("%Y-%m-%d")
-        week_events = await db.calendar_events.find({
+        week_events = await analytics_db.calendar_events.find({
             "user_id": current_user["user_id"],
             "date": {"$gt": today_date, "$lte": week_end}
         }).sort("date", 1).to_list(20)
         
-        if today_events:
-            briefing_context += f"\n📅 TODAY'S APPOINTMENTS ({len(today_events)} scheduled):\n"
-            for event in today_events:
-                time_str = event.get('start_time', '')
-                briefing_context += f"- {time_str}: {event.get('title', 'Untitled')}"
-                if event.get('participants'):
-                    # Get participant names
-                    participant_names = []
-                    for pid in event['participants'][:3]:
-                        try:
-                            contact = await db.contacts.find_one({"_id": ObjectId(pid)})
-                            if contact:
-                                participant_names.append(contact.get('name', 'Unknown'))
-                        except:
-                            pass
-                    if participant_names:
-                        briefing_context += f" (with {', '.join(participant_names)})"
-                briefing_context += "\n"
-        
-        if week_events:
-            briefing_context += f"\n📆 UPCOMING THIS WEEK ({len(week_events)} events):\n"
-            for event in week_events[:5]:
-                briefing_context += f"- {event.get('date', '')}: {event.get('title', 'Untitled')}\n"
+        # Build context for AI - each list is a section trimmed by priority to fit the token budget
+        overdue_items = []
+        for c in overdue_contacts[:10]:
+            item = f"- {c.get('name', 'Unknown')}: {c.get('days_overdue', 0)} days overdue, {c.get('pipeline_stage', 'Unknown')} frequency"
+            if c.get('job'): item += f", works as {c['job']}"
+            if c.get('hobbies'): item += f", enjoys {c['hobbies']}"
+            overdue_items.append(item)
         
-        # Generate AI briefing
-        prompt = f"""Write a warm, motivating morning briefing for {user_name} about their contact management for today.
-
-{briefing_context}
+        due_today_items = []
+        for c in due_today_contacts[:10]:
+            item = f"- {c.get('name', 'Unknown')}: {c.get('pipeline_stage', 'Unknown')} contact"
+            if c.get('job'): item += f", works as {c['job']}"
+            due_today_items.append(item)
+        
+        due_this_week_items = [
+            f"- {c.get('name', 'Unknown')}: due in {c.get('days_until', '?')} days"
+            for c in due_this_week_contacts[:10]
+        ]
+        birthdays_today_items = [f"- {c.get('name', 'Unknown')}'s birthday is TODAY!" for c in birthdays_today]
+        upcoming_birthday_items = [
+            f"- {c.get('name', 'Unknown')} in {c.get('days_until', '?')} days"
+            for c in upcoming_birthdays[:5]
+        ]
+        
+        # Names come from the stored participant summaries; events written before
+        # those existed share one contacts lookup
+        unsummarized = list({
+            pid for event in today_events if 'participant_summaries' not in event
+            for pid in (event.get('participants') or [])[:3]
+        })
+        fallback_summaries = {
+            summary["id"]: summary
+            for summary in await build_participant_summaries(current_user["user_id"], unsummarized)
+        }
+        
+        today_event_items = []
+        for event in today_events:
+            time_str = event.get('start_time', '')
+            item = f"- {time_str}: {event.get('title', 'Untitled')}"
+            if 'participant_summaries' in event:
+                summaries = event['participant_summaries'][:3]
+            else:
+                participants = (event.get('participants') or [])[:3]
+                summaries = [fallback_summaries[pid] for pid in participants if pid in fallback_summaries]
+            if summaries:
+                item += f" (with {', '.join(summary['name'] for summary in summaries)})"
+            today_event_items.append(item)
+        
+        week_event_items = [
+            f"- {event.get('date', '')}: {event.get('title', 'Untitled')}"
+            for event in week_events[:5]
+        ]
+        
+        builder = PromptBuilder(BRIEFING_PROMPT_TOKEN_BUDGET)
+        builder.add("intro", f"""Write a warm, motivating morning briefing for {user_name} about their contact management for today.
 
+Today's date: {today.strftime('%A, %B %d, %Y')}
+""", required=True)
+        builder.add("overdue", items=overdue_items or ["- none"], header=f"OVERDUE CONTACTS ({len(overdue_contacts)} people need attention):", priority=1, max_item_tokens=60)
+        builder.add("due_today", items=due_today_items or ["- none"], header=f"\nDUE TODAY ({len(due_today_contacts)} people to reach out to):", priority=1, max_item_tokens=40)
+        builder.add("due_this_week", items=due_this_week_items or ["- none"], header=f"\nCOMING UP THIS WEEK ({len(due_this_week_contacts)} people):", priority=3, max_item_tokens=30)
+        builder.add("birthdays_today", items=birthdays_today_items, header="\n🎂 BIRTHDAYS TODAY:", priority=2, max_item_tokens=30)
+        builder.add("upcoming_birthdays", items=upcoming_birthday_items, header="\n🎁 UPCOMING BIRTHDAYS:", priority=4, max_item_tokens=30)
+        builder.add("today_events", items=today_event_items, header=f"\n📅 TODAY'S APPOINTMENTS ({len(today_events)} scheduled):", priority=2, max_item_tokens=50)
+        builder.add("week_events", items=week_event_items, header=f"\n📆 UPCOMING THIS WEEK ({len(week_events)} events):", priority=4, max_item_tokens=40)
+        builder.add("instructions", """
 Write a personalized morning briefing that:
 1. Greets them warmly based on the time of day
 2. Summarizes what's important today (overdue contacts, due today, birthdays)
@@ -1379,18 +2235,28 @@ Write a personalized morning briefing that:
 4. Gives a brief tip for maintaining relationships
 5. Ends with an encouraging note
 
-Keep it friendly, helpful, and motivating. Use emojis sparingly. Maximum 200 words."""
-
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY', ''),
-            session_id=f"briefing_{current_user['user_id']}_{today.timestamp()}",
-            system_message="You are a friendly personal relationship coach helping someone stay connected with their network."
-        ).with_model("openai", "gpt-4.1")
+Keep it friendly, helpful, and motivating. Use emojis sparingly. Maximum 200 words.""", required=True)
         
-        response = await chat.send_message(UserMessage(text=prompt))
+        # Generate AI briefing
+        prompt, prompt_report = builder.build()
+        llm_gateway.metrics.record_prompt_report("briefing", prompt_report)
+        logging.debug(f"Briefing prompt tokens: {prompt_report}")
+
+        try:
+            response = await llm_gateway.complete(
+                prompt,
+                system_message="You are a friendly personal relationship coach helping someone stay connected with their network.",
+                session_prefix=f"briefing_{current_user['user_id']}"
+            )
+            briefing_text = response.strip()
+        except LLMUnavailableError as e:
+            logging.warning(f"AI briefing unavailable, using template briefing: {str(e)}")
+            briefing_text = build_template_briefing(
+                user_name, overdue_contacts, due_today_contacts, birthdays_today, today_events
+            )
         
         return {
-            "briefing": response.strip(),
+            "briefing": briefing_text,
             "stats": {
                 "overdue_count": len(overdue_contacts),
                 "due_today_count": len(due_today_contacts),
@@ -1412,6 +2278,121 @@ Keep it friendly, helpful, and motivating. Use emojis sparingly. Maximum 200 wor
 
 # ============ Calendar Event Routes ============
 
+def contact_picture_ref(contact_id: str, picture: Optional[str]) -> Optional[str]:
+    """Versioned URL of a contact's picture, so clients can cache it indefinitely"""
+    if not picture:
+        return None
+    version = hashlib.sha1(picture.encode()).hexdigest()[:10]
+    return f"/api/contacts/{contact_id}/picture?v={version}"
+
+def participant_summary(contact: dict) -> dict:
+    contact_id = str(contact["_id"])
+    return {
+        "id": contact_id,
+        "name": contact.get("name", "Unknown"),
+        "picture_ref": contact_picture_ref(contact_id, contact.get("profile_picture"))
+    }
+
+async def build_participant_summaries(user_id: str, participant_ids: List[str]) -> List[dict]:
+    """Summaries of the user's contacts among participant_ids, in participant order (unknown ids are skipped)"""
+    object_ids = [ObjectId(cid) for cid in participant_ids if ObjectId.is_valid(cid)]
+    if not object_ids:
+        return []
+    contacts = {}
+    async for contact in db.contacts.find(
+        {"_id": {"$in": object_ids}, "user_id": user_id},
+        {"name": 1, "profile_picture": 1}
+    ):
+        contacts[str(contact["_id"])] = contact
+    return [participant_summary(contacts[cid]) for cid in participant_ids if cid in contacts]
+
+async def attach_participant_details(user_id: str, events: List[dict]):
+    """Expose the stored participant summaries as `participant_details`.
+    
+    Events written before summaries existed get them computed with a single
+    contacts query and stored, so later reads stay single-collection."""
+    missing = [event for event in events if event.get('participants') and 'participant_summaries' not in event]
+    if missing:
+        wanted = list({cid for event in missing for cid in event['participants']})
+        summaries = {summary["id"]: summary for summary in await build_participant_summaries(user_id, wanted)}
+        operations = []
+        for event in missing:
+            event['participant_summaries'] = [summaries[cid] for cid in event['participants'] if cid in summaries]
+            operations.append(UpdateOne(
+                {"_id": ObjectId(event["id"]), "participant_summaries": {"$exists": False}},
+                {"$set": {"participant_summaries": event['participant_summaries']}}
+            ))
+        await db.calendar_events.bulk_write(operations, ordered=False)
+    for event in events:
+        if event.get('participants'):
+            event['participant_details'] = event.get('participant_summaries', [])
+
+def event_participant_ids(event: dict) -> set:
+    """Ids of an event's known participants (raw ids for events stored before summaries existed)"""
+    if 'participant_summaries' in event:
+        return {summary["id"] for summary in event['participant_summaries']}
+    return set(event.get('participants') or [])
+
+def meeting_interaction(user_id: str, event_id: str, contact_id: str, event: dict, seq: int) -> dict:
+    """Logbook entry for a participant of a calendar event"""
+    return {
+        "contact_id": contact_id,
+        "user_id": user_id,
+        "interaction_type": "Scheduled Meeting",
+        "date": event['date'],
+        "notes": f"📅 {event['title']}" + (f" - {event['description']}" if event.get('description') else ""),
+        "calendar_event_id": event_id,
+        "created_at": datetime.utcnow().isoformat(),
+        "sync_seq": seq
+    }
+
+async def sync_meeting_interactions(user_id: str, event_id: str, before: dict, after: dict, write: SyncWrite):
+    """Bring an event's logbook entries in line with an update: add entries for new
+    participants, remove them for dropped ones, and refresh date/notes on the rest.
+    Runs inside the event update's sync write."""
+    seq = write.seq
+    old_ids, new_ids = event_participant_ids(before), event_participant_ids(after)
+    added, removed, kept = new_ids - old_ids, old_ids - new_ids, old_ids & new_ids
+    
+    if added:
+        await db.interactions.insert_many(
+            [meeting_interaction(user_id, event_id, cid, after, seq) for cid in added], ordered=False
+        )
+    if removed:
+        await delete_with_tombstones("interactions", user_id, {
+            "user_id": user_id, "calendar_event_id": event_id, "contact_id": {"$in": list(removed)}
+        }, seq)
+    details_changed = any(before.get(field) != after.get(field) for field in ("date", "title", "description"))
+    if kept and details_changed:
+        template = meeting_interaction(user_id, event_id, "", after, seq)
+        await db.interactions.update_many(
+            {"user_id": user_id, "calendar_event_id": event_id, "contact_id": {"$in": list(kept)}},
+            {"$set": {"date": template["date"], "notes": template["notes"], "sync_seq": seq}}
+        )
+    if added or removed or (kept and details_changed):
+        write.touch("interactions")
+
+async def propagate_contact_summary(user_id: str, contacts: List[dict]):
+    """Push changed names/pictures into the participant summaries of the contacts' events"""
+    if not contacts:
+        return
+    async with sync_write(user_id) as write:
+        operations = []
+        for contact in contacts:
+            summary = participant_summary(contact)
+            operations.append(UpdateMany(
+                {"user_id": user_id, "participant_summaries.id": summary["id"]},
+                {"$set": {
+                    "participant_summaries.$[p].name": summary["name"],
+                    "participant_summaries.$[p].picture_ref": summary["picture_ref"],
+                    "sync_seq": write.seq
+                }},
+                array_filters=[{"p.id": summary["id"]}]
+            ))
+        result = await db.calendar_events.bulk_write(operations, ordered=False)
+        if result.modified_count:
+            write.touch("calendar_events")
+
 @api_router.post("/calendar-events", response_model=dict)
 async def create_calendar_event(event: CalendarEventCreate, current_user: dict = Depends(get_current_user)):
     """Create a new calendar event and optionally add to participant's interaction history"""
@@ -1421,34 +2402,27 @@ async def create_calendar_event(event: CalendarEventCreate, current_user: dict =
         event_dict['synced_to_google'] = False
         event_dict['created_at'] = datetime.utcnow().isoformat()
         event_dict['updated_at'] = datetime.utcnow().isoformat()
-        
-        result = await db.calendar_events.insert_one(event_dict)
-        event_dict['id'] = str(result.inserted_id)
-        if '_id' in event_dict:
-            del event_dict['_id']
-        
-        # Add to interaction history for each participant (as a future/scheduled meeting)
-        if event.participants:
-            for contact_id in event.participants:
-                try:
-                    # Verify contact exists
-                    contact = await db.contacts.find_one({
-                        "_id": ObjectId(contact_id),
-                        "user_id": current_user["user_id"]
-                    })
-                    if contact:
-                        interaction_dict = {
-                            "contact_id": contact_id,
-                            "user_id": current_user["user_id"],
-                            "interaction_type": "Scheduled Meeting",
-                            "date": event.date,
-                            "notes": f"📅 {event.title}" + (f" - {event.description}" if event.description else ""),
-                            "calendar_event_id": event_dict['id'],
-                            "created_at": datetime.utcnow().isoformat()
-                        }
-                        await db.interactions.insert_one(interaction_dict)
-                except Exception as e:
-                    logging.warning(f"Could not add interaction for contact {contact_id}: {e}")
+        # One query validates every participant; unknown ids get no summary and no logbook entry
+        event_dict['participant_summaries'] = await build_participant_summaries(current_user["user_id"], event.participants)
+        event_id = ObjectId()
+        
+        async with sync_write(current_user["user_id"]) as write:
+            event_dict['sync_seq'] = write.seq
+            # Add to interaction history for each participant (as a future/scheduled meeting)
+            interactions = [
+                meeting_interaction(current_user["user_id"], str(event_id), summary["id"], event_dict, write.seq)
+                for summary in event_dict['participant_summaries']
+            ]
+            
+            async def write_event(session):
+                await db.calendar_events.insert_one({**event_dict, "_id": event_id}, session=session)
+                if interactions:
+                    # Copies, so a retried transaction doesn't reuse the _ids assigned by a failed attempt
+                    await db.interactions.insert_many([dict(item) for item in interactions], ordered=False, session=session)
+            
+            await run_in_transaction(write_event)
+            write.touch("calendar_events", "interactions")
+        event_dict['id'] = str(event_id)
         
         return event_dict
     except Exception as e:
@@ -1457,12 +2431,20 @@ async def create_calendar_event(event: CalendarEventCreate, current_user: dict =
 
 @api_router.get("/calendar-events", response_model=List[dict])
 async def get_calendar_events(
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Get all calendar events, optionally filtered by date range"""
     try:
+        # Participant summaries are kept current on the events themselves
+        etag, not_modified = await conditional_list_response(
+            request, current_user["user_id"], ("calendar_events",), variant=f"{start_date}:{end_date}"
+        )
+        if not_modified:
+            return not_modified
+        
         query = {"user_id": current_user["user_id"]}
         
         if start_date and end_date:
@@ -1472,46 +2454,27 @@ async def get_calendar_events(
         elif end_date:
             query["date"] = {"$lte": end_date}
         
-        events = await db.calendar_events.find(query).sort("date", 1).to_list(500)
+        events = await find_public(db.calendar_events, query, sort=[("date", 1)], limit=500)
+        await attach_participant_details(current_user["user_id"], events)
         
-        # Enrich with participant details
-        result = []
-        for event in events:
-            event_data = serialize_doc(event)
-            if event_data.get('participants'):
-                participant_details = []
-                for contact_id in event_data['participants']:
-                    try:
-                        contact = await db.contacts.find_one({"_id": ObjectId(contact_id)})
-                        if contact:
-                            participant_details.append({
-                                "id": str(contact["_id"]),
-                                "name": contact.get("name", "Unknown"),
-                                "profile_picture": contact.get("profile_picture")
-                            })
-                    except:
-                        pass
-                event_data['participant_details'] = participant_details
-            result.append(event_data)
-        
-        return result
+        return MongoJSONResponse(events, headers={"ETag": etag})
     except Exception as e:
         logging.error(f"Error fetching calendar events: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.get("/calendar-events/today", response_model=List[dict])
-async def get_today_events(current_user: dict = Depends(get_current_user)):
+async def get_today_events(request: Request, current_user: dict = Depends(get_current_user)):
     """Get today's calendar events"""
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    return await get_calendar_events(start_date=today, end_date=today, current_user=current_user)
+    return await get_calendar_events(request, start_date=today, end_date=today, current_user=current_user)
 
 @api_router.get("/calendar-events/week", response_model=List[dict])
-async def get_week_events(current_user: dict = Depends(get_current_user)):
+async def get_week_events(request: Request, current_user: dict = Depends(get_current_user)):
     """Get this week's calendar events"""
     today = datetime.utcnow()
     week_start = today.strftime("%Y-%m-%d")
     week_end = (today + timedelta(days=7)).strftime("%Y-%m-%d")
-    return await get_calendar_events(start_date=week_start, end_date=week_end, current_user=current_user)
+    return await get_calendar_events(request, start_date=week_start, end_date=week_end, current_user=current_user)
 
 @api_router.get("/calendar-events/{event_id}", response_model=dict)
 async def get_calendar_event(event_id: str, current_user: dict = Depends(get_current_user)):
@@ -1525,22 +2488,7 @@ async def get_calendar_event(event_id: str, current_user: dict = Depends(get_cur
             raise HTTPException(status_code=404, detail="Event not found")
         
         event_data = serialize_doc(event)
-        
-        # Enrich with participant details
-        if event_data.get('participants'):
-            participant_details = []
-            for contact_id in event_data['participants']:
-                try:
-                    contact = await db.contacts.find_one({"_id": ObjectId(contact_id)})
-                    if contact:
-                        participant_details.append({
-                            "id": str(contact["_id"]),
-                            "name": contact.get("name", "Unknown"),
-                            "profile_picture": contact.get("profile_picture")
-                        })
-                except:
-                    pass
-            event_data['participant_details'] = participant_details
+        await attach_participant_details(current_user["user_id"], [event_data])
         
         return event_data
     except HTTPException:
@@ -1554,16 +2502,26 @@ async def update_calendar_event(event_id: str, event_update: CalendarEventUpdate
     try:
         update_data = {k: v for k, v in event_update.dict().items() if v is not None}
         update_data['updated_at'] = datetime.utcnow().isoformat()
+        if 'participants' in update_data:
+            update_data['participant_summaries'] = await build_participant_summaries(
+                current_user["user_id"], update_data['participants']
+            )
         
-        result = await db.calendar_events.update_one(
-            {"_id": ObjectId(event_id), "user_id": current_user["user_id"]},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Event not found")
-        
-        updated_event = await db.calendar_events.find_one({"_id": ObjectId(event_id)})
+        async with sync_write(current_user["user_id"]) as write:
+            update_data['sync_seq'] = write.seq
+            before = await db.calendar_events.find_one_and_update(
+                {"_id": ObjectId(event_id), "user_id": current_user["user_id"]},
+                {"$set": update_data},
+                return_document=ReturnDocument.BEFORE
+            )
+            
+            if before is None:
+                raise HTTPException(status_code=404, detail="Event not found")
+            write.touch("calendar_events")
+            updated_event = {**before, **update_data}
+            
+            if 'participants' in update_data or any(field in update_data for field in ("date", "title", "description")):
+                await sync_meeting_interactions(current_user["user_id"], event_id, before, updated_event, write)
         return serialize_doc(updated_event)
     except HTTPException:
         raise
@@ -1574,15 +2532,22 @@ async def update_calendar_event(event_id: str, event_update: CalendarEventUpdate
 async def delete_calendar_event(event_id: str, current_user: dict = Depends(get_current_user)):
     """Delete a calendar event"""
     try:
-        # Also delete related interactions
-        await db.interactions.delete_many({"calendar_event_id": event_id})
-        
-        result = await db.calendar_events.delete_one({
-            "_id": ObjectId(event_id),
-            "user_id": current_user["user_id"]
-        })
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Event not found")
+        async with sync_write(current_user["user_id"]) as write:
+            # Also delete related interactions
+            deleted_interactions = await delete_with_tombstones("interactions", current_user["user_id"], {
+                "user_id": current_user["user_id"],
+                "calendar_event_id": event_id
+            }, write.seq)
+            if deleted_interactions:
+                write.touch("interactions")
+            
+            deleted_count = await delete_with_tombstones("calendar_events", current_user["user_id"], {
+                "_id": ObjectId(event_id),
+                "user_id": current_user["user_id"]
+            }, write.seq)
+            if deleted_count == 0:
+                raise HTTPException(status_code=404, detail="Event not found")
+            write.touch("calendar_events")
         return {"message": "Event deleted successfully"}
     except HTTPException:
         raise
@@ -1590,34 +2555,22 @@ async def delete_calendar_event(event_id: str, current_user: dict = Depends(get_
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.get("/calendar-events/by-date/{date}", response_model=List[dict])
-async def get_events_by_date(date: str, current_user: dict = Depends(get_current_user)):
+async def get_events_by_date(date: str, request: Request, current_user: dict = Depends(get_current_user)):
     """Get all events for a specific date (day view)"""
     try:
-        events = await db.calendar_events.find({
+        etag, not_modified = await conditional_list_response(
+            request, current_user["user_id"], ("calendar_events",), variant=date
+        )
+        if not_modified:
+            return not_modified
+        
+        events = await find_public(db.calendar_events, {
             "user_id": current_user["user_id"],
             "date": date
-        }).sort("start_time", 1).to_list(100)
-        
-        result = []
-        for event in events:
-            event_data = serialize_doc(event)
-            if event_data.get('participants'):
-                participant_details = []
-                for contact_id in event_data['participants']:
-                    try:
-                        contact = await db.contacts.find_one({"_id": ObjectId(contact_id)})
-                        if contact:
-                            participant_details.append({
-                                "id": str(contact["_id"]),
-                                "name": contact.get("name", "Unknown"),
-                                "profile_picture": contact.get("profile_picture")
-                            })
-                    except:
-                        pass
-                event_data['participant_details'] = participant_details
-            result.append(event_data)
+        }, sort=[("start_time", 1)], limit=100)
+        await attach_participant_details(current_user["user_id"], events)
         
-        return result
+        return MongoJSONResponse(events, headers={"ETag": etag})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -1633,12 +2586,12 @@ async def get_contact_calendar_events(contact_id: str, current_user: dict = Depe
         if not contact:
             raise HTTPException(status_code=404, detail="Contact not found")
         
-        events = await db.calendar_events.find({
+        events = await find_public(db.calendar_events, {
             "user_id": current_user["user_id"],
             "participants": contact_id
-        }).sort("date", -1).to_list(100)
+        }, sort=[("date", -1)], limit=100)
         
-        return [serialize_doc(e) for e in events]
+        return MongoJSONResponse(events)
     except HTTPException:
         raise
     except Exception as e:
@@ -1803,7 +2756,7 @@ async def get_google_calendar_service(user_id: str):
         
         # Refresh if expired
         if credentials.expired and credentials.refresh_token:
-            credentials.refresh(GoogleRequest())
+            credentials.refresh(GoogleRequest(session=get_google_session()))
             # Update stored tokens
             await db.google_calendar_tokens.update_one(
                 {"user_id": user_id},
@@ -1814,7 +2767,8 @@ async def get_google_calendar_service(user_id: str):
                 }}
             )
         
-        service = build('calendar', 'v3', credentials=credentials)
+        service = build('calendar', 'v3', http=AuthorizedHttp(credentials, http=get_google_http()),
+                        cache_discovery=False)
         return service
     except Exception as e:
         logging.error(f"Error getting Google Calendar service: {e}")
@@ -1874,14 +2828,17 @@ async def sync_event_to_google(event_id: str, current_user: dict = Depends(get_c
             ).execute()
             
             # Store Google event ID
-            await db.calendar_events.update_one(
-                {"_id": ObjectId(event_id)},
-                {"$set": {
-                    "google_event_id": result['id'],
-                    "synced_to_google": True,
-                    "updated_at": datetime.utcnow().isoformat()
-                }}
-            )
+            async with sync_write(current_user["user_id"]) as write:
+                await db.calendar_events.update_one(
+                    {"_id": ObjectId(event_id)},
+                    {"$set": {
+                        "google_event_id": result['id'],
+                        "synced_to_google": True,
+                        "updated_at": datetime.utcnow().isoformat(),
+                        "sync_seq": write.seq
+                    }}
+                )
+                write.touch("calendar_events")
         
         return {"success": True, "google_event_id": result['id'], "message": "Event synced to Google Calendar"}
     except Exception as e:
@@ -1919,52 +2876,57 @@ async def import_from_google_calendar(
         google_events = events_result.get('items', [])
         imported_count = 0
         
-        for g_event in google_events:
-            # Check if already imported
-            existing = await db.calendar_events.find_one({
-                "user_id": current_user["user_id"],
-                "google_event_id": g_event['id']
-            })
-            
-            if existing:
-                continue
-            
-            # Parse date/time
-            start = g_event.get('start', {})
-            end = g_event.get('end', {})
-            
-            if 'dateTime' in start:
-                date = start['dateTime'][:10]
-                start_time = start['dateTime'][11:16]
-                end_time = end.get('dateTime', start['dateTime'])[11:16]
-                all_day = False
-            else:
-                date = start.get('date', datetime.utcnow().strftime('%Y-%m-%d'))
-                start_time = '00:00'
-                end_time = '23:59'
-                all_day = True
-            
-            # Create local event
-            event_dict = {
-                "user_id": current_user["user_id"],
-                "title": g_event.get('summary', 'Untitled'),
-                "description": g_event.get('description', ''),
-                "date": date,
-                "start_time": start_time,
-                "end_time": end_time,
-                "all_day": all_day,
-                "participants": [],
-                "reminder_minutes": 30,
-                "color": "#4285F4",  # Google Blue
-                "google_event_id": g_event['id'],
-                "synced_to_google": True,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+        # One seq for the whole import
+        async with sync_write(current_user["user_id"]) as write:
+            for g_event in google_events:
+                # Check if already imported
+                existing = await db.calendar_events.find_one({
+                    "user_id": current_user["user_id"],
+                    "google_event_id": g_event['id']
+                })
+                
+                if existing:
+                    continue
+                
+                # Parse date/time
+                start = g_event.get('start', {})
+                end = g_event.get('end', {})
+                
+                if 'dateTime' in start:
+                    date = start['dateTime'][:10]
+                    start_time = start['dateTime'][11:16]
+                    end_time = end.get('dateTime', start['dateTime'])[11:16]
+                    all_day = False
+                else:
+                    date = start.get('date', datetime.utcnow().strftime('%Y-%m-%d'))
+                    start_time = '00:00'
+                    end_time = '23:59'
+                    all_day = True
+                
+                # Create local event
+                event_dict = {
+                    "user_id": current_user["user_id"],
+                    "title": g_event.get('summary', 'Untitled'),
+                    "description": g_event.get('description', ''),
+                    "date": date,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "all_day": all_day,
+                    "participants": [],
+                    "reminder_minutes": 30,
+                    "color": "#4285F4",  # Google Blue
+                    "google_event_id": g_event['id'],
+                    "synced_to_google": True,
+                    "created_at": datetime.utcnow().isoformat(),
+                    "updated_at": datetime.utcnow().isoformat(),
+                    "sync_seq": write.seq
+                }
+                
+                await db.calendar_events.insert_one(event_dict)
+                imported_count += 1
             
-            await db.calendar_events.insert_one(event_dict)
-            imported_count += 1
-        
+            if imported_count:
+                write.touch("calendar_events")
         return {
             "success": True,
             "imported_count": imported_count,
@@ -2023,79 +2985,86 @@ async def full_sync_google_calendar(
         pushed_to_google = 0
         deleted_locally = 0
         
-        # Process Google events
-        for g_event in google_events:
-            google_event_ids.add(g_event['id'])
-            
-            # Check if event exists locally
-            existing = await db.calendar_events.find_one({
-                "user_id": current_user["user_id"],
-                "google_event_id": g_event['id']
-            })
+        async with sync_write(current_user["user_id"]) as write:
+            # Bumped on release, after whatever part of the import got written
+            write.touch("calendar_events")
+            seq = write.seq
             
-            # Parse date/time
-            start = g_event.get('start', {})
-            end = g_event.get('end', {})
-            
-            if 'dateTime' in start:
-                date = start['dateTime'][:10]
-                start_time = start['dateTime'][11:16]
-                end_time = end.get('dateTime', start['dateTime'])[11:16] if 'dateTime' in end else start_time
-                all_day = False
-            else:
-                date = start.get('date', now.strftime('%Y-%m-%d'))
-                start_time = '00:00'
-                end_time = '23:59'
-                all_day = True
-            
-            event_data = {
-                "title": g_event.get('summary', 'Untitled'),
-                "description": g_event.get('description', ''),
-                "date": date,
-                "start_time": start_time,
-                "end_time": end_time,
-                "all_day": all_day,
-                "google_event_id": g_event['id'],
-                "synced_to_google": True,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            
-            if existing:
-                # Update local event with Google data
-                # Compare timestamps to see which is newer
-                google_updated = g_event.get('updated', '')
-                local_updated = existing.get('updated_at', '')
+            # Process Google events
+            for g_event in google_events:
+                google_event_ids.add(g_event['id'])
                 
-                # Always update from Google to keep in sync
-                await db.calendar_events.update_one(
-                    {"_id": existing["_id"]},
-                    {"$set": event_data}
-                )
-                updated_from_google += 1
-            else:
-                # Import new event from Google
-                event_data.update({
+                # Check if event exists locally
+                existing = await db.calendar_events.find_one({
                     "user_id": current_user["user_id"],
-                    "participants": [],
-                    "reminder_minutes": 30,
-                    "color": "#4285F4",  # Google Blue
-                    "created_at": datetime.utcnow().isoformat()
+                    "google_event_id": g_event['id']
                 })
-                await db.calendar_events.insert_one(event_data)
-                imported_count += 1
-        
-        # Find local events that were deleted from Google (synced events only)
-        local_synced_events = await db.calendar_events.find({
-            "user_id": current_user["user_id"],
-            "synced_to_google": True,
-            "google_event_id": {"$exists": True, "$ne": None}
-        }).to_list(500)
-        
-        for local_event in local_synced_events:
-            if local_event.get('google_event_id') and local_event['google_event_id'] not in google_event_ids:
-                # Event was deleted from Google, delete locally too
-                await db.calendar_events.delete_one({"_id": local_event["_id"]})
-                deleted_locally += 1
+                
+                # Parse date/time
+                start = g_event.get('start', {})
+                end = g_event.get('end', {})
+                
+                if 'dateTime' in start:
+                    date = start['dateTime'][:10]
+                    start_time = start['dateTime'][11:16]
+                    end_time = end.get('dateTime', start['dateTime'])[11:16] if 'dateTime' in end else start_time
+                    all_day = False
+                else:
+                    date = start.get('date', now.strftime('%Y-%m-%d'))
+                    start_time = '00:00'
+                    end_time = '23:59'
+                    all_day = True
+                
+                event_data = {
+                    "title": g_event.get('summary', 'Untitled'),
+                    "description": g_event.get('description', ''),
+                    "date": date,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "all_day": all_day,
+                    "google_event_id": g_event['id'],
+                    "synced_to_google": True,
+                    "updated_at": datetime.utcnow().isoformat(),
+                    "sync_seq": seq
+                }
+                
+                if existing:
+                    # Update local event with Google data
+                    # Compare timestamps to see which is newer
+                    google_updated = g_event.get('updated', '')
+                    local_updated = existing.get('updated_at', '')
+                    
+                    # Always update from Google to keep in sync
+                    await db.calendar_events.update_one(
+                        {"_id": existing["_id"]},
+                        {"$set": event_data}
+                    )
+                    updated_from_google += 1
+                else:
+                    # Import new event from Google
+                    event_data.update({
+                        "user_id": current_user["user_id"],
+                        "participants": [],
+                        "reminder_minutes": 30,
+                        "color": "#4285F4",  # Google Blue
+                        "created_at": datetime.utcnow().isoformat()
+                    })
+                    await db.calendar_events.insert_one(event_data)
+                    imported_count += 1
+            
+            # Find local events that were deleted from Google (synced events only)
+            local_synced_events = await db.calendar_events.find({
+                "user_id": current_user["user_id"],
+                "synced_to_google": True,
+                "google_event_id": {"$exists": True, "$ne": None}
+            }).to_list(500)
+            
+            for local_event in local_synced_events:
+                if local_event.get('google_event_id') and local_event['google_event_id'] not in google_event_ids:
+                    # Event was deleted from Google, delete locally too
+                    deleted_locally += await delete_with_tombstones(
+                        "calendar_events", current_user["user_id"], {"_id": local_event["_id"]}, seq
+                    )
         
         # Push unsynced local events to Google
         unsynced_events = await db.calendar_events.find({
@@ -2131,15 +3100,18 @@ async def full_sync_google_calendar(
                     body=google_event
                 ).execute()
                 
-                # Update local event with Google ID
-                await db.calendar_events.update_one(
-                    {"_id": local_event["_id"]},
-                    {"$set": {
-                        "google_event_id": result['id'],
-                        "synced_to_google": True,
-                        "updated_at": datetime.utcnow().isoformat()
-                    }}
-                )
+                # Update local event with Google ID; a seq per event, as pushes are slow
+                async with sync_write(current_user["user_id"]) as write:
+                    await db.calendar_events.update_one(
+                        {"_id": local_event["_id"]},
+                        {"$set": {
+                            "google_event_id": result['id'],
+                            "synced_to_google": True,
+                            "updated_at": datetime.utcnow().isoformat(),
+                            "sync_seq": write.seq
+                        }}
+                    )
+                    write.touch("calendar_events")
                 pushed_to_google += 1
             except Exception as e:
                 logging.warning(f"Could not push event to Google: {e}")
@@ -2181,11 +3153,20 @@ async def update_google_calendar_event(
         # Update local event
         update_data = {k: v for k, v in event_update.dict().items() if v is not None}
         update_data['updated_at'] = datetime.utcnow().isoformat()
+        if 'participants' in update_data:
+            update_data['participant_summaries'] = await build_participant_summaries(
+                current_user["user_id"], update_data['participants']
+            )
         
-        await db.calendar_events.update_one(
-            {"_id": ObjectId(event_id)},
-            {"$set": update_data}
-        )
+        async with sync_write(current_user["user_id"]) as write:
+            update_data['sync_seq'] = write.seq
+            await db.calendar_events.update_one(
+                {"_id": ObjectId(event_id)},
+                {"$set": update_data}
+            )
+            write.touch("calendar_events")
+            await sync_meeting_interactions(current_user["user_id"], event_id, existing, {**existing, **update_data},
+                                            write)
         
         # If synced to Google, update there too
         if existing.get('google_event_id') and existing.get('synced_to_google'):
@@ -2266,10 +3247,15 @@ async def delete_google_calendar_event(event_id: str, current_user: dict = Depen
                     logging.warning(f"Could not delete event from Google: {e}")
         
         # Delete locally
-        await db.calendar_events.delete_one({"_id": ObjectId(event_id)})
-        
-        # Also delete related interactions
-        await db.interactions.delete_many({"calendar_event_id": event_id})
+        async with sync_write(current_user["user_id"]) as write:
+            await delete_with_tombstones("calendar_events", current_user["user_id"], {"_id": ObjectId(event_id)}, write.seq)
+            
+            # Also delete related interactions
+            await delete_with_tombstones("interactions", current_user["user_id"], {
+                "user_id": current_user["user_id"],
+                "calendar_event_id": event_id
+            }, write.seq)
+            write.touch("calendar_events", "interactions")
         
         return {"success": True, "message": "Event deleted from app and Google Calendar"}
     except Exception as e:
@@ -2357,15 +3343,88 @@ async def schedule_reminder(reminder: ReminderCreate, current_user: dict = Depen
     """Schedule a reminder for an event"""
     try:
         reminder_dict = reminder.dict()
+        try:
+            reminder_dict["reminder_at"] = parse_reminder_time(reminder.reminder_time)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="reminder_time must be an ISO datetime")
         reminder_dict["user_id"] = current_user["user_id"]
         reminder_dict["status"] = "pending"
         reminder_dict["created_at"] = datetime.utcnow().isoformat()
         
         result = await db.reminders.insert_one(reminder_dict)
+        if REMINDER_DISPATCH_ENABLED:
+            reminder_dispatcher.schedule(result.inserted_id, reminder_dict["reminder_at"])
         return {"success": True, "reminder_id": str(result.inserted_id)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# ============ Sync Routes ============
+
+@api_router.get("/sync/changes")
+async def get_sync_changes(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Documents upserted and deleted since `since`, across all synced collections.
+    
+    A missing, expired or pre-reset cursor answers with reset=true: the client
+    should refetch the full lists and continue from the returned cursor. While
+    has_more is true the client should immediately call again with the new cursor.
+    """
+    user_id = current_user["user_id"]
+    counters = await db.collection_versions.find_one({"_id": user_id}) or {}
+    # Seqs above this may belong to writes still in flight (see sync_seq.py)
+    current_seq = committed_seq(counters, datetime.utcnow())
+    
+    parsed = decode_sync_cursor(since)
+    reset_response = {"reset": True, "cursor": encode_sync_cursor(current_seq), "has_more": False, "changes": {}, "deleted": {}}
+    if parsed is None:
+        return reset_response
+    since_seq, issued_at = parsed
+    expired = datetime.utcnow().timestamp() - issued_at > SYNC_TOMBSTONE_TTL_DAYS * 86400
+    if expired or since_seq < counters.get("sync_reset_seq", 0):
+        return reset_response
+    
+    # Cap at the committed seq read above; later writes go to the next call
+    seq_range = {"$gt": since_seq, "$lte": current_seq}
+    cursor_seq = current_seq
+    changes = {}
+    for name in SYNC_COLLECTIONS:
+        docs = await find_public(db[name], {"user_id": user_id, "sync_seq": seq_range},
+                                 sort=[("sync_seq", 1)], limit=SYNC_PAGE_SIZE)
+        if len(docs) == SYNC_PAGE_SIZE:
+            # Stop before the last sequence number, which may continue past this page
+            if docs[0]["sync_seq"] == docs[-1]["sync_seq"]:
+                # A single bulk write larger than a page: cheaper to start over
+                return reset_response
+            cursor_seq = min(cursor_seq, docs[-1]["sync_seq"] - 1)
+        changes[name] = docs
+    
+    tombstones = await db.sync_tombstones.find(
+        {"user_id": user_id, "sync_seq": seq_range},
+        {"_id": 0, "collection": 1, "doc_id": 1, "sync_seq": 1}
+    ).sort("sync_seq", 1).to_list(SYNC_PAGE_SIZE)
+    if len(tombstones) == SYNC_PAGE_SIZE:
+        if tombstones[0]["sync_seq"] == tombstones[-1]["sync_seq"]:
+            return reset_response
+        cursor_seq = min(cursor_seq, tombstones[-1]["sync_seq"] - 1)
+    
+    deleted = {name: [] for name in SYNC_COLLECTIONS}
+    for tombstone in tombstones:
+        if tombstone["sync_seq"] <= cursor_seq:
+            deleted[tombstone["collection"]].append(tombstone["doc_id"])
+    changes = {name: [doc for doc in docs if doc["sync_seq"] <= cursor_seq] for name, docs in changes.items()}
+    
+    has_more = cursor_seq < current_seq
+    # A partial page keeps the original issue time, so tombstones it has not seen yet can't expire unnoticed
+    next_cursor = f"{cursor_seq}.{issued_at}" if has_more else encode_sync_cursor(cursor_seq)
+    return MongoJSONResponse({
+        "reset": False,
+        "cursor": next_cursor,
+        "has_more": has_more,
+        "changes": changes,
+        "deleted": deleted
+    })
+
 # ============ Include Router & Middleware ============
 
 app.include_router(api_router)
@@ -2377,6 +3436,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Prometheus scrape endpoint; requires `Authorization: Bearer $METRICS_TOKEN` when that is set"""
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body = metrics.render() + render_llm_metrics(llm_gateway.metrics.snapshot(), llm_gateway.breaker.state,
+                                                 worker=WORKER_ID)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 # Configure logging
 logging.basicConfig(
@@ -2385,6 +3458,758 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ============ Background Workers ============
+
+DRAFT_PREGEN_ENABLED = os.environ.get('DRAFT_PREGEN_ENABLED', 'true').lower() == 'true'
+DRAFT_PREGEN_HOUR_UTC = int(os.environ.get('DRAFT_PREGEN_HOUR_UTC', 2))  # Off-peak start hour
+DRAFT_PREGEN_MAX_PER_MINUTE = int(os.environ.get('DRAFT_PREGEN_MAX_PER_MINUTE', 20))
+DRAFT_PREGEN_LOOKAHEAD_HOURS = int(os.environ.get('DRAFT_PREGEN_LOOKAHEAD_HOURS', 24))
+DRAFT_PREGEN_BATCH_SIZE = 100
+
+async def pregenerate_due_drafts() -> int:
+    """Create one pending draft for every contact due within the lookahead window.
+    
+    Contacts that already have a pending draft are skipped. Generation is paced
+    to DRAFT_PREGEN_MAX_PER_MINUTE across all users so LLM load is spread out.
+    Returns the number of drafts created.
+    """
+    now = datetime.utcnow()
+    window_end = now + timedelta(hours=DRAFT_PREGEN_LOOKAHEAD_HOURS)
+    min_interval = 60.0 / max(DRAFT_PREGEN_MAX_PER_MINUTE, 1)
+    user_settings_cache = {}
+    created = 0
+    last_id = None
+    
+    while True:
+        query = {
+            "next_due": {"$gte": now.isoformat(), "$lte": window_end.isoformat()},
+            "pipeline_stage": {"$ne": "New"}
+        }
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        # Page by _id instead of holding a cursor open while generation is throttled
+        contacts = await analytics_db.contacts.find(query).sort("_id", 1).to_list(DRAFT_PREGEN_BATCH_SIZE)
+        if not contacts:
+            break
+        last_id = contacts[-1]["_id"]
+        
+        # One query per batch to find contacts that already have a pending draft
+        contact_ids = [str(c["_id"]) for c in contacts]
+        already_drafted = set(await db.drafts.distinct("contact_id", {
+            "contact_id": {"$in": contact_ids},
+            "status": "pending"
+        }))
+        
+        for contact in contacts:
+            if str(contact["_id"]) in already_drafted:
+                continue
+            if llm_gateway.breaker.state == llm_gateway.breaker.OPEN:
+                logging.warning("LLM circuit open, stopping draft pre-generation for this run")
+                return created
+            
+            user_id = contact["user_id"]
+            if user_id not in user_settings_cache:
+                try:
+                    user = await db.users.find_one({"_id": ObjectId(user_id)})
+                except Exception:
+                    user = None
+                user_settings_cache[user_id] = get_draft_user_settings(user)
+            
+            started = asyncio.get_running_loop().time()
+            try:
+                await generate_and_store_draft(contact, user_id, user_settings_cache[user_id], auto_generated=True)
+                created += 1
+            except LLMUnavailableError as e:
+                logging.warning(f"LLM unavailable, no draft pre-generated for contact {contact['_id']}: {e}")
+            except Exception as e:
+                logging.warning(f"Could not pre-generate draft for contact {contact['_id']}: {e}")
+            
+            # Global throttle between generations
+            elapsed = asyncio.get_running_loop().time() - started
+            if elapsed < min_interval:
+                await asyncio.sleep(min_interval - elapsed)
+    
+    return created
+
+def seconds_until_hour_utc(hour: int) -> float:
+    """Seconds from now until the next occurrence of hour:00 UTC"""
+    now = datetime.utcnow()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+DAILY_JOB_RETRY_SECONDS = int(os.environ.get('DAILY_JOB_RETRY_SECONDS', 900))
+DAILY_JOB_HEARTBEAT_SECONDS = 60
+# A run whose heartbeat is older than this belongs to a worker that died
+DAILY_JOB_STALE_SECONDS = 5 * DAILY_JOB_HEARTBEAT_SECONDS
+
+async def claim_daily_run(run_id: str) -> bool:
+    """True in exactly one worker process per job and UTC day, so daily jobs don't
+    run once per worker when the API is served by several processes. A run that
+    failed, or whose worker stopped sending heartbeats, can be claimed again."""
+    now = datetime.utcnow()
+    try:
+        await db.job_runs.find_one_and_update(
+            {"_id": run_id, "$or": [
+                {"status": "failed"},
+                {"status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=DAILY_JOB_STALE_SECONDS)}}
+            ]},
+            {"$set": {"status": "running", "worker": WORKER_ID, "started_at": now, "heartbeat_at": now},
+             "$inc": {"attempts": 1}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # done, or running in another worker
+
+async def run_claimed(run_id: str, job):
+    """Run `await job()` under a claimed run, keeping its heartbeat fresh and recording the outcome"""
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(DAILY_JOB_HEARTBEAT_SECONDS)
+            try:
+                await db.job_runs.update_one({"_id": run_id, "worker": WORKER_ID},
+                                             {"$set": {"heartbeat_at": datetime.utcnow()}})
+            except Exception as e:
+                logger.warning(f"Heartbeat of daily job {run_id} failed: {e}")
+    
+    beating = asyncio.create_task(heartbeat())
+    try:
+        await job()
+    except Exception as e:
+        logger.error(f"Daily job {run_id} failed, will retry: {e}")
+        status = "failed"
+    else:
+        status = "done"
+    finally:
+        beating.cancel()
+    await db.job_runs.update_one({"_id": run_id, "worker": WORKER_ID},
+                                 {"$set": {"status": status, "finished_at": datetime.utcnow()}})
+
+async def run_daily(name: str, hour: int, job):
+    """Run `await job()` once per UTC day from hour:00 UTC on, in one worker.
+    
+    Until that day's run has succeeded, every worker checks back each
+    DAILY_JOB_RETRY_SECONDS, so a run that failed or died is picked up again.
+    """
+    while True:
+        await asyncio.sleep(seconds_until_hour_utc(hour))
+        day = datetime.utcnow().strftime('%Y-%m-%d')
+        run_id = f"{name}:{day}"
+        while datetime.utcnow().strftime('%Y-%m-%d') == day:
+            try:
+                if await claim_daily_run(run_id):
+                    await run_claimed(run_id, job)
+                run = await db.job_runs.find_one({"_id": run_id}, {"status": 1})
+                if run and run.get("status") == "done":
+                    break
+            except Exception as e:
+                logger.error(f"Could not schedule daily job {run_id}: {e}")
+            await asyncio.sleep(DAILY_JOB_RETRY_SECONDS)
+
+async def pregenerate_drafts_job():
+    created = await pregenerate_due_drafts()
+    logger.info(f"Draft pre-generation finished: {created} drafts created")
+
+ORPHAN_SWEEP_ENABLED = os.environ.get('ORPHAN_SWEEP_ENABLED', 'true').lower() == 'true'
+ORPHAN_SWEEP_HOUR_UTC = int(os.environ.get('ORPHAN_SWEEP_HOUR_UTC', 3))
+ORPHAN_SWEEP_BATCH_SIZE = 1000
+
+async def sweep_orphans(collection: str) -> int:
+    """Delete documents whose contact no longer exists. Returns how many were removed."""
+    removed = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        children = await db[collection].find(
+            query, {"contact_id": 1, "user_id": 1}
+        ).sort("_id", 1).to_list(ORPHAN_SWEEP_BATCH_SIZE)
+        if not children:
+            return removed
+        last_id = children[-1]["_id"]
+        
+        contact_ids = {child.get("contact_id") for child in children}
+        object_ids = [ObjectId(cid) for cid in contact_ids if cid and ObjectId.is_valid(cid)]
+        existing = {str(doc["_id"]) async for doc in db.contacts.find({"_id": {"$in": object_ids}}, {"_id": 1})}
+        orphans = {}  # user id -> ids of their orphaned documents
+        for child in children:
+            if child.get("contact_id") and child["contact_id"] not in existing:
+                orphans.setdefault(child.get("user_id"), []).append(child["_id"])
+        for user_id, ids in orphans.items():
+            if collection in SYNC_COLLECTIONS and user_id:
+                # Synced clients and list ETags must learn about these deletions too
+                async with sync_write(user_id) as write:
+                    deleted = await delete_with_tombstones(collection, user_id, {"_id": {"$in": ids}}, write.seq)
+                    if deleted:
+                        write.touch(collection)
+            else:
+                deleted = (await db[collection].delete_many({"_id": {"$in": ids}})).deleted_count
+            removed += deleted
+        await asyncio.sleep(0)  # let request handlers in between batches
+
+async def sweep_all_orphans():
+    """Clean up interactions and drafts left behind by interrupted cascades"""
+    failed = []
+    for collection in ("interactions", "drafts"):
+        try:
+            removed = await sweep_orphans(collection)
+            if removed:
+                logger.info(f"Orphan sweep removed {removed} {collection}")
+        except Exception as e:
+            logger.error(f"Orphan sweep of {collection} failed: {e}")
+            failed.append(collection)
+    if failed:
+        raise RuntimeError(f"Orphan sweep of {', '.join(failed)} failed")
+
+REMINDER_DISPATCH_ENABLED = os.environ.get('REMINDER_DISPATCH_ENABLED', 'true').lower() == 'true'
+REMINDER_LOOKAHEAD_SECONDS = int(os.environ.get('REMINDER_LOOKAHEAD_SECONDS', 600))
+REMINDER_REFILL_SECONDS = int(os.environ.get('REMINDER_REFILL_SECONDS', 30))
+REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 500))
+# Reminders that come due while the dispatcher is down are dropped after this long
+REMINDER_MAX_LATENESS_SECONDS = int(os.environ.get('REMINDER_MAX_LATENESS_SECONDS', 900))
+# A claim older than this belongs to a dispatcher that died mid-send
+REMINDER_CLAIM_TIMEOUT_SECONDS = 600
+REMINDER_REFILL_LIMIT = 20000
+
+def parse_reminder_time(value: str) -> datetime:
+    """ISO reminder time -> naive UTC datetime; times without an offset are taken as UTC"""
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class ReminderDispatcher:
+    """Sends stored reminders when they come due.
+
+    Pending reminders due within REMINDER_LOOKAHEAD_SECONDS are loaded into an
+    in-memory timing wheel by a range scan on (status, reminder_at); the wheel
+    fires them on time without polling the database every second. Delivery is
+    at-most-once: a reminder is claimed pending -> sending before anything is
+    sent and never returns to pending, so concurrent dispatchers (one per
+    worker process) can't both send it, and a crash mid-send drops it instead
+    of sending it twice.
+    """
+
+    def __init__(self, sender: PushSender):
+        self.sender = sender
+        self.wheel = TimingWheel(tick=1.0, start=time.time())
+        self.next_refill = 0.0
+
+    def schedule(self, reminder_id: ObjectId, reminder_at: datetime):
+        """Put a just-created reminder on the wheel so it needn't wait for the next refill"""
+        due = reminder_at.replace(tzinfo=timezone.utc).timestamp()
+        if due - time.time() <= REMINDER_LOOKAHEAD_SECONDS:
+            self.wheel.add(str(reminder_id), due, reminder_id)
+
+    async def refill(self):
+        now = datetime.utcnow()
+        await db.reminders.update_many(
+            {"status": "sending", "claimed_at": {"$lt": now - timedelta(seconds=REMINDER_CLAIM_TIMEOUT_SECONDS)}},
+            {"$set": {"status": "abandoned"}}
+        )
+        horizon = now + timedelta(seconds=REMINDER_LOOKAHEAD_SECONDS)
+        cursor = db.reminders.find(
+            {"status": "pending", "reminder_at": {"$lte": horizon}}, {"reminder_at": 1}
+        ).sort("reminder_at", 1).limit(REMINDER_REFILL_LIMIT)
+        async for reminder in cursor:
+            key = str(reminder["_id"])
+            if key not in self.wheel:
+                self.wheel.add(key, reminder["reminder_at"].replace(tzinfo=timezone.utc).timestamp(), reminder["_id"])
+
+    async def dispatch(self, reminder_ids: List[ObjectId]):
+        now = datetime.utcnow()
+        await db.reminders.update_many(
+            {"_id": {"$in": reminder_ids}, "status": "pending",
+             "reminder_at": {"$lt": now - timedelta(seconds=REMINDER_MAX_LATENESS_SECONDS)}},
+            {"$set": {"status": "expired"}}
+        )
+        # Whatever this claim marks is ours alone; other dispatchers' claims don't match
+        claim_id = ObjectId()
+        await db.reminders.update_many(
+            {"_id": {"$in": reminder_ids}, "status": "pending"},
+            {"$set": {"status": "sending", "claim_id": claim_id, "claimed_at": now}}
+        )
+        reminders = await db.reminders.find({"claim_id": claim_id}).to_list(None)
+        if not reminders:
+            return
+
+        tokens = {}
+        async for token in db.push_tokens.find(
+            {"user_id": {"$in": list({r["user_id"] for r in reminders})}}, {"user_id": 1, "push_token": 1}
+        ):
+            tokens.setdefault(token["user_id"], []).append(token["push_token"])
+
+        messages, owners = [], []
+        for reminder in reminders:
+            for token in tokens.get(reminder["user_id"], []):
+                messages.append({
+                    "to": token,
+                    "title": reminder.get("title"),
+                    "body": reminder.get("body"),
+                    "sound": "default",
+                    "data": {"event_id": reminder.get("event_id"), "reminder_id": str(reminder["_id"])},
+                })
+                owners.append(reminder["_id"])
+        try:
+            tickets = await self.sender.send(messages)
+        except Exception as e:
+            logger.error(f"Push sender failed: {e}")
+            tickets = [{"status": "error"} for _ in messages]
+        delivered = {owner for owner, ticket in zip(owners, tickets) if ticket.get("status") == "ok"}
+
+        sent_at = datetime.utcnow()
+        updates = []
+        for reminder in reminders:
+            if reminder["_id"] in delivered:
+                outcome = "sent"
+            elif reminder["user_id"] in tokens:
+                outcome = "failed"
+            else:
+                outcome = "no_devices"
+            updates.append(UpdateOne(
+                {"_id": reminder["_id"], "claim_id": claim_id},
+                {"$set": {"status": outcome, "sent_at": sent_at}}
+            ))
+        await db.reminders.bulk_write(updates, ordered=False)
+        logger.info(f"Dispatched {len(reminders)} reminders, {len(delivered)} delivered")
+
+    async def run(self):
+        while True:
+            now = time.time()
+            try:
+                if now >= self.next_refill:
+                    self.next_refill = now + REMINDER_REFILL_SECONDS
+                    await self.refill()
+                due = self.wheel.advance(now)
+                # Batches claim disjoint reminders, so a burst (everyone's 08:00 reminder) goes out in parallel
+                await asyncio.gather(*(
+                    self.dispatch(due[start:start + REMINDER_BATCH_SIZE])
+                    for start in range(0, len(due), REMINDER_BATCH_SIZE)
+                ))
+            except Exception as e:
+                logger.error(f"Reminder dispatch failed: {e}")
+            await asyncio.sleep(self.wheel.tick)
+
+async def backfill_reminder_times():
+    """Derive reminder_at for pending reminders stored before it existed"""
+    async for reminder in db.reminders.find(
+        {"status": "pending", "reminder_at": {"$exists": False}}, {"reminder_time": 1}
+    ):
+        try:
+            update = {"reminder_at": parse_reminder_time(reminder["reminder_time"])}
+        except (KeyError, TypeError, ValueError):
+            update = {"status": "invalid"}
+        await db.reminders.update_one({"_id": reminder["_id"]}, {"$set": update})
+
+PUSH_RECEIPT_CHECK_SECONDS = 60
+
+async def prune_push_tokens(tokens: List[str]):
+    """Forget tokens the push provider reports as no longer registered"""
+    result = await db.push_tokens.delete_many({"push_token": {"$in": tokens}})
+    if result.deleted_count:
+        logger.info(f"Pruned {result.deleted_count} unregistered push tokens")
+
+push_sender = create_push_sender(on_invalid_tokens=prune_push_tokens)
+reminder_dispatcher = ReminderDispatcher(push_sender)
+
+async def push_receipt_worker():
+    while True:
+        await asyncio.sleep(PUSH_RECEIPT_CHECK_SECONDS)
+        try:
+            await push_sender.check_receipts()
+        except Exception as e:
+            logger.error(f"Push receipt check failed: {e}")
+
+async def reminder_dispatch_worker():
+    try:
+        await backfill_reminder_times()
+    except Exception as e:
+        logger.error(f"Reminder time backfill failed: {e}")
+    await reminder_dispatcher.run()
+
+# Derived data (group contact counts, last_contact_date from interactions, participant
+# summaries) is maintained by one change-stream consumer across all workers when the
+# deployment supports change streams; otherwise the write handlers update it inline.
+DERIVED_DATA_MODE = os.environ.get('DERIVED_DATA_MODE', 'auto')  # auto | stream | inline
+DERIVED_DATA_LEASE_SECONDS = 30
+DERIVED_DATA_BATCH_SIZE = 500
+DERIVED_DATA_CHECKPOINT = "derived_data"
+
+# Set on startup; read by handlers to decide whether to update derived data themselves
+derived_data_streaming = False
+
+async def change_streams_available() -> bool:
+    hello = await client.admin.command("hello")
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+async def cluster_time_now():
+    """The deployment's current operation time, a start point for a change stream"""
+    reply = await client.admin.command("ping")
+    return reply.get("operationTime")
+
+async def init_derived_data_checkpoint():
+    """Give the consumer a start point if it has never run. Handlers stop updating derived
+    data inline once streaming is on, so the stream must cover writes made from then on
+    even if no consumer has opened it yet."""
+    try:
+        await db.stream_checkpoints.update_one(
+            {"_id": DERIVED_DATA_CHECKPOINT, "resume_token": {"$exists": False}, "start_at": {"$exists": False}},
+            {"$set": {"start_at": await cluster_time_now()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # already has a start point
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Take or renew a lease that at most one worker process holds at a time"""
+    now = datetime.utcnow()
+    try:
+        await db.worker_leases.find_one_and_update(
+            {"_id": name, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # held by another worker
+
+async def count_group_members(user_id: str) -> dict:
+    """group id -> number of the user's contacts in it, in one aggregation"""
+    counts = await db.contacts.aggregate([
+        {"$match": {"user_id": user_id, "groups.0": {"$exists": True}}},
+        {"$unwind": "$groups"},
+        {"$group": {"_id": "$groups", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    return {entry["_id"]: entry["count"] for entry in counts}
+
+async def refresh_group_counts(user_id: str):
+    counts = await count_group_members(user_id)
+    groups = await db.groups.find({"user_id": user_id}, {"contact_count": 1}).to_list(None)
+    stale = [group for group in groups if group.get("contact_count") != counts.get(str(group["_id"]), 0)]
+    if not stale:
+        return
+    async with sync_write(user_id) as write:
+        await db.groups.bulk_write([
+            UpdateOne({"_id": group["_id"]},
+                      {"$set": {"contact_count": counts.get(str(group["_id"]), 0), "sync_seq": write.seq}})
+            for group in stale
+        ], ordered=False)
+        write.touch("groups")
+
+async def apply_last_contacts(dates: dict):
+    """Move each contact's last_contact_date up to an interaction's date and reschedule, given
+    (user_id, contact_id) -> date. Interactions older than the stored date leave the contact alone.
+    One read for all contacts, then one bulk write per user."""
+    ids = [ObjectId(contact_id) for _, contact_id in dates if ObjectId.is_valid(contact_id)]
+    if not ids:
+        return
+    contacts = await db.contacts.find(
+        {"_id": {"$in": ids}}, {"user_id": 1, "last_contact_date": 1, "target_interval_days": 1}
+    ).to_list(None)
+    by_user = {}
+    for contact in contacts:
+        date = dates.get((contact["user_id"], str(contact["_id"])))
+        if date is not None and (contact.get("last_contact_date") or "") <= date:
+            by_user.setdefault(contact["user_id"], []).append((contact, date))
+    now = datetime.utcnow().isoformat()
+    for user_id, updates in by_user.items():
+        async with sync_write(user_id) as write:
+            await db.contacts.bulk_write([
+                # The date guard keeps a newer interaction logged meanwhile from being overwritten
+                UpdateOne({"_id": contact["_id"], "last_contact_date": {"$not": {"$gt": date}}}, {"$set": {
+                    "last_contact_date": date,
+                    "next_due": calculate_next_due_with_random_factor(date, contact.get("target_interval_days", 30)),
+                    "updated_at": now,
+                    "sync_seq": write.seq
+                }})
+                for contact, date in updates
+            ], ordered=False)
+            write.touch("contacts")
+
+async def apply_last_contact(user_id: str, contact_id: str, date: str):
+    await apply_last_contacts({(user_id, contact_id): date})
+
+class LeaseLost(Exception):
+    pass
+
+async def apply_derived_plan(plan: DerivedPlan, keep_lease):
+    """Apply a batch's derived updates, calling keep_lease() between steps so a slow batch
+    renews the lease instead of outliving it"""
+    for user_id in plan.group_count_users:
+        await keep_lease()
+        await refresh_group_counts(user_id)
+    await keep_lease()
+    await apply_last_contacts(plan.last_contact)
+    renamed = {}
+    for contact in plan.summary_contacts.values():
+        renamed.setdefault(contact["user_id"], []).append(contact)
+    for user_id, contacts in renamed.items():
+        await keep_lease()
+        await propagate_contact_summary(user_id, contacts)
+
+async def consume_changes():
+    """Follow the watched collections from the stored checkpoint until the lease is lost"""
+    # Stamping the checkpoint with our id fences off a previous holder whose lease expired
+    # mid-batch: its checkpoint writes below only match while the owner is still us
+    checkpoint = await db.stream_checkpoints.find_one_and_update(
+        {"_id": DERIVED_DATA_CHECKPOINT}, {"$set": {"owner": WORKER_ID}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    saved_token = checkpoint.get("resume_token")
+    start_at = None if saved_token else checkpoint.get("start_at")
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+        "operationType": {"$in": list(WATCHED_OPERATIONS)}
+    }}]
+    renew_at = time.monotonic() + DERIVED_DATA_LEASE_SECONDS / 3
+
+    async def keep_lease():
+        nonlocal renew_at
+        if time.monotonic() < renew_at:
+            return
+        if not await acquire_lease(DERIVED_DATA_CHECKPOINT, DERIVED_DATA_LEASE_SECONDS):
+            raise LeaseLost()
+        renew_at = time.monotonic() + DERIVED_DATA_LEASE_SECONDS / 3
+
+    async with db.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000,
+                        resume_after=saved_token, start_at_operation_time=start_at) as stream:
+        events = []
+        try:
+            while stream.alive:
+                change = await stream.try_next()
+                if change is not None:
+                    events.append(change)
+                    if len(events) < DERIVED_DATA_BATCH_SIZE:
+                        continue
+                if events:
+                    await apply_derived_plan(plan_derived_updates(events), keep_lease)
+                    events = []
+                # Checkpoint only after the batch is applied, so a crash replays rather than skips it
+                token = stream.resume_token
+                if token is not None and token != saved_token:
+                    result = await db.stream_checkpoints.update_one(
+                        {"_id": DERIVED_DATA_CHECKPOINT, "owner": WORKER_ID}, {"$set": {"resume_token": token}}
+                    )
+                    if not result.matched_count:
+                        return  # another worker took over
+                    saved_token = token
+                await keep_lease()
+        except LeaseLost:
+            return
+
+async def reconcile_derived_data():
+    """Recompute group counts and last-contact dates from the source collections,
+    for when change events were lost and the consumer cannot replay them"""
+    for user_id in await db.groups.distinct("user_id"):
+        await acquire_lease(DERIVED_DATA_CHECKPOINT, DERIVED_DATA_LEASE_SECONDS)
+        await refresh_group_counts(user_id)
+    
+    # Same interactions the consumer counts (see change_events.plan_derived_updates);
+    # apply_last_contacts only ever moves a date forward
+    newest = db.interactions.aggregate([
+        {"$match": {"calendar_event_id": None, "contact_id": {"$nin": [None, ""]}, "date": {"$nin": [None, ""]}}},
+        {"$group": {"_id": {"user_id": "$user_id", "contact_id": "$contact_id"}, "date": {"$max": "$date"}}}
+    ], allowDiskUse=True)
+    dates = {}
+    async for entry in newest:
+        dates[(entry["_id"]["user_id"], entry["_id"]["contact_id"])] = entry["date"]
+        if len(dates) >= DERIVED_DATA_BATCH_SIZE:
+            await acquire_lease(DERIVED_DATA_CHECKPOINT, DERIVED_DATA_LEASE_SECONDS)
+            await apply_last_contacts(dates)
+            dates = {}
+    await apply_last_contacts(dates)
+
+async def restart_derived_data():
+    """Start the consumer over from now and reconcile what it missed in between"""
+    # Restart first, so writes made while reconciling are still seen by the stream
+    result = await db.stream_checkpoints.update_one(
+        {"_id": DERIVED_DATA_CHECKPOINT, "owner": WORKER_ID},
+        {"$set": {"start_at": await cluster_time_now()}, "$unset": {"resume_token": ""}}
+    )
+    if not result.matched_count:
+        return  # another worker took over and handles it
+    await reconcile_derived_data()
+    logger.info("Derived data reconciled after the change stream history was lost")
+
+async def derived_data_worker():
+    while True:
+        try:
+            if await acquire_lease(DERIVED_DATA_CHECKPOINT, DERIVED_DATA_LEASE_SECONDS):
+                await consume_changes()
+        except OperationFailure as e:
+            # ChangeStreamFatalError / ChangeStreamHistoryLost: the checkpoint fell off the oplog
+            if e.code in (280, 286):
+                logger.warning("Derived data checkpoint expired, restarting from now and reconciling")
+                try:
+                    await restart_derived_data()
+                except Exception as reconcile_error:
+                    logger.error(f"Derived data reconciliation failed: {reconcile_error}")
+            else:
+                logger.error(f"Derived data consumer failed: {e}")
+        except Exception as e:
+            logger.error(f"Derived data consumer failed: {e}")
+        await asyncio.sleep(DERIVED_DATA_LEASE_SECONDS / 3)
+
+async def start_derived_data():
+    global derived_data_streaming
+    if DERIVED_DATA_MODE == 'inline':
+        return
+    try:
+        available = await change_streams_available()
+    except Exception as e:
+        logger.error(f"Could not check for change stream support: {e}")
+        available = False
+    if not available:
+        logger.info("Change streams unavailable (standalone server); derived data is updated inline")
+        return
+    try:
+        await init_derived_data_checkpoint()
+    except Exception as e:
+        logger.error(f"Could not set the derived data start point, updating it inline: {e}")
+        return
+    derived_data_streaming = True
+    spawn_background_task(derived_data_worker())
+
+async def ensure_indexes():
+    """Create the indexes the hot paths and background workers rely on"""
+    await db.contacts.create_index([("next_due", 1)])
+    # Contact list filters/sorts (contact_filters.py); the stage index also serves pipeline recomputes
+    await db.contacts.create_index([("user_id", 1), ("pipeline_stage", 1), ("next_due", 1)])
+    await db.contacts.create_index([("user_id", 1), ("next_due", 1)])
+    await db.contacts.create_index([("user_id", 1), ("name", 1)])
+    await db.contacts.create_index([("user_id", 1), ("last_contact_date", 1)])
+    await db.contacts.create_index([("user_id", 1), ("groups", 1), ("next_due", 1)])
+    await db.contacts.create_index([("user_id", 1), ("birthday_md", 1)])
+    await db.drafts.create_index([("contact_id", 1), ("status", 1)])
+    # User-scoped cascade deletes
+    await db.interactions.create_index([("user_id", 1), ("contact_id", 1)])
+    await db.interactions.create_index([("user_id", 1), ("calendar_event_id", 1)])
+    await db.calendar_events.create_index([("user_id", 1), ("participant_summaries.id", 1)])
+    await db.drafts.create_index([("user_id", 1), ("contact_id", 1)])
+    await db.pipeline_recompute_jobs.create_index([("user_id", 1), ("status", 1)])
+    await db.pipeline_recompute_jobs.create_index([("status", 1)])
+    for name in SYNC_COLLECTIONS:
+        await db[name].create_index([("user_id", 1), ("sync_seq", 1)])
+    await db.sync_tombstones.create_index([("user_id", 1), ("sync_seq", 1)])
+    await db.sync_tombstones.create_index([("deleted_at", 1)], expireAfterSeconds=SYNC_TOMBSTONE_TTL_DAYS * 86400)
+    await db.job_runs.create_index([("started_at", 1)], expireAfterSeconds=30 * 86400)
+    # Dispatcher refill range scan and stale-claim cleanup
+    await db.reminders.create_index([("status", 1), ("reminder_at", 1)])
+    await db.reminders.create_index([("claim_id", 1)], sparse=True)
+    await db.push_tokens.create_index([("user_id", 1), ("push_token", 1)])
+    await db.push_tokens.create_index([("push_token", 1)])
+    try:
+        # Partial, as profile updates can create user documents without an email
+        email_index = dict(unique=True, partialFilterExpression={"email": {"$type": "string"}})
+        try:
+            await db.users.create_index([("email", 1)], **email_index)
+        except OperationFailure as e:
+            if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict
+                raise
+            # Replace the earlier non-partial index of the same name
+            await db.users.drop_index("email_1")
+            await db.users.create_index([("email", 1)], **email_index)
+    except Exception as e:
+        # Pre-existing duplicate accounts; logins still work, just without the guarantee
+        logger.error(f"Could not create unique users.email index: {e}")
+    try:
+        # Partial so contacts created without a device link never collide
+        await db.contacts.create_index(
+            [("user_id", 1), ("device_contact_id", 1)],
+            unique=True,
+            partialFilterExpression={"device_contact_id": LINKED_DEVICE_CONTACT}
+        )
+    except Exception as e:
+        # Pre-existing duplicates; bulk upsert still works, just without the guarantee
+        logger.error(f"Could not create unique device_contact_id index: {e}")
+    await db.contacts.create_index(
+        [("user_id", 1), ("device_contact_id", 1), ("sync_hash", 1)],
+        partialFilterExpression={"device_contact_id": LINKED_DEVICE_CONTACT}
+    )
+    # Contacts have their own "language" field ("English", "Deutsch", ...), which Mongo
+    # would otherwise read as a per-document stemming language and reject unknown values
+    await db.contacts.create_index(
+        [("user_id", 1), ("name", "text"), ("job", "text"), ("location", "text"),
+         ("notes", "text"), ("hobbies", "text")],
+        name="contacts_search_text",
+        weights={"name": 10, "job": 3, "location": 3, "hobbies": 2, "notes": 1},
+        default_language="none",
+        language_override="text_search_language"
+    )
+
+CONTACT_BACKFILL_BATCH_SIZE = 500
+
+async def backfill_derived_contact_fields() -> int:
+    """Fill sync_hash and birthday_md on contacts written before those fields existed.
+    Returns how many contacts were updated."""
+    missing = {"$or": [{"sync_hash": {"$exists": False}}, {"birthday_md": {"$exists": False}}]}
+    updated = 0
+    last_id = None
+    while True:
+        query = dict(missing)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        contacts = await db.contacts.find(
+            query, {field: 1 for field in SYNC_HASH_FIELDS}
+        ).sort("_id", 1).to_list(CONTACT_BACKFILL_BATCH_SIZE)
+        if not contacts:
+            return updated
+        last_id = contacts[-1]["_id"]
+        await db.contacts.bulk_write([
+            UpdateOne({"_id": contact["_id"], **missing}, {"$set": {
+                "sync_hash": contact_sync_hash(contact),
+                "birthday_md": parse_birthday_md(contact.get("birthday"))
+            }})
+            for contact in contacts
+        ], ordered=False)
+        updated += len(contacts)
+
+async def contact_backfill_worker():
+    try:
+        updated = await backfill_derived_contact_fields()
+        if updated:
+            logger.info(f"Backfilled derived fields on {updated} contacts")
+    except Exception as e:
+        logger.error(f"Contact backfill failed: {e}")
+
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Could not create indexes: {e}")
+
+@app.on_event("startup")
+async def open_http_client():
+    await start_http_client()
+
+@app.on_event("startup")
+async def start_background_workers():
+    if cache_bus.enabled:
+        spawn_background_task(cache_bus.run())
+    await start_derived_data()
+    spawn_background_task(contact_backfill_worker())
+    try:
+        await resume_pipeline_recomputes()
+    except Exception as e:
+        logger.error(f"Could not resume pipeline recompute jobs: {e}")
+    if DRAFT_PREGEN_ENABLED:
+        # Off-peak, once a day
+        spawn_background_task(run_daily("draft_pregeneration", DRAFT_PREGEN_HOUR_UTC, pregenerate_drafts_job))
+    if ORPHAN_SWEEP_ENABLED:
+        spawn_background_task(run_daily("orphan_sweep", ORPHAN_SWEEP_HOUR_UTC, sweep_all_orphans))
+    if REMINDER_DISPATCH_ENABLED:
+        spawn_background_task(reminder_dispatch_worker())
+        spawn_background_task(push_receipt_worker())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        # Let cancelled workers record where they stopped before the client closes
+        await asyncio.wait(tasks, timeout=5)
+    await close_http_client()
     client.close()
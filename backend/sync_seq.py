@@ -0,0 +1,65 @@
+"""Per-user sync sequence numbers that only become readable once written.
+
+Every write to a synced collection takes the next value of the user's
+`sync_seq` counter (in collection_versions) before it writes, and stamps the
+documents it touches with it. Seqs are handed out in order but writes land in
+any order, so a reader must not move its cursor past a seq whose write is still
+in flight: request A takes 5, request B takes 6 and lands first, and a cursor
+at 6 would skip A's documents for good.
+
+Allocation therefore also records the seq in `sync_pending`, and the writer
+pulls it out again when done. The committed seq, the highest one below which
+every write has landed, is the lowest pending seq minus one. Entries whose
+writer died without releasing them stop holding readers back after
+SYNC_PENDING_TIMEOUT_SECONDS and are dropped at the next allocation.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Set
+
+SYNC_PENDING_TIMEOUT_SECONDS = int(os.environ.get('SYNC_PENDING_TIMEOUT_SECONDS', 120))
+
+
+def allocation_pipeline(now: datetime, epoch: str, timeout: int = SYNC_PENDING_TIMEOUT_SECONDS) -> list:
+    """Update pipeline that increments sync_seq and registers the new value as pending"""
+    cutoff = now - timedelta(seconds=timeout)
+    return [
+        {"$set": {
+            "sync_seq": {"$add": [{"$ifNull": ["$sync_seq", 0]}, 1]},
+            "epoch": {"$ifNull": ["$epoch", epoch]},
+        }},
+        {"$set": {"sync_pending": {"$concatArrays": [
+            {"$filter": {"input": {"$ifNull": ["$sync_pending", []]}, "cond": {"$gt": ["$$this.at", cutoff]}}},
+            [{"seq": "$sync_seq", "at": now}],
+        ]}}},
+    ]
+
+
+def release_update(seq: int, collections: Set[str]) -> dict:
+    """Update that marks seq as written and bumps the version of each collection it touched"""
+    update = {"$pull": {"sync_pending": {"seq": seq}}}
+    if collections:
+        update["$inc"] = {name: 1 for name in sorted(collections)}
+    return update
+
+
+def committed_seq(counters: dict, now: datetime, timeout: int = SYNC_PENDING_TIMEOUT_SECONDS) -> int:
+    """Highest seq at or below which every write has landed"""
+    cutoff = now - timedelta(seconds=timeout)
+    committed = counters.get("sync_seq", 0)
+    for entry in counters.get("sync_pending") or []:
+        if entry["at"] > cutoff:
+            committed = min(committed, entry["seq"] - 1)
+    return committed
+
+
+class SyncWrite:
+    """A seq held by one write; collections passed to touch() get their version bumped on release"""
+
+    def __init__(self, user_id: str, seq: int):
+        self.user_id = user_id
+        self.seq = seq
+        self.touched: Set[str] = set()
+
+    def touch(self, *collections: str):
+        self.touched.update(collections)
@@ -0,0 +1,93 @@
+"""Hierarchical timing wheel for in-memory timers.
+
+Scheduling and cancelling are O(1) and firing costs O(due items) per tick, no
+matter how many timers are pending, which is what the reminder dispatcher needs
+with thousands of reminders lined up for the same minute. Timers that are
+further out than the lowest wheel can hold sit in a coarser wheel and cascade
+down as their slot comes up.
+"""
+import math
+from typing import Any, Hashable, List, Sequence
+
+
+class TimingWheel:
+    """Wheels of `slots[0]` ticks, `slots[1]` rounds of the first wheel, and so on.
+
+    The default (1s ticks; 60, 60, 24 slots) keeps timers up to a day ahead.
+    `add` refuses timers beyond that horizon; callers load those later.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: Sequence[int] = (60, 60, 24), start: float = 0.0):
+        self.tick = tick
+        self.slots = list(slots)
+        # Ticks covered by one slot of each level
+        self.units = []
+        unit = 1
+        for size in self.slots:
+            self.units.append(unit)
+            unit *= size
+        self.levels = [[[] for _ in range(size)] for size in self.slots]
+        self.current_tick = int(start // tick)
+        self._entries = {}  # key -> due tick; slot entries not matching this are stale
+
+    @property
+    def horizon(self) -> float:
+        """Latest time (exclusive) that can currently be scheduled"""
+        top = len(self.slots) - 1
+        top_bucket = self.current_tick // self.units[top] + self.slots[top]
+        return top_bucket * self.units[top] * self.tick
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def add(self, key: Hashable, due: float, payload: Any = None) -> bool:
+        """Schedule payload to fire at `due` (seconds, same clock as advance()).
+        Re-adding a key reschedules it. Overdue timers fire on the next advance().
+        Returns False if `due` is beyond the horizon."""
+        # Rounded up so a timer never fires early
+        due_tick = max(math.ceil(due / self.tick), self.current_tick + 1)
+        if not self._place(key, due_tick, payload):
+            return False
+        self._entries[key] = due_tick
+        return True
+
+    def remove(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def advance(self, now: float) -> List[Any]:
+        """Move the wheel up to `now` and return the payloads that came due, in due order"""
+        target = int(now // self.tick)
+        fired = []
+        while self.current_tick < target:
+            self.current_tick += 1
+            tick = self.current_tick
+            # Cascade coarse slots that start at this tick, top level first
+            for level in range(len(self.slots) - 1, 0, -1):
+                if tick % self.units[level] == 0:
+                    slot = self._slot(level, tick)
+                    entries, self.levels[level][slot] = self.levels[level][slot], []
+                    for key, due_tick, payload in entries:
+                        if self._entries.get(key) == due_tick:
+                            self._place(key, due_tick, payload)
+            slot = self._slot(0, tick)
+            entries, self.levels[0][slot] = self.levels[0][slot], []
+            for key, due_tick, payload in entries:
+                if self._entries.get(key) == due_tick:
+                    del self._entries[key]
+                    fired.append(payload)
+        return fired
+
+    def _slot(self, level: int, tick: int) -> int:
+        return (tick // self.units[level]) % self.slots[level]
+
+    def _place(self, key, due_tick: int, payload) -> bool:
+        for level, size in enumerate(self.slots):
+            unit = self.units[level]
+            # Smallest level whose window (relative to the current slot) still reaches due_tick
+            if due_tick // unit - self.current_tick // unit < size:
+                self.levels[level][self._slot(level, due_tick)].append((key, due_tick, payload))
+                return True
+        return False
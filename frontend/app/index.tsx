@@ -150,7 +150,7 @@ interface CalendarEvent {
   start_time: string;
   end_time?: string;
   participants: string[];
-  participant_details?: { id: string; name: string; profile_picture?: string }[];
+  participant_details?: { id: string; name: string; picture_ref?: string | null }[];
   reminder_minutes: number;
   color: string;
   all_day: boolean;
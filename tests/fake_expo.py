@@ -0,0 +1,51 @@
+"""Local stand-in for Expo's push API, mounted with httpx.ASGITransport.
+
+Tokens containing "invalid" are answered with DeviceNotRegistered right away,
+like Expo does for uninstalled apps; tokens containing "uninstalled" get an ok
+ticket and only their receipt reports DeviceNotRegistered.
+"""
+import uuid
+
+from fastapi import FastAPI, Request
+
+SEND_PATH = "/--/api/v2/push/send"
+RECEIPTS_PATH = "/--/api/v2/push/getReceipts"
+
+
+def create_fake_expo(max_batch: int = 100) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = []  # message lists, one per send request
+    app.state.receipts = {}  # ticket id -> receipt
+
+    @app.post(SEND_PATH)
+    async def send(request: Request):
+        messages = await request.json()
+        if isinstance(messages, dict):
+            messages = [messages]
+        if len(messages) > max_batch:
+            return {"errors": [{"code": "PUSH_TOO_MANY_NOTIFICATIONS"}]}
+        app.state.requests.append(messages)
+        tickets = []
+        for message in messages:
+            if "invalid" in message["to"]:
+                tickets.append({
+                    "status": "error",
+                    "message": f"{message['to']} is not a registered push notification recipient",
+                    "details": {"error": "DeviceNotRegistered"},
+                })
+                continue
+            ticket_id = str(uuid.uuid4())
+            if "uninstalled" in message["to"]:
+                app.state.receipts[ticket_id] = {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+            else:
+                app.state.receipts[ticket_id] = {"status": "ok"}
+            tickets.append({"status": "ok", "id": ticket_id})
+        return {"data": tickets}
+
+    @app.post(RECEIPTS_PATH)
+    async def get_receipts(request: Request):
+        ids = (await request.json()).get("ids", [])
+        return {"data": {ticket_id: app.state.receipts[ticket_id]
+                         for ticket_id in ids if ticket_id in app.state.receipts}}
+
+    return app
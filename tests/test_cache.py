@@ -0,0 +1,35 @@
+import time
+
+from cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recent
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_entries_expire():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("ttl", "x", ttl=-1)
+    cache.set("absolute", "y", expires_at=time.time() - 1)
+    cache.set("fresh", "z")
+
+    assert cache.get("ttl") is None
+    assert cache.get("absolute") is None
+    assert cache.get("fresh") == "z"
+    assert len(cache) == 1
+
+
+def test_invalidate():
+    cache = LRUCache()
+    cache.set("k", "v")
+    cache.invalidate("k")
+    cache.invalidate("missing")
+    assert "k" not in cache
@@ -0,0 +1,136 @@
+import asyncio
+
+from bson import ObjectId
+
+from cache import LRUCache
+from cache_bus import CacheInvalidationBus, CacheRegistry
+
+
+def make_bus(worker_id="w1"):
+    registry = CacheRegistry()
+    users = registry.register("users", LRUCache())
+    users.set("u1", {"name": "Anna"})
+    users.set("u2", {"name": "Ben"})
+    return CacheInvalidationBus(db=None, registry=registry, worker_id=worker_id, enabled=False), users
+
+
+def test_messages_from_other_workers_invalidate():
+    bus, users = make_bus()
+    bus.handle({"cache": "users", "key": "u1", "origin": "w2"})
+    assert "u1" not in users
+    assert "u2" in users
+
+
+def test_own_and_unknown_messages_are_ignored():
+    bus, users = make_bus()
+    bus.handle({"cache": "users", "key": "u1", "origin": "w1"})
+    bus.handle({"cache": "groups", "key": "u2", "origin": "w2"})
+    bus.handle({"origin": "w2"})  # feed sentinel
+    assert len(users) == 2
+
+
+def test_clear_all():
+    bus, users = make_bus()
+    bus.registry.clear_all()
+    assert len(users) == 0
+
+
+class FakeCursor:
+    """Tailable cursor over a list that may grow while it is followed"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.position = 0
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.position < len(self.docs):
+            self.position += 1
+            return self.docs[self.position - 1]
+        await asyncio.sleep(0.001)  # awaitData timeout, end of this batch
+        raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, query, sort=None):
+        return self.docs[-1] if self.docs else None
+
+    async def insert_one(self, doc):
+        self.docs.append({"_id": ObjectId(), **doc})
+
+    def find(self, query, cursor_type=None):
+        assert query == {}, "must follow insertion order, not _id order"
+        return FakeCursor(self.docs)
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.collection = FakeCollection(docs)
+
+    def __getitem__(self, name):
+        return self.collection
+
+    async def create_collection(self, name, **options):
+        pass
+
+
+async def wait_until(condition):
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("condition not met")
+
+
+def test_run_follows_insertion_order_from_subscription():
+    docs = [{"_id": ObjectId("ffffffffffffffffffffff01"), "cache": "users", "key": "u1", "origin": "w2"}]
+    registry = CacheRegistry()
+    users = registry.register("users", LRUCache())
+    for key in ("u1", "u2", "u3"):
+        users.set(key, {})
+    bus = CacheInvalidationBus(db=FakeDb(docs), registry=registry, worker_id="w1", enabled=True)
+
+    async def scenario():
+        task = asyncio.create_task(bus.run())
+        await asyncio.sleep(0.01)
+        # Broadcast before subscribing: not replayed
+        assert "u1" in users
+        # Later insert with a smaller _id, as from a host whose clock is behind
+        docs.append({"_id": ObjectId("000000000000000000000001"), "cache": "users", "key": "u2", "origin": "w3"})
+        await wait_until(lambda: "u2" not in users)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    assert "u1" in users and "u3" in users
+
+
+def test_run_subscribes_to_an_empty_collection():
+    docs = []
+    registry = CacheRegistry()
+    users = registry.register("users", LRUCache())
+    users.set("u1", {})
+    bus = CacheInvalidationBus(db=FakeDb(docs), registry=registry, worker_id="w1", enabled=True)
+
+    async def scenario():
+        task = asyncio.create_task(bus.run())
+        # A sentinel is inserted so the capped collection can be tailed
+        await wait_until(lambda: len(docs) == 1)
+        docs.append({"_id": ObjectId(), "cache": "users", "key": "u1", "origin": "w2"})
+        await wait_until(lambda: "u1" not in users)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+from change_events import changed_fields, plan_derived_updates
+
+
+def event(coll, operation, doc, updated=None, removed=None):
+    change = {"ns": {"db": "app", "coll": coll}, "operationType": operation, "fullDocument": doc}
+    if operation == "update":
+        change["updateDescription"] = {"updatedFields": updated or {}, "removedFields": removed or []}
+    return change
+
+
+def test_changed_fields_are_top_level():
+    change = event("contacts", "update", {}, updated={"groups.1": "g2", "name": "A"}, removed=["job"])
+    assert changed_fields(change) == {"groups", "name", "job"}
+
+
+def test_group_counts_coalesced_per_user():
+    plan = plan_derived_updates([
+        event("contacts", "insert", {"_id": 1, "user_id": "u1", "groups": ["g1"]}),
+        event("contacts", "insert", {"_id": 2, "user_id": "u1", "groups": []}),
+        event("contacts", "update", {"_id": 3, "user_id": "u1"}, updated={"groups": []}),
+        event("contacts", "update", {"_id": 4, "user_id": "u2"}, updated={"notes": "x"}),
+        event("sync_tombstones", "insert", {"_id": 5, "user_id": "u3", "collection": "contacts"}),
+        event("groups", "insert", {"_id": 6, "user_id": "u4"}),
+    ])
+    assert plan.group_count_users == {"u1", "u3", "u4"}
+    assert not plan.summary_contacts
+
+
+def test_last_contact_keeps_newest_manual_interaction():
+    plan = plan_derived_updates([
+        event("interactions", "insert", {"_id": 1, "user_id": "u1", "contact_id": "c1", "date": "2024-05-01"}),
+        event("interactions", "insert", {"_id": 2, "user_id": "u1", "contact_id": "c1", "date": "2024-06-01"}),
+        event("interactions", "insert", {"_id": 3, "user_id": "u1", "contact_id": "c1", "date": "2024-04-01"}),
+        event("interactions", "insert", {"_id": 4, "user_id": "u1", "contact_id": "c2", "date": "2030-01-01",
+                                         "calendar_event_id": "e1"}),
+    ])
+    assert plan.last_contact == {("u1", "c1"): "2024-06-01"}
+
+
+def test_renames_propagate_latest_document_once():
+    plan = plan_derived_updates([
+        event("contacts", "update", {"_id": "c1", "user_id": "u1", "name": "Ann"}, updated={"name": "Ann"}),
+        event("contacts", "update", {"_id": "c1", "user_id": "u1", "name": "Anna"}, updated={"name": "Anna"}),
+        event("contacts", "update", None, updated={"name": "Gone"}),
+    ])
+    assert list(plan.summary_contacts) == ["c1"]
+    assert plan.summary_contacts["c1"]["name"] == "Anna"
+    assert not plan_derived_updates([])
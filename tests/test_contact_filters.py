@@ -0,0 +1,61 @@
+from datetime import date
+
+import pytest
+
+from contact_filters import (
+    birthday_window_filter, build_contact_query, parse_birthday_md, parse_contact_sort, summarize_explain
+)
+
+
+@pytest.mark.parametrize("birthday, expected", [
+    ("1990-03-15", 315),
+    ("1990-03-15T00:00:00Z", 315),
+    ("12-24", 1224),
+    ("7/4/1985", 704),
+    ("07/04", 704),
+    ("13/45/2000", None),
+    ("sometime in May", None),
+    (None, None),
+])
+def test_parse_birthday_md(birthday, expected):
+    assert parse_birthday_md(birthday) == expected
+
+
+def test_birthday_window_wraps_new_year():
+    assert birthday_window_filter(date(2024, 6, 1), 7) == {"birthday_md": {"$gte": 601, "$lte": 608}}
+    assert birthday_window_filter(date(2024, 12, 28), 7) == {
+        "$or": [{"birthday_md": {"$gte": 1228}}, {"birthday_md": {"$lte": 104, "$ne": None}}]
+    }
+
+
+def test_build_contact_query():
+    query = build_contact_query("u1", stage="Weekly", group="g1", due_before="2024-06-01")
+    assert query == {
+        "user_id": "u1",
+        "pipeline_stage": "Weekly",
+        "groups": "g1",
+        "next_due": {"$lt": "2024-06-01"},
+    }
+    assert build_contact_query("u1") == {"user_id": "u1"}
+
+
+def test_parse_contact_sort():
+    assert parse_contact_sort("-next_due") == [("next_due", -1), ("_id", -1)]
+    assert parse_contact_sort("name") == [("name", 1), ("_id", 1)]
+    assert parse_contact_sort(None) is None
+    with pytest.raises(ValueError):
+        parse_contact_sort("email")
+
+
+def test_summarize_explain():
+    explain = {
+        "queryPlanner": {"winningPlan": {
+            "stage": "LIMIT",
+            "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1_next_due_1"}},
+        }},
+        "executionStats": {"totalKeysExamined": 5, "totalDocsExamined": 5, "nReturned": 5},
+    }
+    summary = summarize_explain(explain)
+    assert summary["indexes"] == ["user_id_1_next_due_1"]
+    assert summary["collection_scan"] is False
+    assert summary["keys_examined"] == 5
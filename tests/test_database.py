@@ -0,0 +1,42 @@
+import database
+
+
+def test_unavailable_compressors_are_skipped(monkeypatch):
+    monkeypatch.setitem(database.COMPRESSOR_MODULES, "zstd", "module_that_is_not_installed")
+    assert database.available_compressors("zstd, zlib, lz4") == ["zlib"]
+    assert database.available_compressors("") == []
+
+
+def test_client_options_only_include_configured_settings():
+    options = database.client_options("mongodb://db/", {
+        "MONGO_COMPRESSORS": "zlib", "MONGO_MAX_POOL_SIZE": "50", "MONGO_RETRY_WRITES": "false",
+    })
+    assert options == {"compressors": ["zlib"], "maxPoolSize": 50, "retryWrites": False}
+
+
+def test_connection_string_compressors_are_kept():
+    assert "compressors" not in database.client_options("mongodb://db/?retryWrites=false&compressors=snappy", {})
+    assert database.client_options("mongodb://db/?compressors=snappy", {"MONGO_COMPRESSORS": "zlib"}) == {
+        "compressors": ["zlib"]
+    }
+    assert database.client_options("mongodb://db/", {"MONGO_COMPRESSORS": ""}) == {}
+
+
+def test_connection_string_options_are_not_overridden():
+    client = database.create_client("mongodb://localhost:1/?serverSelectionTimeoutMS=100&retryWrites=false")
+    try:
+        assert client.options.server_selection_timeout == 0.1
+        assert client.options.retry_writes is False
+    finally:
+        client.close()
+
+
+def test_analytics_database_reads_from_secondaries():
+    client = database.create_client("mongodb://localhost:1/?serverSelectionTimeoutMS=100")
+    try:
+        analytics = database.analytics_database(client["app"], "secondaryPreferred")
+        assert analytics.name == "app"
+        assert analytics.read_preference.mongos_mode == "secondaryPreferred"
+        assert client["app"].read_preference.mongos_mode == "primary"
+    finally:
+        client.close()
@@ -0,0 +1,20 @@
+from fingerprint import contact_sync_hash, touches_sync_fields
+
+
+def test_hash_ignores_formatting_noise():
+    a = {"name": "Anna  Müller", "phone": "+49 (170) 123-4567", "email": "Anna@Example.com"}
+    b = {"name": " Anna Müller ", "phone": "+491701234567", "email": "anna@example.com", "notes": "app only"}
+    assert contact_sync_hash(a) == contact_sync_hash(b)
+
+
+def test_hash_changes_with_synced_fields():
+    base = {"name": "Anna", "job": "Engineer"}
+    assert contact_sync_hash(base) != contact_sync_hash({**base, "job": "Manager"})
+    assert contact_sync_hash(base) == contact_sync_hash({**base, "job": "Engineer", "location": None})
+    # Moving a value between fields must not collide
+    assert contact_sync_hash({"job": "Berlin"}) != contact_sync_hash({"location": "Berlin"})
+
+
+def test_touches_sync_fields():
+    assert touches_sync_fields({"phone": "1"})
+    assert not touches_sync_fields({"notes": "x", "pipeline_stage": "Weekly"})
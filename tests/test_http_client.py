@@ -0,0 +1,17 @@
+import asyncio
+
+import http_client
+
+
+def test_shared_client_is_reused_and_recreated_after_close():
+    async def run():
+        client = http_client.get_http_client()
+        assert http_client.get_http_client() is client
+        await http_client.close_http_client()
+        assert client.is_closed
+        reopened = http_client.get_http_client()
+        assert reopened is not client
+        await http_client.close_http_client()
+
+    asyncio.run(run())
+
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailableError
+
+
+class FakeChat:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    async def send_message(self, message):
+        return await self.outcome()
+
+
+def make_gateway(outcomes, breaker=None, **kwargs):
+    """Gateway whose successive chats run the given coroutine functions"""
+    gateway = LLMGateway(breaker=breaker or CircuitBreaker(failure_threshold=2, reset_seconds=0),
+                         **kwargs)
+    pending = list(outcomes)
+    gateway._new_chat = lambda session_id, system_message: FakeChat(pending.pop(0))
+    gateway._new_message = lambda prompt, images: prompt
+    gateway._retry_delay = lambda attempt: 0
+    return gateway
+
+
+async def ok():
+    return "hello"
+
+
+async def boom():
+    raise RuntimeError("provider down")
+
+
+async def hang():
+    await asyncio.sleep(10)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+
+    breaker.opened_at -= 60
+    assert breaker.allow() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() is True
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is True
+
+
+def test_retries_then_succeeds():
+    gateway = make_gateway([boom, ok], max_retries=2)
+    assert asyncio.run(gateway.complete("hi", "system")) == "hello"
+    snapshot = gateway.metrics.snapshot()
+    assert snapshot["retries"] == 1
+    assert snapshot["successes"] == 1
+    assert gateway.breaker.consecutive_failures == 0
+
+
+def test_timeouts_are_counted_and_fail_once_per_call():
+    gateway = make_gateway([hang, hang], max_retries=1, timeout=0.01)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(gateway.complete("hi", "system"))
+    snapshot = gateway.metrics.snapshot()
+    assert snapshot["timeouts"] == 2
+    assert snapshot["retries"] == 1
+    assert snapshot["failures"] == 1
+    assert gateway.breaker.consecutive_failures == 1
+
+
+def test_open_circuit_short_circuits():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    gateway = make_gateway([ok], breaker=breaker)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(gateway.complete("hi", "system"))
+    assert gateway.metrics.short_circuited == 1
+
+
+def test_cancelled_probe_releases_the_half_open_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    gateway = make_gateway([hang, ok], breaker=breaker, max_retries=0)
+
+    async def run():
+        probe = asyncio.create_task(gateway.complete("hi", "system"))
+        await asyncio.sleep(0)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await gateway.complete("hi", "system")
+
+    assert asyncio.run(run()) == "hello"
+    assert breaker.state == CircuitBreaker.CLOSED
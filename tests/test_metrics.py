@@ -0,0 +1,87 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from metrics import Histogram, Metrics, MetricsMiddleware, render_llm_metrics
+
+
+def make_app(metrics):
+    app = FastAPI()
+
+    @app.get("/api/contacts/{contact_id}")
+    async def get_contact(contact_id: str):
+        # Stand-in for two Mongo round trips seen by the command listener
+        metrics.observe_db_command("find", 0.002)
+        metrics.observe_db_command("find", 0.003)
+        return {"id": contact_id}
+
+    app.add_middleware(MetricsMiddleware, metrics=metrics, slow_seconds=60)
+    return app
+
+
+def get(app, *paths):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [await client.get(path) for path in paths]
+    return asyncio.run(run())
+
+
+def test_histogram_buckets():
+    histogram = Histogram([1, 5])
+    for value in (0.5, 3, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1]
+    assert histogram.count == 4
+
+
+def test_requests_grouped_by_route_template_with_db_calls():
+    metrics = Metrics()
+    get(make_app(metrics), "/api/contacts/1", "/api/contacts/2", "/missing")
+
+    labels = (("method", "GET"), ("route", "/api/contacts/{contact_id}"))
+    assert metrics.request_latency[labels].count == 2
+    assert metrics.request_db_calls[labels].sum == 4
+    assert metrics.requests_total[labels + (("status", "200"),)] == 2
+    assert metrics.requests_total[(("method", "GET"), ("route", "unmatched"), ("status", "404"))] == 1
+    assert metrics.db_commands == {"find": 4}
+
+    text = metrics.render()
+    assert 'http_request_db_calls_bucket{method="GET",route="/api/contacts/{contact_id}",le="2.0"} 2' in text
+    assert 'mongodb_commands_total{command="find"} 4' in text
+
+
+def test_db_calls_outside_requests_only_count_globally():
+    metrics = Metrics()
+    metrics.observe_db_command("insert", 0.01, failed=True)
+    assert metrics.db_command_failures == {"insert": 1}
+    assert not metrics.request_db_calls
+
+
+def test_render_llm_metrics():
+    snapshot = {
+        "calls": 3, "successes": 2, "failures": 1, "timeouts": 1, "retries": 0, "short_circuited": 0,
+        "prompt_tokens": 100, "completion_tokens": 40, "section_tokens": {"draft.contact": 60},
+        "latency_sum_seconds": 1.5, "latency_buckets": {"0.5": 1, "1": 1, "+Inf": 0},
+    }
+    text = render_llm_metrics(snapshot, "open")
+    assert "llm_calls_total 3" in text
+    assert 'llm_tokens_total{kind="prompt"} 100' in text
+    assert 'llm_latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "llm_latency_seconds_sum 1.5" in text
+    assert "llm_circuit_open 1" in text
+
+
+def test_worker_label_on_every_sample():
+    metrics = Metrics(worker="host:1")
+    metrics.observe_db_command("find", 0.01)
+    assert 'mongodb_commands_total{worker="host:1",command="find"} 1' in metrics.render()
+
+    snapshot = {
+        "calls": 1, "successes": 1, "failures": 0, "timeouts": 0, "retries": 0, "short_circuited": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "section_tokens": {},
+        "latency_sum_seconds": 0.1, "latency_buckets": {"0.5": 1, "+Inf": 0},
+    }
+    text = render_llm_metrics(snapshot, "closed", worker="host:1")
+    assert 'llm_calls_total{worker="host:1"} 1' in text
+    assert 'llm_latency_seconds_bucket{worker="host:1",le="+Inf"} 1' in text
@@ -0,0 +1,56 @@
+from prompt_builder import PromptBuilder, count_tokens, truncate_to_tokens
+
+
+def test_everything_fits_within_budget():
+    builder = PromptBuilder(1000)
+    builder.add("intro", "Write a message.", required=True)
+    builder.add("history", items=["- call", "- lunch"], header="HISTORY:", priority=1)
+    prompt, report = builder.build()
+
+    assert prompt == "Write a message.\nHISTORY:\n- call\n- lunch"
+    assert report["trimmed"] == [] and report["dropped"] == []
+    assert set(report["sections"]) == {"intro", "history"}
+
+
+def test_low_priority_sections_are_trimmed_first():
+    notes = "Long notes about everything. " * 200
+    history = [f"- 2025-01-{day:02d}: Phone Call - talked about the trip" for day in range(1, 30)]
+    builder = PromptBuilder(150)
+    builder.add("intro", "Write a message.", required=True)
+    builder.add("history", items=history, header="HISTORY:", priority=1)
+    builder.add("notes", notes, priority=3)
+    prompt, report = builder.build()
+
+    assert report["total_tokens"] <= 150
+    assert "history" in report["trimmed"]
+    assert "more)" in prompt
+    assert "notes" in report["dropped"]
+
+
+def test_required_sections_are_never_trimmed():
+    required = "Instructions. " * 100
+    builder = PromptBuilder(10)
+    builder.add("instructions", required, required=True)
+    builder.add("extra", "Extra context", priority=1)
+    prompt, report = builder.build()
+
+    assert prompt == required
+    assert report["dropped"] == ["extra"]
+
+
+def test_empty_sections_are_skipped():
+    builder = PromptBuilder(100)
+    builder.add("intro", "Hello", required=True)
+    builder.add("details", items=[], header="DETAILS:")
+    prompt, report = builder.build()
+
+    assert prompt == "Hello"
+    assert "details" not in report["sections"]
+
+
+def test_truncate_to_tokens():
+    text = "word " * 500
+    truncated = truncate_to_tokens(text, 20)
+    assert count_tokens(truncated) <= 21
+    assert truncated.endswith("…")
+    assert truncate_to_tokens("short", 20) == "short"
@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+
+from push import ExpoPushSender
+from tests.fake_expo import RECEIPTS_PATH, SEND_PATH, create_fake_expo
+
+
+def make_sender(app, on_invalid_tokens=None, receipt_delay=900):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://expo.test")
+    return ExpoPushSender(url=f"http://expo.test{SEND_PATH}", receipts_url=f"http://expo.test{RECEIPTS_PATH}",
+                          access_token=None, http_client=client,
+                          on_invalid_tokens=on_invalid_tokens, receipt_delay=receipt_delay)
+
+
+def message(token):
+    return {"to": token, "title": "Meeting", "body": "In 30 minutes"}
+
+
+def test_tickets_match_messages():
+    app = create_fake_expo()
+    sender = make_sender(app)
+    tickets = asyncio.run(sender.send([message("ExponentPushToken[a]"), message("ExponentPushToken[invalid]")]))
+    assert tickets[0]["status"] == "ok"
+    assert tickets[1]["details"]["error"] == "DeviceNotRegistered"
+    assert len(app.state.requests) == 1
+
+
+def test_splits_into_provider_batches_in_order():
+    app = create_fake_expo(max_batch=100)
+    sender = make_sender(app)
+    tokens = [f"ExponentPushToken[{'invalid' if i == 150 else i}]" for i in range(250)]
+    tickets = asyncio.run(sender.send([message(token) for token in tokens]))
+
+    assert sorted(len(batch) for batch in app.state.requests) == [50, 100, 100]
+    assert len(tickets) == len(tokens)
+    # Tickets line up with their messages across batches
+    assert [i for i, ticket in enumerate(tickets) if ticket["status"] != "ok"] == [150]
+
+
+def test_invalid_tokens_pruned_from_tickets_and_receipts():
+    pruned = []
+
+    async def on_invalid_tokens(tokens):
+        pruned.extend(tokens)
+
+    async def run():
+        sender = make_sender(create_fake_expo(), on_invalid_tokens, receipt_delay=0)
+        await sender.send([message("ExponentPushToken[ok]"), message("ExponentPushToken[invalid]"),
+                           message("ExponentPushToken[uninstalled]")])
+        assert pruned == ["ExponentPushToken[invalid]"]
+        assert await sender.check_receipts() == 2
+        assert await sender.check_receipts() == 0
+
+    asyncio.run(run())
+    assert pruned == ["ExponentPushToken[invalid]", "ExponentPushToken[uninstalled]"]
+
+
+def test_receipts_wait_for_delay():
+    sender = make_sender(create_fake_expo(), receipt_delay=900)
+
+    async def run():
+        await sender.send([message("ExponentPushToken[a]")])
+        return await sender.check_receipts()
+
+    assert asyncio.run(run()) == 0
+
+
+def test_transport_failure_fails_every_message():
+    def broken(request):
+        return httpx.Response(503)
+
+    sender = ExpoPushSender(url="http://expo.test/send", access_token=None,
+                            http_client=httpx.AsyncClient(transport=httpx.MockTransport(broken)))
+    tickets = asyncio.run(sender.send([message("ExponentPushToken[a]"), message("ExponentPushToken[b]")]))
+    assert [ticket["status"] for ticket in tickets] == ["error", "error"]
@@ -0,0 +1,50 @@
+from search_index import TrigramIndex, normalize
+
+
+def build(names):
+    index = TrigramIndex(version=1)
+    for i, name in enumerate(names):
+        index.add(str(i), name)
+    return index
+
+
+def test_normalize_strips_case_and_accents():
+    assert normalize("  José  MÜLLER ") == "jose muller"
+    assert normalize(None) == ""
+
+
+def test_prefix_as_you_type():
+    index = build(["Anna Schmidt", "Bernd Anders", "Hannah Berg"])
+    ids = [doc_id for doc_id, _ in index.search("an")]
+    # Both names with a word starting "an" rank above the substring-only match
+    assert set(ids[:2]) == {"0", "1"}
+
+
+def test_typo_tolerant():
+    index = build(["John Miller", "Maria Lopez"])
+    assert index.search("jonh")[0][0] == "0"
+    assert index.search("lopes")[0][0] == "1"
+
+
+def test_exact_match_ranks_first():
+    index = build(["Max Mustermann", "Max", "Maxine Weber"])
+    assert index.search("max")[0][0] == "1"
+
+
+def test_unrelated_query_returns_nothing():
+    index = build(["Anna Schmidt"])
+    assert index.search("zzz") == []
+    assert index.search("   ") == []
+    assert len(index) == 1
+
+
+def test_update_and_remove():
+    index = build(["Anna Schmidt", "Bernd Anders"])
+    index.add("0", "Clara Vogel")
+    assert "0" not in [doc_id for doc_id, _ in index.search("anna")]
+    assert index.search("clara")[0][0] == "0"
+
+    index.remove("1")
+    index.remove("missing")
+    assert index.search("bernd") == []
+    assert len(index) == 1
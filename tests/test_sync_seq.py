@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from sync_seq import SyncWrite, allocation_pipeline, committed_seq, release_update
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def test_committed_without_pending_writes_is_the_counter():
+    assert committed_seq({}, NOW) == 0
+    assert committed_seq({"sync_seq": 7, "sync_pending": []}, NOW) == 7
+
+
+def test_committed_stops_below_oldest_write_in_flight():
+    # 5 was taken first but 6 landed first: readers must not move past 4
+    counters = {"sync_seq": 6, "sync_pending": [{"seq": 5, "at": NOW - timedelta(seconds=2)}]}
+    assert committed_seq(counters, NOW) == 4
+    counters["sync_pending"].append({"seq": 6, "at": NOW})
+    assert committed_seq(counters, NOW) == 4
+
+
+def test_abandoned_pending_seqs_stop_holding_readers_back():
+    counters = {"sync_seq": 9, "sync_pending": [
+        {"seq": 3, "at": NOW - timedelta(seconds=600)},
+        {"seq": 8, "at": NOW - timedelta(seconds=1)},
+    ]}
+    assert committed_seq(counters, NOW, timeout=120) == 7
+
+
+def test_release_pulls_the_seq_and_bumps_touched_versions():
+    write = SyncWrite("u1", 12)
+    assert release_update(write.seq, write.touched) == {"$pull": {"sync_pending": {"seq": 12}}}
+    write.touch("contacts")
+    write.touch("groups", "contacts")
+    assert release_update(write.seq, write.touched) == {
+        "$pull": {"sync_pending": {"seq": 12}},
+        "$inc": {"contacts": 1, "groups": 1},
+    }
+
+
+def test_allocation_drops_stale_pending_entries():
+    pipeline = allocation_pipeline(NOW, "abcd", timeout=60)
+    pending = pipeline[1]["$set"]["sync_pending"]["$concatArrays"]
+    assert pending[0]["$filter"]["cond"] == {"$gt": ["$$this.at", NOW - timedelta(seconds=60)]}
+    assert pending[1] == [{"seq": "$sync_seq", "at": NOW}]
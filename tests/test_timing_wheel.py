@@ -0,0 +1,62 @@
+import math
+import random
+
+from timing_wheel import TimingWheel
+
+
+def test_fires_in_due_order():
+    wheel = TimingWheel(start=1000)
+    wheel.add("b", 1005, "b")
+    wheel.add("a", 1002.5, "a")
+    assert wheel.advance(1001) == []
+    assert wheel.advance(1010) == ["a", "b"]
+    assert len(wheel) == 0
+
+
+def test_overdue_fires_on_next_advance():
+    wheel = TimingWheel(start=1000)
+    wheel.add("late", 900, "late")
+    assert wheel.advance(1001) == ["late"]
+
+
+def test_cascades_from_coarse_levels():
+    wheel = TimingWheel(tick=1, slots=(10, 10, 10), start=0)
+    due = {key: random.Random(key).uniform(1, 999) for key in range(200)}
+    for key, at in due.items():
+        assert wheel.add(key, at, key)
+
+    fired_at = {}
+    for now in range(1, 1001):
+        for key in wheel.advance(now):
+            fired_at[key] = now
+    assert set(fired_at) == set(due)
+    # Each timer fires on the first tick at or after its due time
+    assert all(fired_at[key] == math.ceil(at) for key, at in due.items())
+
+
+def test_large_jump_fires_everything_due():
+    wheel = TimingWheel(tick=1, slots=(10, 10, 10), start=0)
+    for key in range(50):
+        wheel.add(key, key * 15 + 1, key)
+    assert sorted(wheel.advance(400)) == [key for key in range(50) if key * 15 + 1 <= 400]
+
+
+def test_horizon_and_reschedule():
+    wheel = TimingWheel(tick=1, slots=(10, 10), start=0)
+    assert wheel.horizon == 100
+    assert not wheel.add("far", 150, "far")
+    assert "far" not in wheel
+
+    wheel.add("x", 50, "x")
+    wheel.add("x", 5, "x")  # rescheduled earlier; the old entry must not fire again
+    assert wheel.advance(10) == ["x"]
+    assert wheel.advance(60) == []
+
+
+def test_remove():
+    wheel = TimingWheel(start=0)
+    wheel.add("keep", 3, "keep")
+    wheel.add("drop", 3, "drop")
+    wheel.remove("drop")
+    wheel.remove("missing")
+    assert wheel.advance(5) == ["keep"]